@@ -1,3 +1,4 @@
+import weakref
 from abc import ABC
 
 from data_types import DataTypes
@@ -5,11 +6,28 @@ from data_types import DataTypes
 
 class CFGNode(ABC):
     """
-      All CFGs start with a base node, just for code simplification
+      All CFGs start with a base node, just for code simplification.
+      Every node class declares __slots__, as programs have hundreds of thousands of nodes. children and
+      parents are only made when first used. The nodes holding blocks have a slot for their mod/ref
+      summary (see optimizations/analysis/mod_ref.py)
     """
-    def __init__(self):
-        self.children = set()
-        self.parents = set()
+    __slots__ = ('_children', '_parents')
+
+    @property
+    def children(self):
+        try:
+            return self._children
+        except AttributeError:
+            object.__setattr__(self, '_children', set())
+            return self._children
+
+    @property
+    def parents(self):
+        try:
+            return self._parents
+        except AttributeError:
+            object.__setattr__(self, '_parents', set())
+            return self._parents
 
     def addChild(self, child):
         if not child in self.children:
@@ -28,18 +46,20 @@ class TopLevel(CFGNode):
     """
         Node that can appear at the top-level of the program list
     """
-    pass
+    __slots__ = ()
 
 
 class BranchPoint(CFGNode):
-    pass
+    __slots__ = ()
 
 
 class AssignStmt(CFGNode):
-    pass
+    __slots__ = ()
 
 
 class Evaluatable(CFGNode):
+    __slots__ = ('return_type',)
+
     def __init__(self, return_type):
         super().__init__()
 
@@ -48,6 +68,8 @@ class Evaluatable(CFGNode):
 
 
 class FuncCall(Evaluatable):
+    __slots__ = ('func_name', 'args')
+
     def __init__(self, func_name, args, return_type):
         super().__init__(return_type)
 
@@ -66,6 +88,8 @@ class FuncCall(Evaluatable):
 
 
 class FunctionDef(CFGNode):
+    __slots__ = ('func_name', 'return_type', 'arg_list', 'code_block', '_mod_ref')
+
     def __init__(self, func_name, code_block, return_type, arg_list=[]):
         super().__init__()
 
@@ -89,7 +113,7 @@ class FunctionDef(CFGNode):
         print('\t'*(indent+1) + 'func_name: {}'.format(self.func_name))
         print('\t'*(indent+1) + 'arg_list:')
         if len(self.arg_list) > 0:
-            for node in self.code_block:
+            for node in self.arg_list:
                 node.print(indent + 2)
         else:
             print('\t'*(indent+1) + '()')
@@ -99,40 +123,92 @@ class FunctionDef(CFGNode):
         print('\t'*indent + ')')
 
 
-class Constant(Evaluatable):
-    def __init__(self, val):
+class Leaf(Evaluatable):
+    """
+        Constants and Variables are hash-consed: equal ones are a single object, shared by every place in
+        every tree they appear, so they can't be changed once made. Copying one gives the same object
+    """
+    __slots__ = ('__weakref__',)
+
+    def __setattr__(self, name, value):
+        raise Exception("{} is shared, so it can't be changed".format(type(self).__name__))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class Constant(Leaf):
+    __slots__ = ('val',)
+    interned = weakref.WeakValueDictionary()  # value, as a tuple for arrays -> the Constant
+
+    def __new__(cls, val):
         if isinstance(val, list):
-            super().__init__(DataTypes.ARRAY)
-            for item in val:
-                assert (isinstance(item, int) and -127 < item < 128)
+            return_type, key = DataTypes.ARRAY, (DataTypes.ARRAY, tuple(val))
         elif isinstance(val, int):
-            super().__init__(DataTypes.SCALAR)
+            return_type, key = DataTypes.SCALAR, val
         else:
             raise Exception("val must be either of type int or list, val = {}".format(val))
-        self.val = val
+        node = cls.interned.get(key)
+        if node is None:
+            if return_type == DataTypes.ARRAY:
+                for item in val:
+                    assert (isinstance(item, int) and -127 < item < 128)
+                val = list(val)
+            node = super().__new__(cls)
+            object.__setattr__(node, 'return_type', return_type)
+            object.__setattr__(node, 'val', val)
+            cls.interned[key] = node
+        return node
+
+    def __init__(self, val):
+        # Made by __new__, which returns the existing Constant for a value it has seen
+        pass
+
+    def __reduce__(self):
+        return Constant, (self.val,)
 
     def print(self, indent=0):
         print('\t'*indent + 'Constant<{}>({})'.format(self.return_type, self.val))
 
 
-class Variable(Evaluatable):
-    def __init__(self, var_name, return_type, length=''):
-        super().__init__(return_type)
+class Variable(Leaf):
+    __slots__ = ('var_name', 'length')
+    interned = weakref.WeakValueDictionary()  # (var_name, return_type, length) -> the Variable
 
+    def __new__(cls, var_name, return_type, length=''):
+        assert isinstance(return_type, DataTypes)
+        assert isinstance(var_name, str)
         if return_type == DataTypes.ARRAY:
-            assert isinstance(var_name, str)
             assert isinstance(length, int)
-            self.length = length
-        elif return_type == DataTypes.SCALAR:
-            assert isinstance(var_name, str)
-            self.length = None
-        self.var_name = var_name
+        else:
+            length = None
+        key = (var_name, return_type, length)
+        node = cls.interned.get(key)
+        if node is None:
+            node = super().__new__(cls)
+            object.__setattr__(node, 'return_type', return_type)
+            object.__setattr__(node, 'var_name', var_name)
+            object.__setattr__(node, 'length', length)
+            cls.interned[key] = node
+        return node
+
+    def __init__(self, var_name, return_type, length=''):
+        # Made by __new__, which returns the existing Variable for a reference it has seen
+        pass
+
+    def __reduce__(self):
+        return Variable, (self.var_name, self.return_type, '' if self.length is None else self.length)
 
     def print(self, indent=0):
         print('\t'*indent + 'Variable<{}>({})'.format(self.return_type, self.var_name))
 
 
 class ArithmeticExpr(Evaluatable):
+    __slots__ = ('op', 'op1', 'op2')
+
     def __init__(self, op, op1, op2):
         assert op1.return_type == op2.return_type
         super().__init__(op1.return_type)
@@ -151,6 +227,8 @@ class ArithmeticExpr(Evaluatable):
 
 
 class AssignVarStmt(AssignStmt):
+    __slots__ = ('var', 'evaluation')
+
     def __init__(self, var, evaluatable):
         super().__init__()
         assert var.return_type == evaluatable.return_type
@@ -167,6 +245,8 @@ class AssignVarStmt(AssignStmt):
 
 
 class UpdateArrayIndexStmt(CFGNode): #TODO what should this inherit from?
+    __slots__ = ('var', 'idx', 'evaluation')
+
     def __init__(self, var, idx, evaluatable):
         super().__init__()
 
@@ -180,16 +260,36 @@ class UpdateArrayIndexStmt(CFGNode): #TODO what should this inherit from?
     def print(self, indent=0):
         print('\t'*indent + 'UpdateArrayIndexStmt(')
         self.var.print(indent+1)
-        print('\t'*indent + 'index: {}'.format())
+        print('\t'*indent + 'index: {}'.format(self.idx))
+        self.evaluation.print(indent+1)
+        print('\t'*indent + ')')
+
+
+class ReturnStmt(CFGNode):
+    """
+        Ends the function it appears in, making evaluatable the value of the FuncCall
+    """
+    __slots__ = ('evaluation',)
+
+    def __init__(self, evaluatable):
+        super().__init__()
+
+        assert isinstance(evaluatable, Evaluatable)
+        self.evaluation = evaluatable
+
+    def print(self, indent=0):
+        print('\t'*indent + 'ReturnStmt(')
         self.evaluation.print(indent+1)
         print('\t'*indent + ')')
 
 
 class BooleanCondition(CFGNode):
-    pass
+    __slots__ = ()
 
 
 class Comparison(BooleanCondition):
+    __slots__ = ('lhs', 'rhs')
+
     def __init__(self, lhs, rhs):
         super().__init__()
 
@@ -206,14 +306,26 @@ class Comparison(BooleanCondition):
 
 
 class CompareEquals(Comparison):
-    pass
+    __slots__ = ()
 
 
 class CompareGreater(Comparison):
-    pass
+    __slots__ = ()
+
+
+class CompareLess(Comparison):
+    """
+        lhs < rhs. CompareGreater(rhs, lhs) holds as well, but evaluates rhs first
+    """
+    __slots__ = ()
+
+
+COMPARISON_OPS = {CompareEquals: '==', CompareGreater: '>', CompareLess: '<'}
 
 
 class IfElseBlock(CFGNode):
+    __slots__ = ('bool_cond', 'true_block', 'false_block', '_mod_ref')
+
     def __init__(self, bool_cond, true_block, false_block):
         super().__init__()
 
@@ -242,6 +354,8 @@ class IfElseBlock(CFGNode):
 
 
 class WhileBlock(CFGNode):
+    __slots__ = ('bool_cond', 'code_block', '_mod_ref')
+
     def __init__(self, bool_cond, code_block):
         super().__init__()
 
@@ -265,6 +379,8 @@ class InterpreterDebugNode(CFGNode):
     """
         Used to output debug info while interpreting the program
     """
+    __slots__ = ('output',)
+
     def __init__(self, output):
         super().__init__()
         self.output = output
@@ -5,7 +5,9 @@ from data_types import DataTypes
 class CfgGenerator():
     def __init__(self):
         self.symbol_type_table = {}
+        self.array_length_table = {}
         self.function_def_table = {}
+        self.inputs = []
         self.program = []
 
     def verify_var_type(self, var_name, expected_type):
@@ -29,6 +31,8 @@ class CfgGenerator():
             if var not in self.symbol_type_table.keys():
                 raise Exception("Attempting to evaluate an undefined variable '{}'".format(var))
             eval_type = self.symbol_type_table[var]
+            if eval_type == DataTypes.ARRAY:
+                return Variable(var, return_type=eval_type, length=self.array_length_table[var])
             return Variable(var, return_type=eval_type)
 
         raise Exception("Cannot convert to an Evaluatable: {}".format(var))
@@ -48,40 +52,44 @@ class CfgGenerator():
         self.symbol_type_table[var_name] = DataTypes.SCALAR
         return node
 
+    def input_var(self, var_name):
+        """
+            Declares a scalar variable whose value is supplied when the program is run, rather than set
+            by the program (see BytecodeGenerator.input_registers)
+        """
+        self.symbol_type_table[var_name] = DataTypes.SCALAR
+        if var_name not in self.inputs:
+            self.inputs.append(var_name)
+
     def set_array(self, arr_name, length, evaluation=None):
         arr_var = Variable(arr_name, return_type=DataTypes.ARRAY, length=length)
         if evaluation is None:
-            evaluation = []
-            for i in range(length):
-                evaluation._append(0)
-            eval_obj = Constant(evaluation)
+            eval_obj = Constant([0] * length)
         elif isinstance(evaluation, list):
             if not len(evaluation) == length:
                 raise Exception("Array {} of size {} created, but assigned initial value array that \
                                 doesn't match that size".format(arr_name, length))
             eval_obj = Constant(evaluation)
         elif isinstance(evaluation, str):
-            if not evaluation in self.symbol_type_table.keys():
-                raise Exception("Attempting to evaluate an undefined scalar variable '{}'".format(evaluation))
-            eval_type = self.symbol_type_table[evaluation]
-            eval_obj = Variable(evaluation, return_type=eval_type)
+            eval_obj = self.to_evaluatable(evaluation)
+            if eval_obj.return_type == DataTypes.ARRAY and eval_obj.length != length:
+                raise Exception("Array {} of size {} assigned array '{}' of size {}".format(
+                    arr_name, length, evaluation, eval_obj.length))
         else: #Assume evaluation is Evaluatable and let AssignVarStmt deal with the consequences
             eval_obj = evaluation
         node = AssignVarStmt(arr_var, eval_obj)
         self.symbol_type_table[arr_name] = DataTypes.ARRAY
+        self.array_length_table[arr_name] = length
         return node
 
     def update_array_at(self, arr_name, idx, evaluation):
         self.verify_var_type(arr_name, DataTypes.ARRAY)
         self.verify_var_type(evaluation, DataTypes.SCALAR)
 
-        arr_var = Variable(arr_name, return_type=DataTypes.ARRAY)
-        if isinstance(evaluation, list):
-            eval_obj = Constant(evaluation)
-        elif isinstance(evaluation, str):
-            eval_obj = Variable(evaluation)
-        else: #Assume evaluation is Evaluatable and let AssignVarStmt deal with the consequences
-            eval_obj = evaluation
+        arr_var = self.to_evaluatable(arr_name)
+        if not 0 <= idx < arr_var.length:
+            raise Exception("Index {} out of range for array '{}' of size {}".format(idx, arr_name, arr_var.length))
+        eval_obj = self.to_evaluatable(evaluation)
         node = UpdateArrayIndexStmt(arr_var, idx, eval_obj)
         return node
 
@@ -97,15 +105,38 @@ class CfgGenerator():
         node = CompareGreater(lhs_node, rhs_node)
         return node
 
+    def is_less(self, lhs, rhs):
+        lhs_node = self.to_evaluatable(lhs)
+        rhs_node = self.to_evaluatable(rhs)
+        node = CompareLess(lhs_node, rhs_node)
+        return node
+
     def if_else(self, bool_cond, true_block, false_block=None):
         return IfElseBlock(bool_cond, true_block, false_block)
 
     def while_loop(self, bool_cond, code_block):
         return WhileBlock(bool_cond, code_block)
 
+    def param(self, var_name, length=None):
+        """
+            Declares a parameter for define_func, so the function's code can refer to it. Call it in
+            define_func's arg_list, which is evaluated before the code
+        """
+        if length is None:
+            self.symbol_type_table[var_name] = DataTypes.SCALAR
+        else:
+            self.symbol_type_table[var_name] = DataTypes.ARRAY
+            self.array_length_table[var_name] = length
+        return self.to_evaluatable(var_name)
+
     def define_func(self, func_name, arg_list, code, return_type):
+        """
+            Functions only see their parameters and the variables they assign themselves. Arguments are
+            passed by value
+        """
         if func_name not in self.function_def_table.keys():
             self.function_def_table[func_name] = []
+        arg_list = [self.to_evaluatable(arg) for arg in arg_list]
         func_def = FunctionDef(func_name, code, return_type, arg_list)
         self.function_def_table[func_name].append(func_def)
         return func_def
@@ -115,13 +146,24 @@ class CfgGenerator():
         eval_op2 = self.to_evaluatable(op2)
         return ArithmeticExpr(op, eval_op1, eval_op2)
 
-    def call(self, func_name, arg_list=[]):
+    def call(self, func_name, arg_list=[], return_type=None):
+        """
+        :param return_type: needed when func_name isn't defined yet, like a recursive call in the
+                            function's own code
+        """
         eval_args = []
         for arg in arg_list:
             eval_args.append( self.to_evaluatable(arg) )
-        node = FuncCall(func_name, eval_args)
+        if func_name in self.function_def_table.keys():
+            return_type = self.function_def_table[func_name][-1].return_type
+        elif return_type is None:
+            raise Exception("Calling undefined function '{}' without giving its return type".format(func_name))
+        node = FuncCall(func_name, eval_args, return_type)
         return node
 
+    def return_value(self, evaluation):
+        return ReturnStmt(self.to_evaluatable(evaluation))
+
     #def parse_cfg(self, top_level = True):
     #    self.head = CFGNode()
     #    for stmt in self.program:
@@ -0,0 +1,427 @@
+import arrays
+from opcodes import *
+
+ARRAY_OPERATORS = {AADD: '+', ASUB: '-', AMUL: '*'}
+
+
+class Unstructured(Exception):
+    """
+        Raised when control flow doesn't match the if/else and while shapes BytecodeGenerator emits
+    """
+    pass
+
+
+class CompiledProgram:
+    """
+        A LoadedProgram translated to a Python function. Calling run is equivalent to
+        Interpreter.run on the LoadedProgram, including the instruction count: when a max_instructions
+        budget is about to run out the compiled code stops at a loop head and the interpreter finishes
+        the remaining instructions one at a time.
+    """
+    def __init__(self, program, source, function):
+        self.program = program
+        self.source = source
+        self.function = function
+
+    def run(self, interpreter, max_instructions=False):
+        program = self.program
+        if interpreter.program_counter != 0:
+            return interpreter.run(program, max_instructions)
+        if len(interpreter.registers) < program.num_registers:
+            interpreter.registers.extend([0] * (program.num_registers - len(interpreter.registers)))
+
+        # Any path without a backwards jump runs at most len(program) instructions, so checking the
+        # budget at loop heads against this margin never lets the compiled code overshoot it
+        budget = max_instructions - len(program) if max_instructions else float('inf')
+        pc, instrs_run = self.function(interpreter.registers, budget, interpreter.write_output)
+        interpreter.program_counter = pc
+        if pc < len(program):
+            instrs_run = interpreter.run(program, max_instructions, instrs_run)
+        else:
+            interpreter.output.flush()
+        return instrs_run
+
+
+class AotCompiler:
+    """
+        Translates a LoadedProgram into Python source, with registers as local variables. while loops
+        and if/else blocks are recovered from the jumps and emitted as native Python control flow.
+        Programs whose jumps don't have that shape are emitted as a loop over basic blocks instead.
+        Compiled programs are cached by their code, so compiling the same program again is free.
+        DEBUG_PRINT goes to the output of the interpreter running the compiled program.
+    """
+    def __init__(self):
+        self.cache = {}
+
+    def compile(self, program):
+        key = tuple(program.instructions())
+        if key in self.cache:
+            return self.cache[key]
+
+        if any(instr[0] in (CALL, RET) for instr in key):
+            raise Exception("Programs with function calls can't be compiled ahead of time, inline them instead")
+        try:
+            source = StructuredEmitter(program).emit()
+        except Unstructured:
+            source = BlockEmitter(program).emit()
+        namespace = {'_new_array': arrays.new_array, '_check_lengths': arrays.check_lengths,
+                     '_share': arrays.share, '_store_element': arrays.store_element}
+        exec(compile(source, '<aot {} instrs>'.format(len(program)), 'exec'), namespace)
+        compiled = CompiledProgram(program, source, namespace['compiled_program'])
+        self.cache[key] = compiled
+        return compiled
+
+
+class Emitter:
+    def __init__(self, program):
+        self.program = program
+        self.code = program.instructions()
+        self.lines = []
+
+    def line(self, indent, text):
+        self.lines.append('    ' * indent + text)
+
+    def load_registers(self, indent):
+        for reg in range(self.program.num_registers):
+            self.line(indent, 'r{0} = registers[{0}]'.format(reg))
+
+    def store_registers(self, indent):
+        for reg in range(self.program.num_registers):
+            self.line(indent, 'registers[{0}] = r{0}'.format(reg))
+
+    def leave(self, indent, pc):
+        self.store_registers(indent)
+        self.line(indent, 'return {}, n'.format(pc))
+
+    def count(self, indent, instrs):
+        if instrs:
+            self.line(indent, 'n += {}'.format(instrs))
+
+    def count_or_pass(self, indent, instrs):
+        self.count(indent, instrs)
+        if not instrs:
+            self.line(indent, 'pass')
+
+    def emit_straight_line(self, indent, instr):
+        opcode = instr[0]
+        if opcode == SET_CONST:
+            self.line(indent, 'r{} = {!r}'.format(instr[1], instr[2]))
+        elif opcode == SET_REG:
+            self.line(indent, 'r{} = r{}'.format(instr[1], instr[2]))
+        elif opcode == ADD:
+            self.line(indent, 'r{} = r{} + r{}'.format(*instr[1:4]))
+        elif opcode == SUB:
+            self.line(indent, 'r{} = r{} - r{}'.format(*instr[1:4]))
+        elif opcode == MUL:
+            self.line(indent, 'r{} = r{} * r{}'.format(*instr[1:4]))
+        elif opcode == CMP_EQ:
+            self.line(indent, 'r{} = 1 if r{} == r{} else 0'.format(*instr[1:4]))
+        elif opcode == CMP_GT:
+            self.line(indent, 'r{} = 1 if r{} > r{} else 0'.format(*instr[1:4]))
+        elif opcode == ADDI:
+            self.line(indent, 'r{} = r{} + {!r}'.format(*instr[1:4]))
+        elif opcode == MOV2:
+            self.line(indent, 'r{} = r{}'.format(instr[1], instr[2]))
+            self.line(indent, 'r{} = r{}'.format(instr[3], instr[4]))
+        elif opcode == DEBUG_PRINT:
+            self.line(indent, '_print({!r})'.format(instr[1]))
+        elif opcode == ANEW:
+            self.line(indent, 'r{} = _new_array({!r})'.format(instr[1], instr[2]))
+        elif opcode in (AADD, ASUB, AMUL):
+            self.line(indent, '_check_lengths(r{}, r{})'.format(instr[2], instr[3]))
+            self.line(indent, 'r{} = r{} {} r{}'.format(instr[1], instr[2], ARRAY_OPERATORS[opcode], instr[3]))
+        elif opcode == AMOV:
+            self.line(indent, 'r{} = _share(r{})'.format(instr[1], instr[2]))
+        elif opcode == ASTORE:
+            self.line(indent, 'r{0} = _store_element(r{0}, {1!r}, r{2})'.format(*instr[1:4]))
+        else:
+            raise Exception("Not a straight-line instruction: {}".format(OPCODE_NAMES[opcode]))
+
+    def jump_condition(self, instr):
+        """
+        Python expression that is true when the conditional jump instr is taken
+        """
+        opcode = instr[0]
+        if opcode == CHK_JMP:
+            return 'r{}'.format(instr[1])
+        elif opcode == NCHK_JMP:
+            return 'not r{}'.format(instr[1])
+        elif opcode == JMP_GT:
+            return 'r{} > r{}'.format(instr[1], instr[2])
+        elif opcode == JMP_NGT:
+            return 'not r{} > r{}'.format(instr[1], instr[2])
+        elif opcode == JMP_EQ:
+            return 'r{} == r{}'.format(instr[1], instr[2])
+        elif opcode == JMP_NEQ:
+            return 'r{} != r{}'.format(instr[1], instr[2])
+        raise Exception("Not a conditional jump: {}".format(OPCODE_NAMES[opcode]))
+
+    def emit(self):
+        self.line(0, 'def compiled_program(registers, budget, _print):')
+        self.line(1, 'n = 0')
+        self.line(1, 'if n > budget:')
+        self.line(2, 'return 0, n')
+        self.load_registers(1)
+        self.emit_body()
+        return '\n'.join(self.lines) + '\n'
+
+    def emit_body(self):
+        raise NotImplementedError()
+
+
+class StructuredEmitter(Emitter):
+    def __init__(self, program):
+        super().__init__(program)
+        self.jump_targets = set()
+        self.back_edges = {}  # loop head -> position of the last backwards JMP to it
+        for pc, instr in enumerate(self.code):
+            if instr[0] in CONDITIONAL_JUMP_OPCODES:
+                self.jump_targets.add(instr[-1])
+            elif instr[0] == JMP:
+                self.jump_targets.add(instr[1])
+                if instr[1] <= pc:
+                    self.back_edges[instr[1]] = pc
+
+    def emit_body(self):
+        self.count(1, self.emit_region(1, 0, len(self.code), None, 0, {}))
+        self.leave(1, len(self.code))
+
+    def successors(self, pc):
+        """
+        The two ways out of the conditional jump at pc, as (target, instructions executed, condition).
+        An unconditional JMP right after the conditional jump is folded into the fall-through path.
+        """
+        target = self.code[pc][-1]
+        taken = self.jump_condition(self.code[pc])
+        not_taken = 'not ({})'.format(taken)
+        fall_through, fall_through_instrs = pc + 1, 1
+        next_instr = self.code[pc + 1] if pc + 1 < len(self.code) else None
+        if next_instr is not None and next_instr[0] == JMP and pc + 1 not in self.jump_targets:
+            fall_through, fall_through_instrs = next_instr[1], 2
+        return (target, 1, taken), (fall_through, fall_through_instrs, not_taken), pc + fall_through_instrs
+
+    def leaves_loop(self, target, loop):
+        return loop is not None and (target == loop[0] or target == loop[1] or target in loop[2])
+
+    def loop_exit(self, indent, target, instrs, loop):
+        """
+        Emits break/continue if target leaves or restarts the enclosing loop
+        """
+        if not self.leaves_loop(target, loop):
+            return False
+        if target == loop[0]:
+            self.count(indent, instrs)
+            self.line(indent, 'continue')
+        else:
+            # Past the loop exit, control falls through JMPs to target, which count themselves
+            self.count(indent, instrs - loop[2].get(target, 0))
+            self.line(indent, 'break')
+        return True
+
+    def emit_arm(self, indent, lo, hi, loop, instrs, exits, instrs_after=0):
+        """
+        :param instrs: instructions executed on the way into the arm
+        :param instrs_after: instructions executed on the way out, which mustn't be counted before
+                             the arm has run in case a budget check inside it stops execution
+        """
+        start = len(self.lines)
+        pending = self.emit_region(indent, lo, hi, loop, instrs, exits)
+        if pending is not None:
+            self.count(indent, pending + instrs_after)
+        if len(self.lines) == start:
+            self.line(indent, 'pass')
+
+    def emit_region(self, indent, lo, hi, loop, pending, exits):
+        """
+        Emits the instructions in [lo, hi), which control leaves by falling out of the end. loop is the
+        (head, exit, exits past the exit) of the innermost enclosing while loop. Returns the number of
+        executed instructions that haven't been added to n yet, or None if the region ends by leaving
+        or restarting the loop.
+        :param exits: pcs after hi that falling out of the region reaches through JMPs only, mapped to
+                      how many JMPs that takes. Threaded jumps go straight to these, which is the same
+                      as falling out while counting fewer instructions
+        """
+        pc = lo
+        while pc < hi:
+            instr = self.code[pc]
+            opcode = instr[0]
+            if pc in self.back_edges and (loop is None or pc != loop[0]):
+                if self.back_edges[pc] >= hi:
+                    raise Unstructured()
+                self.count(indent, pending)
+                pc = self.emit_loop(indent, pc, self.back_edges[pc], exits if self.back_edges[pc] + 1 == hi else {})
+                pending = 0
+            elif opcode == JMP:
+                target = instr[1]
+                pending += 1
+                if target == pc + 1:
+                    pc += 1
+                    continue
+                if pc == hi - 1 and target in exits:
+                    self.count(indent, pending - exits[target])
+                    return 0
+                if pc != hi - 1 or not self.loop_exit(indent, target, pending, loop):
+                    raise Unstructured()
+                return None
+            elif opcode in CONDITIONAL_JUMP_OPCODES:
+                self.count(indent, pending)
+                pending = 0
+                pc = self.emit_branch(indent, pc, hi, loop, exits)
+            else:
+                self.emit_straight_line(indent, instr)
+                pending += 1
+                pc += 1
+        if pc != hi:
+            raise Unstructured()
+        return pending
+
+    def emit_branch(self, indent, pc, hi, loop, exits):
+        (taken, taken_instrs, taken_cond), (fall, fall_instrs, fall_cond), next_pc = self.successors(pc)
+        if taken == fall:
+            self.count(indent, fall_instrs)
+            return next_pc
+        paths = [(taken, taken_instrs, taken_cond), (fall, fall_instrs, fall_cond)]
+        if any(self.leaves_loop(path[0], loop) for path in paths):
+            # One or both ways out of the branch leave the loop
+            leaving = [path for path in paths if self.leaves_loop(path[0], loop)]
+            stays = [path for path in paths if not self.leaves_loop(path[0], loop)]
+            target, instrs, cond = leaving[0]
+            self.line(indent, 'if {}:'.format(cond))
+            self.loop_exit(indent + 1, target, instrs, loop)
+            if not stays:
+                target, instrs, cond = leaving[1]
+                self.line(indent, 'else:')
+                self.loop_exit(indent + 1, target, instrs, loop)
+                if next_pc != hi:
+                    raise Unstructured()
+                return hi
+            target, instrs, cond = stays[0]
+            if target != next_pc:
+                raise Unstructured()
+            self.count(indent, instrs)
+            return target
+        if any(path[0] in exits for path in paths):
+            # A threaded jump out of the region: the rest of the region becomes the other arm
+            (out, out_instrs, out_cond), (stay, stay_instrs, _) = sorted(paths, key=lambda path: path[0] not in exits)
+            if stay != next_pc and stay not in exits:
+                raise Unstructured()
+            self.line(indent, 'if {}:'.format(out_cond))
+            self.count_or_pass(indent + 1, out_instrs - exits[out])
+            self.line(indent, 'else:')
+            if stay == next_pc:
+                self.emit_arm(indent + 1, next_pc, hi, loop, stay_instrs, exits)
+            else:
+                self.count_or_pass(indent + 1, stay_instrs - exits[stay])
+                if next_pc != hi:
+                    raise Unstructured()
+            return hi
+        if taken <= pc or fall <= pc or taken > hi or fall > hi:
+            raise Unstructured()
+
+        (first, first_instrs, first_cond), (second, second_instrs, second_cond) = sorted(
+            [(taken, taken_instrs, taken_cond), (fall, fall_instrs, fall_cond)])
+        if first != next_pc:
+            raise Unstructured()
+        last = self.code[second - 1]
+        if last[0] == JMP and second < last[1] <= hi:
+            # if/else diamond: the first arm ends by jumping over the second one
+            join = last[1]
+            join_exits = exits if join == hi else {}
+            first_exits = {target: jumps + 1 for target, jumps in join_exits.items()}
+            first_exits[join] = 1
+            self.line(indent, 'if {}:'.format(first_cond))
+            self.emit_arm(indent + 1, first, second - 1, loop, first_instrs, first_exits, 1)
+            self.line(indent, 'else:')
+            self.emit_arm(indent + 1, second, join, loop, second_instrs, join_exits)
+            return join
+        join = self.loop_join(first, second)
+        if join is not None and second < join <= hi:
+            # if/else whose first arm ends with a loop, with the loop's exits threaded to the join
+            join_exits = exits if join == hi else {}
+            first_exits = dict(join_exits)
+            first_exits[join] = 0
+            self.line(indent, 'if {}:'.format(first_cond))
+            self.emit_arm(indent + 1, first, second, loop, first_instrs, first_exits)
+            self.line(indent, 'else:')
+            self.emit_arm(indent + 1, second, join, loop, second_instrs, join_exits)
+            return join
+        if (last[0] == JMP and last[1] in exits) or join in exits:
+            # if/else whose first arm jumps straight out of the region, the second arm falls out of it
+            self.line(indent, 'if {}:'.format(first_cond))
+            self.emit_arm(indent + 1, first, second, loop, first_instrs, exits)
+            self.line(indent, 'else:')
+            self.emit_arm(indent + 1, second, hi, loop, second_instrs, exits)
+            return hi
+        self.line(indent, 'if {}:'.format(first_cond))
+        self.emit_arm(indent + 1, first, second, loop, first_instrs, exits if second == hi else {})
+        self.line(indent, 'else:')
+        self.count(indent + 1, second_instrs)
+        return second
+
+    def loop_join(self, first, second):
+        """
+        Where control goes after the first arm [first, second) of an if/else, if the arm ends with a loop
+        that never falls out into the second arm because every jump out of the loop goes past it to the
+        same pc
+        """
+        last = self.code[second - 1]
+        if last[0] != JMP or not first <= last[1] < second - 1:
+            return None
+        targets = {instr[-1] for instr in self.code[last[1]:second - 1]
+                   if instr[0] == JMP or instr[0] in CONDITIONAL_JUMP_OPCODES}
+        targets = {target for target in targets if not first <= target < second}
+        if len(targets) != 1:
+            return None
+        return targets.pop()
+
+    def emit_loop(self, indent, head, back_edge, exits):
+        """
+        :param exits: the exits of the enclosing region, if the loop ends it
+        """
+        self.line(indent, 'while True:')
+        self.line(indent + 1, 'if n > budget:')
+        self.leave(indent + 2, head)
+        pending = self.emit_region(indent + 1, head, back_edge, (head, back_edge + 1, exits), 0, {})
+        if pending is not None:
+            self.count(indent + 1, pending + 1)
+        return back_edge + 1
+
+
+class BlockEmitter(Emitter):
+    """
+        Fallback for arbitrary jumps: a while loop that dispatches on the start of the current basic block
+    """
+    def emit_body(self):
+        leaders = {0}
+        for pc, instr in enumerate(self.code):
+            if instr[0] in CONDITIONAL_JUMP_OPCODES or instr[0] == JMP:
+                leaders.add(instr[-1])
+                leaders.add(pc + 1)
+        leaders = sorted(leader for leader in leaders if leader < len(self.code))
+        if not leaders:
+            self.leave(1, 0)
+            return
+
+        self.line(1, 'pc = 0')
+        self.line(1, 'while True:')
+        self.line(2, 'if n > budget:')
+        self.leave(3, 'pc')
+        keyword = 'if'
+        for idx, start in enumerate(leaders):
+            end = leaders[idx + 1] if idx + 1 < len(leaders) else len(self.code)
+            self.line(2, '{} pc == {}:'.format(keyword, start))
+            keyword = 'elif'
+            self.count(3, end - start)
+            for pc in range(start, end):
+                instr = self.code[pc]
+                if instr[0] == JMP:
+                    self.line(3, 'pc = {}'.format(instr[1]))
+                elif instr[0] in CONDITIONAL_JUMP_OPCODES:
+                    self.line(3, 'pc = {} if {} else {}'.format(instr[-1], self.jump_condition(instr), pc + 1))
+                else:
+                    self.emit_straight_line(3, instr)
+            last = self.code[end - 1]
+            if last[0] not in CONDITIONAL_JUMP_OPCODES and last[0] != JMP:
+                self.line(3, 'pc = {}'.format(end))
+        self.line(2, 'else:')
+        self.leave(3, 'pc')
@@ -0,0 +1,38 @@
+"""
+    Runtime representation of ARRAY values: NumPy int8 vectors, so whole-array arithmetic is a single
+    vectorised operation and elements wrap around like 8 bit integers.
+
+    Registers can share an array without copying it (AMOV). A shared array is marked read-only, and
+    an indexed store into a read-only array copies it first, so sharing is never visible.
+"""
+import numpy as np
+
+ELEMENT_TYPE = np.int8
+
+
+def new_array(values):
+    return np.array(values, dtype=ELEMENT_TYPE)
+
+
+def wrap_element(value):
+    return (value + 128) % 256 - 128
+
+
+def share(array):
+    array.flags.writeable = False
+    return array
+
+
+def check_lengths(lhs, rhs):
+    if len(lhs) != len(rhs):
+        raise Exception("Array lengths don't match: {} and {}".format(len(lhs), len(rhs)))
+
+
+def store_element(array, idx, value):
+    """
+    :return: the array holding the update, which is a copy if array was shared
+    """
+    if not array.flags.writeable:
+        array = array.copy()
+    array[idx] = wrap_element(value)
+    return array
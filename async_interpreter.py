@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+from interpreter import Interpreter
+from program_loader import LoadedProgram, load_program
+
+PENDING = 'pending'
+RUNNING = 'running'
+FINISHED = 'finished'
+OUT_OF_INSTRUCTIONS = 'out of instructions'
+TIMED_OUT = 'timed out'
+
+
+class ExecutionContext:
+    """
+        Everything one program needs to be paused and resumed: its own Interpreter (program counter and
+        registers), how many instructions it has run, and its instruction budget and timeout.
+    """
+    def __init__(self, bytecode, max_instructions=False, timeout=None, slice_size=1000, name=None, output=None):
+        """
+        :param max_instructions: like Interpreter.interpret, the program stops once it has run more than this
+        :param timeout: seconds of wall time from the first slice, checked between slices
+        :param slice_size: instructions run before yielding to the event loop
+        :param output: OutputSink of the program's interpreter
+        """
+        self.program = bytecode if isinstance(bytecode, LoadedProgram) else load_program(bytecode)
+        self.max_instructions = max_instructions
+        self.timeout = timeout
+        self.slice_size = slice_size
+        self.name = name
+        self.interpreter = Interpreter(output)
+        self.instrs_run = 0
+        self.slices = 0
+        self.status = PENDING
+        self.started = None
+        self.finished = None
+        self.run_time = 0.0  # time spent running this program's instructions, not waiting for a turn
+
+    @property
+    def registers(self):
+        return self.interpreter.registers
+
+    @property
+    def program_counter(self):
+        return self.interpreter.program_counter
+
+    @property
+    def done(self):
+        return self.status not in (PENDING, RUNNING)
+
+    @property
+    def wall_time(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished if self.finished is not None else time.perf_counter()) - self.started
+
+    def step(self):
+        """
+        Runs one slice of the program
+        :return: whether the program can run further
+        """
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+            self.status = RUNNING
+        if self.timeout is not None and now - self.started > self.timeout:
+            return self.finish(TIMED_OUT)
+
+        limit = self.slice_size
+        if self.max_instructions:
+            limit = min(limit, self.max_instructions + 1 - self.instrs_run)
+            if limit <= 0:
+                return self.finish(OUT_OF_INSTRUCTIONS)
+        self.instrs_run += self.interpreter.run_slice(self.program, limit)
+        self.slices += 1
+        self.run_time += time.perf_counter() - now
+        if self.interpreter.program_counter >= len(self.program):
+            return self.finish(FINISHED)
+        return True
+
+    def finish(self, status):
+        self.interpreter.output.flush()
+        self.status = status
+        self.finished = time.perf_counter()
+        return False
+
+    async def run(self):
+        """
+        Runs the program to the end, its budget or its timeout, yielding to the event loop after every slice
+        """
+        while self.step():
+            await asyncio.sleep(0)
+        return self
+
+    def report(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'instructions': self.instrs_run,
+            'slices': self.slices,
+            'run_time': self.run_time,
+            'wall_time': self.wall_time,
+        }
+
+
+class Scheduler:
+    """
+        Interleaves many programs on one event loop. Every program yields after each slice, and asyncio
+        resumes ready tasks in the order they yielded, so the programs take turns round robin.
+    """
+    def __init__(self, slice_size=1000):
+        self.slice_size = slice_size
+        self.contexts = []
+
+    def add(self, bytecode, max_instructions=False, timeout=None, name=None, output=None):
+        context = ExecutionContext(bytecode, max_instructions, timeout, self.slice_size,
+                                   name if name is not None else len(self.contexts), output)
+        self.contexts.append(context)
+        return context
+
+    async def run(self):
+        """
+        Runs every added program that hasn't run yet
+        :return: report of each program, in the order they were added
+        """
+        await asyncio.gather(*[context.run() for context in self.contexts if context.status == PENDING])
+        return self.report()
+
+    def run_until_complete(self):
+        return asyncio.run(self.run())
+
+    def report(self):
+        return [context.report() for context in self.contexts]
@@ -0,0 +1,172 @@
+import numpy as np
+
+from opcodes import *
+from program_loader import LoadedProgram, load_program
+
+# While every value stays below this magnitude, sums and differences of two values can't overflow int64
+INT64_SAFE = 2 ** 62
+
+
+class BatchInterpreter:
+    """
+        Runs one program over many lanes at once, each lane with its own starting registers. Every
+        register is a NumPy vector with one entry per lane.
+
+        Lanes can take different branches, so each lane has its own program counter. Each step runs the
+        instruction at the lowest program counter of any unfinished lane, for the lanes that are at it
+        (the active mask), which makes lanes that split at a branch wait for each other again at the
+        join. Results are the same as interpreting the program once per lane: values are kept as int64
+        until one gets big enough to risk overflowing, then every register switches to Python ints.
+    """
+    def __init__(self):
+        self.registers = []
+        self.program_counters = None
+        self.instrs_run = None
+        self.halted = None
+        self.outputs = []  # (text, mask of the lanes that printed it)
+
+    def run(self, bytecode, num_lanes, initial=None, max_instructions=False):
+        """
+        :param bytecode: tuple bytecode or a LoadedProgram
+        :param initial: register name -> scalar or sequence of num_lanes starting values. Registers
+                        that aren't given start at 0
+        :return: number of instructions run by each lane
+        """
+        program = bytecode if isinstance(bytecode, LoadedProgram) else load_program(bytecode)
+        code = program.instructions()
+        end = len(code)
+
+        self.registers = [np.zeros(num_lanes, dtype=np.int64) for _ in range(program.num_registers)]
+        self.outputs = []
+        register_index = program.register_index
+        for name, values in (initial or {}).items():
+            if name not in register_index:
+                continue  # never read or written by the program
+            values = np.broadcast_to(np.asarray(values, dtype=object), (num_lanes,))
+            if num_lanes and np.abs(values).max() >= INT64_SAFE:
+                self.promote()
+            self.registers[register_index[name]] = values.astype(self.registers[0].dtype)
+
+        pcs = np.zeros(num_lanes, dtype=np.int64)
+        instrs_run = np.zeros(num_lanes, dtype=np.int64)
+        halted = np.zeros(num_lanes, dtype=bool)
+        stopped_at = np.zeros(num_lanes, dtype=np.int64)
+        while num_lanes:
+            pc = int(pcs.min())
+            if pc >= end:
+                break
+            mask = pcs == pc
+            if max_instructions:
+                # A lane stops once it has run more than max_instructions, like Interpreter.run
+                over = mask & (instrs_run > max_instructions)
+                if over.any():
+                    halted |= over
+                    stopped_at[over] = pc
+                    pcs[over] = end + 1
+                    continue
+            full = bool(mask.all())
+            next_pc = self.step(code[pc], pc, mask, full)
+            if isinstance(next_pc, int):
+                pcs[mask] = next_pc
+            else:
+                pcs = np.where(mask, next_pc, pcs)
+            instrs_run[mask] += 1
+
+        # Lanes that hit max_instructions keep the program counter they stopped at
+        self.program_counters = np.where(halted, stopped_at, pcs)
+        self.halted = halted
+        self.instrs_run = instrs_run
+        return instrs_run
+
+    def lane_registers(self, lane):
+        return [int(reg[lane]) for reg in self.registers]
+
+    def lane_output(self, lane):
+        return [text for text, mask in self.outputs if mask[lane]]
+
+    def promote(self):
+        if self.registers and self.registers[0].dtype != object:
+            self.registers = [reg.astype(object) for reg in self.registers]
+
+    def is_int64(self):
+        return not self.registers or self.registers[0].dtype != object
+
+    def write(self, reg, value, mask, full, checked=True):
+        """
+        :param checked: whether value can be big enough to need Python ints. Copies and comparison
+                        results can't be
+        """
+        if checked and self.is_int64() and np.abs(value).max() >= INT64_SAFE:
+            self.promote()
+            value = np.asarray(value).astype(object)
+        if full:
+            self.registers[reg] = np.broadcast_to(value, mask.shape).astype(self.registers[reg].dtype)
+        else:
+            self.registers[reg] = np.where(mask, value, self.registers[reg]).astype(self.registers[reg].dtype)
+
+    def compare(self, reg, value, mask, full):
+        self.write(reg, value.astype(np.int64), mask, full, checked=False)
+
+    def branch(self, taken, target, pc, mask):
+        taken = taken & mask
+        if not taken.any():
+            return pc + 1
+        if (taken == mask).all():
+            return target
+        return np.where(taken, target, pc + 1)
+
+    def step(self, instr, pc, mask, full):
+        """
+        Executes instr for the lanes in mask and returns their next program counter, as an int when
+        they all agree
+        """
+        registers = self.registers
+        opcode = instr[0]
+        if opcode == SET_CONST:
+            if self.is_int64() and abs(instr[2]) >= INT64_SAFE:
+                self.promote()
+            self.write(instr[1], np.asarray(instr[2], dtype=self.registers[0].dtype), mask, full)
+        elif opcode == SET_REG:
+            self.write(instr[1], registers[instr[2]], mask, full, checked=False)
+        elif opcode == ADD:
+            self.write(instr[1], registers[instr[2]] + registers[instr[3]], mask, full)
+        elif opcode == SUB:
+            self.write(instr[1], registers[instr[2]] - registers[instr[3]], mask, full)
+        elif opcode == MUL:
+            if self.is_int64():
+                bound = int(np.abs(registers[instr[2]]).max()) * int(np.abs(registers[instr[3]]).max())
+                if bound >= INT64_SAFE:
+                    self.promote()
+                    registers = self.registers
+            self.write(instr[1], registers[instr[2]] * registers[instr[3]], mask, full)
+        elif opcode == ADDI:
+            if self.is_int64() and abs(instr[3]) >= INT64_SAFE:
+                self.promote()
+                registers = self.registers
+            self.write(instr[1], registers[instr[2]] + instr[3], mask, full)
+        elif opcode == MOV2:
+            self.write(instr[1], registers[instr[2]], mask, full, checked=False)
+            self.write(instr[3], self.registers[instr[4]], mask, full, checked=False)
+        elif opcode == CMP_EQ:
+            self.compare(instr[1], registers[instr[2]] == registers[instr[3]], mask, full)
+        elif opcode == CMP_GT:
+            self.compare(instr[1], registers[instr[2]] > registers[instr[3]], mask, full)
+        elif opcode == CHK_JMP:
+            return self.branch(registers[instr[1]] != 0, instr[2], pc, mask)
+        elif opcode == NCHK_JMP:
+            return self.branch(registers[instr[1]] == 0, instr[2], pc, mask)
+        elif opcode == JMP_GT:
+            return self.branch(registers[instr[1]] > registers[instr[2]], instr[3], pc, mask)
+        elif opcode == JMP_NGT:
+            return self.branch(~(registers[instr[1]] > registers[instr[2]]), instr[3], pc, mask)
+        elif opcode == JMP_EQ:
+            return self.branch(registers[instr[1]] == registers[instr[2]], instr[3], pc, mask)
+        elif opcode == JMP_NEQ:
+            return self.branch(registers[instr[1]] != registers[instr[2]], instr[3], pc, mask)
+        elif opcode == JMP:
+            return instr[1]
+        elif opcode == DEBUG_PRINT:
+            self.outputs.append((instr[1], mask.copy()))
+        else:
+            raise Exception("Can't run {} over lanes".format(OPCODE_NAMES[opcode]))
+        return pc + 1
@@ -0,0 +1,85 @@
+"""
+    Compiles and interprets many programs across a process pool.
+
+    The programs are handed to each worker once, when it starts, and tasks only carry the index of the
+    program to run, so nothing is pickled per task except the results.
+"""
+import multiprocessing
+import os
+
+from bytecode_generator import BytecodeGenerator
+from CfgGenerator import CfgGenerator
+from interpreter import Interpreter
+from output_sinks import MemorySink
+from program_loader import LoadedProgram, load_program
+
+_jobs = None
+_max_instructions = False
+
+
+class BatchResult:
+    def __init__(self, index, instrs_run=0, output=(), variables=None, error=None):
+        self.index = index
+        self.instrs_run = instrs_run
+        self.output = list(output)  # lines printed by DEBUG_PRINT
+        self.variables = variables  # variable name -> value for CFG programs, register name -> value otherwise
+        self.error = error          # message of the exception that stopped the program, if any
+
+    def __repr__(self):
+        return 'BatchResult(index={}, instrs_run={}, error={!r})'.format(self.index, self.instrs_run, self.error)
+
+
+def run_job(index, job, max_instructions=False):
+    """
+    Compiles job if it's a CFG program and runs it, capturing its output
+    :param job: CfgGenerator, list of CFG nodes, tuple bytecode or LoadedProgram
+    """
+    output = MemorySink()
+    try:
+        generator = None
+        if isinstance(job, CfgGenerator):
+            job = job.program
+        if isinstance(job, LoadedProgram):
+            program = job
+        elif job and not isinstance(job[0], tuple):
+            generator = BytecodeGenerator()
+            program = load_program(generator.generate_bytecode(job))
+        else:
+            program = load_program(job)
+
+        interpreter = Interpreter(output)
+        instrs_run = interpreter.run(program, max_instructions)
+        registers = interpreter.named_registers(program)
+        if generator is not None:
+            variables = {var_name: registers[regs[-1]] for var_name, regs in generator.symbol_table.items()
+                         if regs[-1] in registers}
+        else:
+            variables = registers
+        return BatchResult(index, instrs_run, output.lines, variables)
+    except Exception as e:
+        return BatchResult(index, output=output.lines, error='{}: {}'.format(type(e).__name__, e))
+
+
+def _init_worker(jobs, max_instructions):
+    global _jobs, _max_instructions
+    _jobs = jobs
+    _max_instructions = max_instructions
+
+
+def _run_indexed_job(index):
+    return run_job(index, _jobs[index], _max_instructions)
+
+
+def run_batch(jobs, processes=None, max_instructions=False, chunksize=None):
+    """
+    :param jobs: CfgGenerators, lists of CFG nodes, tuple bytecode or LoadedPrograms, in any mix
+    :param processes: worker processes, all cores by default
+    :return: a BatchResult per job, in the order of jobs
+    """
+    jobs = list(jobs)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (processes * 4))
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(jobs, max_instructions)) as pool:
+        return list(pool.imap(_run_indexed_job, range(len(jobs)), chunksize))
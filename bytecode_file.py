@@ -0,0 +1,264 @@
+"""
+    Versioned on-disk format for compiled programs, loaded through mmap without copying.
+
+    Layout, all little-endian:
+        header       HEADER_FORMAT, section offsets are from the start of the file. The field after the
+                     version is the number of functions (since version 3, always 0 before)
+        code         one INSTR_FORMAT record per instruction: opcode, 3 bytes padding, 4 operands.
+                     Registers are register numbers, jump targets are program counters and
+                     immediates and text are indexes into the constant pool. Unused operands are 0
+        constants    a u32 offset per constant, then the constants themselves as a tag byte followed by
+                     CONST_INT: u16 length, signed integer of that many bytes
+                     CONST_STR: u32 length, utf-8 text
+                     CONST_ARRAY: u32 length, one signed byte per element (since version 2)
+                     CONST_REGS: u32 length, u32 register numbers, the arguments of a CALL (since version 3)
+        labels       per label: u32 program counter, u16 length, utf-8 name
+        registers    per register: u16 length, utf-8 name of the register in the tuple bytecode
+        functions    per function: u16 length, utf-8 FUNC label, u32 number of registers, then their names
+                     like the registers section (since version 3)
+"""
+import mmap
+import struct
+
+from opcodes import *
+from program_loader import LoadedProgram, load_program
+
+MAGIC = b'BYTC'
+VERSION = 3
+MIN_VERSION = 1  # versions 2 and 3 only added opcodes, constants and sections, so version 1 files still load
+
+HEADER_FORMAT = '<4sHHIIIIIIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+INSTR_FORMAT = '<B3x4i'
+INSTR_SIZE = struct.calcsize(INSTR_FORMAT)
+
+CONST_INT = b'i'
+CONST_STR = b's'
+CONST_ARRAY = b'a'
+CONST_REGS = b'r'
+
+
+def encode_constant(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str, tuple)):
+        raise Exception("Can't store constant of type {}: {}".format(type(value).__name__, value))
+    if isinstance(value, tuple):
+        return CONST_ARRAY + struct.pack('<I{}b'.format(len(value)), len(value), *value)
+    if isinstance(value, int):
+        length = (value.bit_length() + 8) // 8
+        return CONST_INT + struct.pack('<H', length) + value.to_bytes(length, 'little', signed=True)
+    data = value.encode('utf-8')
+    return CONST_STR + struct.pack('<I', len(data)) + data
+
+
+def encode_registers(registers):
+    return CONST_REGS + struct.pack('<I{}I'.format(len(registers)), len(registers), *registers)
+
+
+def encode_name(name):
+    data = name.encode('utf-8')
+    return struct.pack('<H', len(data)) + data
+
+
+def save_program(program, path):
+    """
+    :param program: LoadedProgram, or tuple bytecode from BytecodeGenerator
+    """
+    if not isinstance(program, LoadedProgram):
+        program = load_program(program)
+
+    constants = []
+    constant_index = {}
+
+    def constant_number(value, kind):
+        # Register tuples and array immediates are both tuples, but are encoded differently
+        key = (kind == ARGS, type(value), value)
+        if key not in constant_index:
+            constant_index[key] = len(constants)
+            constants.append((kind, value))
+        return constant_index[key]
+
+    code = bytearray()
+    for instr in program.instructions():
+        operands = [0, 0, 0, 0]
+        for idx, (kind, operand) in enumerate(zip(LOADED_FORMATS[instr[0]], instr[1:])):
+            if kind in (IMM, TEXT, ARGS):
+                operand = constant_number(operand, kind)
+            operands[idx] = operand
+        code += struct.pack(INSTR_FORMAT, instr[0], *operands)
+
+    encoded = [encode_registers(value) if kind == ARGS else encode_constant(value) for kind, value in constants]
+    constants_section = bytearray()
+    offset = 4 * len(encoded)
+    for data in encoded:
+        constants_section += struct.pack('<I', offset)
+        offset += len(data)
+    for data in encoded:
+        constants_section += data
+
+    labels_section = bytearray()
+    for name, pc in program.labels.items():
+        labels_section += struct.pack('<I', pc) + encode_name(name)
+    registers_section = bytearray()
+    for name in program.register_names:
+        registers_section += encode_name(name)
+    for label, names in program.functions.items():
+        registers_section += encode_name(label) + struct.pack('<I', len(names))
+        for name in names:
+            registers_section += encode_name(name)
+
+    code_offset = HEADER_SIZE
+    constants_offset = code_offset + len(code)
+    labels_offset = constants_offset + len(constants_section)
+    registers_offset = labels_offset + len(labels_section)
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(program.functions), len(program), program.num_registers,
+                         len(constants), len(program.labels),
+                         code_offset, constants_offset, labels_offset, registers_offset)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(code)
+        f.write(constants_section)
+        f.write(labels_section)
+        f.write(registers_section)
+
+
+class MappedProgram(LoadedProgram):
+    """
+        A LoadedProgram backed by a memory-mapped bytecode file. Nothing is decoded up front: the code
+        list starts out filled with DECODE placeholders, and each instruction is decoded the first time
+        the interpreter reaches it. Constants, labels and register names are decoded on first use.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        (magic, version, num_functions, num_instrs, num_registers, num_constants, num_labels,
+         self.code_offset, self.constants_offset, self.labels_offset, self.registers_offset) = \
+            struct.unpack_from(HEADER_FORMAT, self.view, 0)
+        if magic != MAGIC:
+            self.close()
+            raise Exception("Not a bytecode file: {}".format(path))
+        if not MIN_VERSION <= version <= VERSION:
+            self.close()
+            raise Exception("Unsupported bytecode file version {} in {}, expected {} to {}".format(
+                version, path, MIN_VERSION, VERSION))
+
+        self._num_registers = num_registers
+        self.num_labels = num_labels
+        self.num_functions = num_functions
+        self.constants = [None] * num_constants
+        self.constants_decoded = [False] * num_constants
+        self._labels = None
+        self._register_names = None
+        self._functions = None
+        self.code = [(DECODE, self)] * num_instrs
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+            self.map.close()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def num_registers(self):
+        return self._num_registers
+
+    def constant(self, idx):
+        if not self.constants_decoded[idx]:
+            base = self.constants_offset
+            offset = base + struct.unpack_from('<I', self.view, base + 4 * idx)[0]
+            tag = self.view[offset:offset + 1].tobytes()
+            if tag == CONST_INT:
+                length = struct.unpack_from('<H', self.view, offset + 1)[0]
+                start = offset + 3
+                value = int.from_bytes(self.view[start:start + length], 'little', signed=True)
+            elif tag == CONST_STR:
+                length = struct.unpack_from('<I', self.view, offset + 1)[0]
+                start = offset + 5
+                value = str(self.view[start:start + length], 'utf-8')
+            elif tag == CONST_ARRAY:
+                length = struct.unpack_from('<I', self.view, offset + 1)[0]
+                start = offset + 5
+                value = tuple(self.view[start:start + length].cast('b'))
+            elif tag == CONST_REGS:
+                length = struct.unpack_from('<I', self.view, offset + 1)[0]
+                value = struct.unpack_from('<{}I'.format(length), self.view, offset + 5)
+            else:
+                raise Exception("Corrupt constant pool entry {}".format(idx))
+            self.constants[idx] = value
+            self.constants_decoded[idx] = True
+        return self.constants[idx]
+
+    def decode_instruction(self, pc):
+        opcode, *operands = struct.unpack_from(INSTR_FORMAT, self.view, self.code_offset + pc * INSTR_SIZE)
+        kinds = LOADED_FORMATS[opcode]
+        instr = [opcode]
+        for kind, operand in zip(kinds, operands):
+            if kind in (IMM, TEXT, ARGS):
+                operand = self.constant(operand)
+            instr.append(operand)
+        instr = tuple(instr)
+        self.code[pc] = instr
+        return instr
+
+    def instructions(self):
+        for pc, instr in enumerate(self.code):
+            if instr[0] == DECODE:
+                self.decode_instruction(pc)
+        return self.code
+
+    def read_name(self, offset):
+        length = struct.unpack_from('<H', self.view, offset)[0]
+        return str(self.view[offset + 2:offset + 2 + length], 'utf-8'), offset + 2 + length
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            labels = {}
+            offset = self.labels_offset
+            for _ in range(self.num_labels):
+                pc = struct.unpack_from('<I', self.view, offset)[0]
+                name, offset = self.read_name(offset + 4)
+                labels[name] = pc
+            self._labels = labels
+        return self._labels
+
+    def read_names(self, offset, count):
+        names = []
+        for _ in range(count):
+            name, offset = self.read_name(offset)
+            names.append(name)
+        return names, offset
+
+    @property
+    def register_names(self):
+        if self._register_names is None:
+            self._register_names, _ = self.read_names(self.registers_offset, self._num_registers)
+        return self._register_names
+
+    @property
+    def functions(self):
+        if self._functions is None:
+            functions = {}
+            _, offset = self.read_names(self.registers_offset, self._num_registers)
+            for _ in range(self.num_functions):
+                label, offset = self.read_name(offset)
+                count = struct.unpack_from('<I', self.view, offset)[0]
+                functions[label], offset = self.read_names(offset + 4, count)
+            self._functions = functions
+        return self._functions
+
+    @property
+    def register_index(self):
+        return {name: idx for idx, name in enumerate(self.register_names)}
+
+
+def open_program(path):
+    return MappedProgram(path)
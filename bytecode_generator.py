@@ -1,12 +1,91 @@
 from CFG import *
 
 from data_types import DataTypes
+from optimizations.analysis.control_flow import ControlFlowGraph
+from optimizations.analysis.value_numbering import ValueNumbering
+from optimizations.bytecode.register_allocation import LinearScanRegisterAllocator
+
+INLINE_LIMIT = 40  # functions with up to this many CFG nodes are inlined, unless they can call themselves
+
+
+def subtree_nodes(nodes):
+    """
+    Every CFG node in nodes and below them, expressions included. The code of a FunctionDef isn't below it
+    """
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, (AssignStmt, UpdateArrayIndexStmt, ReturnStmt)):
+            stack.append(node.evaluation)
+        elif isinstance(node, ArithmeticExpr):
+            stack += [node.op1, node.op2]
+        elif isinstance(node, FuncCall):
+            stack += node.args
+        elif isinstance(node, Comparison):
+            stack += [node.lhs, node.rhs]
+        elif isinstance(node, IfElseBlock):
+            stack.append(node.bool_cond)
+            stack += node.true_block + node.false_block
+        elif isinstance(node, WhileBlock):
+            stack.append(node.bool_cond)
+            stack += node.code_block
+
+
+class ForwardLabel:
+    """
+        A label jumped to before it's placed. The jumps are emitted with the ForwardLabel in place of the
+        label name and patched when it's placed, so labels are numbered in the order they appear in the code
+        and one nothing jumps to is never placed
+    """
+    __slots__ = ('name', 'fixups')
 
-class BytecodeGenerator:
     def __init__(self):
+        self.name = None
+        self.fixups = []  # (code, index) of each jump to the label emitted so far
+
+
+class BytecodeGenerator:
+    """
+        Lowers a statement tree to tuple bytecode in one pass. Every lower method appends its instructions
+        to self.code, the buffer being emitted into, and those for expressions return the register holding
+        the value, so no instruction is copied as nested blocks are lowered
+    """
+    def __init__(self, inline_limit=INLINE_LIMIT, common_subexpressions=False, source_map=False):
+        """
+        :param inline_limit: size up to which functions are inlined, see INLINE_LIMIT. 0 calls every function
+        :param common_subexpressions: reuse the register of an earlier, equal scalar ArithmeticExpr instead of
+                                      computing it again, see ValueNumbering
+        :param source_map: record the CFG nodes each instruction was generated for, see source_path. Only
+                           the Profiler needs them, so they aren't kept by default
+        """
         self.symbol_table = {}
         self.reg_id = 0 # constantly increasing, uniquely identify each
         self.label_id = 0
+        # id(instr) -> (instr, node_path when it was emitted), see source_path, or None if not recorded. The
+        # instruction is kept so that its id can't be reused
+        self.source_map = {} if source_map else None
+        # The CFG node being lowered and the path of the nodes above it, as (node, path), or None. Paths share
+        # their tails, so mapping every instruction to one takes no more memory however deep the nesting
+        self.node_path = None
+        self.code = []
+
+        self.inline_limit = inline_limit
+        self.function_table = {}     # function name -> FunctionDefs lowered so far, calls go to the last one
+        self.function_info = {}      # id(FunctionDef) -> (inlined?, names of parameters it assigns)
+        self.function_labels = {}    # id(FunctionDef) -> label of its FUNC section
+        self.function_sections = []  # FUNC sections still to be placed after the main program
+        # Per function being lowered: (FunctionDef, register and label the result goes to when inlined,
+        # or None, None in a FUNC section)
+        self.return_targets = []
+        self.inlined_calls = 0
+        self.emitted_calls = 0
+
+        self.common_subexpressions = common_subexpressions
+        self.value_numbers = None
+        self.value_registers = {}     # id(ArithmeticExpr) -> register holding its result, for reuse targets
+        self.shared_registers = set() # those registers, which must never be bound to a variable
+        self.reused_values = 0
 
     def get_next_register(self):
         reg_id = self.reg_id
@@ -18,27 +97,137 @@ class BytecodeGenerator:
         self.label_id += 1
         return 'LABEL_' + str(label_id)
 
-    def generate_bytecode(self, program):
-        bytecode = []
-        for node in program:
-            if isinstance(node, AssignStmt):
-                bytecode += self.lowerAssignment(node)
-            elif isinstance(node, ArithmeticExpr):
-                bytecode += self.lowerArithmeticExpr(node)
-            elif isinstance(node, FunctionDef):
-                bytecode += self.lowerFunctionDef(node)
-            elif isinstance(node, IfElseBlock):
-                bytecode += self.lowerIfElseBlock(node)
-            elif isinstance(node, WhileBlock):
-                bytecode += self.lowerWhileBlock(node)
-            elif isinstance(node, InterpreterDebugNode):
-                bytecode += [('DEBUG_PRINT', node.output)]
-            elif isinstance(node, Evaluatable):
-                raise Exception("Evaluatable found at top outer-most level of CFG: {}".format(node))
+    def variable_registers(self):
+        var_regs = set()
+        for regs in self.symbol_table.values():
+            var_regs.update(regs)
+        return var_regs
+
+    def input_registers(self, var_names):
+        """
+        Gives each input variable (see CfgGenerator.input_var) a register before lowering, so the
+        program reads whatever value that register holds when it starts
+        :return: variable name -> register name
+        """
+        for var_name in var_names:
+            if var_name not in self.symbol_table:
+                self.symbol_table[var_name] = [self.get_next_register()]
+        return {var_name: self.symbol_table[var_name][-1] for var_name in var_names}
+
+    def allocate_registers(self, bytecode):
+        """
+        Maps the virtual registers of bytecode onto as few physical registers as liveness allows, and
+        updates symbol_table to match. Registers holding variables are kept live until the end of the
+        program, so that their final values can still be read after interpretation
+        """
+        allocator = LinearScanRegisterAllocator()
+        allocated = allocator.run_pass(bytecode, live_at_exit=self.variable_registers())
+        # Renaming keeps instructions in place, so the source map carries over
+        if self.source_map is not None:
+            for instr, renamed in zip(bytecode, allocated):
+                if id(instr) in self.source_map:
+                    self.source_map[id(renamed)] = (renamed, self.source_map[id(instr)][1])
+        bytecode = allocated
+        for var_name, regs in self.symbol_table.items():
+            self.symbol_table[var_name] = [allocator.assignment.get(reg, reg) for reg in regs]
+        return bytecode
+
+    def source_path(self, instr):
+        """
+        CFG nodes from the top level down to the node instr was generated for, or () if unknown or the
+        source map isn't recorded
+        """
+        if self.source_map is None:
+            return ()
+        entry = self.source_map.get(id(instr))
+        if entry is None or entry[0] is not instr:
+            return ()
+        path, node_path = [], entry[1]
+        while node_path is not None:
+            path.append(node_path[0])
+            node_path = node_path[1]
+        return tuple(reversed(path))
+
+    def emit(self, instr):
+        self.code.append(instr)
+        if self.source_map is not None:
+            self.source_map[id(instr)] = (instr, self.node_path)
+
+    def jump(self, label, opcode, *operands):
+        """
+        Emits a jump to label, a label name or a ForwardLabel, which is the jump's last operand
+        """
+        if isinstance(label, ForwardLabel):
+            if label.name is None:
+                label.fixups.append((self.code, len(self.code)))
             else:
-                raise Exception("Invalid node found at top outer-most level of CFG: {}".format(node))
+                label = label.name
+        self.emit((opcode,) + operands + (label,))
+
+    def place(self, label):
+        """
+        Emits the LABEL for a ForwardLabel, naming it, and patches the jumps to it emitted so far
+        """
+        label.name = self.get_next_label()
+        for code, idx in label.fixups:
+            instr = code[idx][:-1] + (label.name,)
+            if self.source_map is not None:
+                self.source_map[id(instr)] = (instr, self.source_map.pop(id(code[idx]))[1])
+            code[idx] = instr
+        label.fixups = []
+        self.emit(('LABEL', label.name))
+
+    def enter(self, node):
+        self.node_path = (node, self.node_path)
+
+    def leave(self):
+        self.node_path = self.node_path[1]
+
+    def generate_bytecode(self, program):
+        """
+        :return: the bytecode of program, followed by the FUNC sections of the functions it calls
+        """
+        self.function_labels = {}
+        if self.common_subexpressions:
+            self.value_numbers = ValueNumbering(ControlFlowGraph(program))
+        self.code = []
+        self.lowerBlock(program)
+        bytecode = self.code
+        if self.function_sections:
+            bytecode.append(('HALT',))
+            for section in self.function_sections:
+                bytecode += section
+            self.function_sections = []
         return bytecode
 
+    def lowerBlock(self, code_block):
+        for node in code_block:
+            self.enter(node)
+            self.lowerStatement(node)
+            self.leave()
+
+    def lowerStatement(self, node):
+        if isinstance(node, AssignStmt):
+            self.lowerAssignment(node)
+        elif isinstance(node, UpdateArrayIndexStmt):
+            self.lowerUpdateArrayIndex(node)
+        elif isinstance(node, ArithmeticExpr):
+            self.lowerArithmeticExpr(node)
+        elif isinstance(node, FunctionDef):
+            self.lowerFunctionDef(node)
+        elif isinstance(node, ReturnStmt):
+            self.lowerReturn(node)
+        elif isinstance(node, IfElseBlock):
+            self.lowerIfElseBlock(node)
+        elif isinstance(node, WhileBlock):
+            self.lowerWhileBlock(node)
+        elif isinstance(node, InterpreterDebugNode):
+            self.emit(('DEBUG_PRINT', node.output))
+        elif isinstance(node, Evaluatable):
+            raise Exception("Evaluatable found at top outer-most level of CFG: {}".format(node))
+        else:
+            raise Exception("Invalid node found at top outer-most level of CFG: {}".format(node))
+
     def lowerArithmeticExpr(self, node):
         if node.return_type == DataTypes.SCALAR:
             return self.lowerArithmeticExprScalar(node)
@@ -46,41 +235,85 @@ class BytecodeGenerator:
             return self.lowerArithmeticExprArray(node)
 
     def lowerArithmeticExprScalar(self, node):
-        instrs_op1, value_at_op1= self.lowerEvaluatable(node.op1)
-        instrs_op2, value_at_op2 = self.lowerEvaluatable(node.op2)
-        instrs = instrs_op1 + instrs_op2
+        value_numbers = self.value_numbers
+        if value_numbers is not None and id(node) in value_numbers.reuse:
+            earlier = value_numbers.reuse[id(node)]
+            if id(earlier) in self.value_registers:
+                self.reused_values += 1
+                return self.value_registers[id(earlier)]
+        value_at_op1 = self.lowerEvaluatable(node.op1)
+        value_at_op2 = self.lowerEvaluatable(node.op2)
 
         op = node.op
         value_at_result = self.get_next_register()
         if op == '+':
-            instrs.append(('ADD', value_at_result, value_at_op1, value_at_op2))
+            self.emit(('ADD', value_at_result, value_at_op1, value_at_op2))
         elif op == '-':
-            instrs.append(('SUB', value_at_result, value_at_op1, value_at_op2))
+            self.emit(('SUB', value_at_result, value_at_op1, value_at_op2))
         elif op == '*':
-            instrs.append(('MUL', value_at_result, value_at_op1, value_at_op2))
+            self.emit(('MUL', value_at_result, value_at_op1, value_at_op2))
         else:
             raise Exception("This shouldn't of happened. ArithmeticExpression operator is {}".format(op))
-        return instrs, value_at_result
+        if value_numbers is not None and id(node) in value_numbers.targets:
+            self.value_registers[id(node)] = value_at_result
+            self.shared_registers.add(value_at_result)
+        return value_at_result
 
 
     def lowerArithmeticExprArray(self, node):
-        raise NotImplementedError()
+        """
+        Element-wise arithmetic on two arrays of the same length is a single instruction
+        """
+        value_at_op1 = self.lowerEvaluatable(node.op1)
+        value_at_op2 = self.lowerEvaluatable(node.op2)
+
+        op = node.op
+        value_at_result = self.get_next_register()
+        if op == '+':
+            self.emit(('AADD', value_at_result, value_at_op1, value_at_op2))
+        elif op == '-':
+            self.emit(('ASUB', value_at_result, value_at_op1, value_at_op2))
+        elif op == '*':
+            self.emit(('AMUL', value_at_result, value_at_op1, value_at_op2))
+        else:
+            raise Exception("This shouldn't of happened. ArithmeticExpression operator is {}".format(op))
+        return value_at_result
 
     def lowerAssignment(self, node):
-        instrs, value_at = self.lowerEvaluatable(node.evaluation)
+        value_at = self.lowerEvaluatable(node.evaluation)
+        # Arrays are moved by sharing them, see arrays.py
+        move = 'AMOV' if node.var.return_type == DataTypes.ARRAY else 'SET'
         if not node.var.var_name in self.symbol_table:
+            if isinstance(node.evaluation, Variable) or value_at in self.shared_registers:
+                # Don't share the other variable's register, or assigning to one would change both.
+                # Likewise for a result that later expressions reuse
+                var_reg = self.get_next_register()
+                self.emit((move, var_reg, value_at))
+                value_at = var_reg
             self.symbol_table[node.var.var_name] = [value_at]
         else:
             var_reg = self.symbol_table[node.var.var_name][-1]
-            instrs += [('SET', var_reg, value_at)]
-        return instrs
+            self.emit((move, var_reg, value_at))
+
+    def lowerUpdateArrayIndex(self, node):
+        try:
+            arr_reg = self.symbol_table[node.var.var_name][-1]
+        except KeyError:
+            raise Exception("Cannot resolve symbol: {}".format(node.var.var_name))
+        value_at = self.lowerEvaluatable(node.evaluation)
+        self.emit(('ASTORE', arr_reg, node.idx, value_at))
 
     def lowerEvaluatable(self, node):
-        instrs = []
+        """
+        :return: the register holding node's value once the instructions emitted have run
+        """
         value_at = None
         if isinstance(node, Constant):
             reg_id = self.get_next_register()
-            instrs = [('SET', reg_id, node.val)]
+            if node.return_type == DataTypes.ARRAY:
+                self.emit(('ANEW', reg_id, tuple(node.val)))
+            else:
+                self.emit(('SET', reg_id, node.val))
             value_at = reg_id
         elif isinstance(node, Variable):
             try:
@@ -89,91 +322,244 @@ class BytecodeGenerator:
             except KeyError:
                 raise Exception("Cannot resolve symbol: {}".format(node.var_name))
         elif isinstance(node, ArithmeticExpr):
-            instrs, value_at = self.lowerArithmeticExpr(node)
+            value_at = self.lowerArithmeticExpr(node)
         elif isinstance(node, FuncCall):
-            raise NotImplementedError("Haven't Implemented function calls yet")
+            value_at = self.lowerFuncCall(node)
         else:
             raise Exception("Can't evaluate as an Evaluatable: {}".format(node)) #TODO: make node types implement
                                                                                  # # __str__ so something more useful can be printed
-        return instrs, value_at
+        return value_at
 
     def lowerFunctionDef(self, node):
-        func_name = node.func_name
-        arg_list = node.arg_list
-        return_type = node.return_type
-        code_block = node.code_block
-
-        arg_mapping = []
-        for arg in arg_list:
-            var_name = arg.var_name
-            reg_id = self.get_next_register()
-            arg_mapping.append(reg_id)
-        node.arg_mapping = arg_mapping
+        """
+        Nothing is emitted where a function is defined. Calls either inline its code or CALL a FUNC
+        section generated for it on first use
+        """
+        if node.func_name not in self.function_table.keys():
+            self.function_table[node.func_name] = []
+        self.function_table[node.func_name].append(node)
+        # A new definition can make other functions recursive
+        self.function_info = {}
+
+    def resolve_function(self, node):
+        if node.func_name not in self.function_table.keys():
+            raise Exception("Cannot resolve function: {}".format(node.func_name))
+        func = self.function_table[node.func_name][-1]
+        if len(node.args) != len(func.arg_list):
+            raise Exception("Function {} takes {} arguments, called with {}".format(
+                node.func_name, len(func.arg_list), len(node.args)))
+        for arg, param in zip(node.args, func.arg_list):
+            if arg.return_type != param.return_type:
+                raise Exception("Argument {} of {} must be of type {}".format(param.var_name, node.func_name, param.return_type))
+        if node.return_type != func.return_type:
+            raise Exception("Function {} returns {}, not {}".format(node.func_name, func.return_type, node.return_type))
+        return func
 
-        if func_name not in self.function_table.keys():
-            self.function_table[func_name] = []
-        self.function_table[func_name].append(node)
+    def calls_function(self, func, target, seen):
+        for node in subtree_nodes(func.code_block):
+            if isinstance(node, FuncCall) and node.func_name in self.function_table.keys():
+                callee = self.function_table[node.func_name][-1]
+                if callee is target:
+                    return True
+                if id(callee) not in seen:
+                    seen.add(id(callee))
+                    if self.calls_function(callee, target, seen):
+                        return True
+        return False
+
+    def get_function_info(self, func):
+        """
+        :return: whether calls to func are inlined, and the names of the parameters func assigns to
+        """
+        if id(func) not in self.function_info:
+            nodes = list(subtree_nodes(func.code_block))
+            params = set(param.var_name for param in func.arg_list)
+            assigned = set(node.var.var_name for node in nodes
+                           if isinstance(node, (AssignStmt, UpdateArrayIndexStmt)) and node.var.var_name in params)
+            inline = bool(self.inline_limit) and len(nodes) <= self.inline_limit and \
+                not self.calls_function(func, func, set())
+            self.function_info[id(func)] = (inline, assigned)
+        return self.function_info[id(func)]
 
     def lowerFuncCall(self, node):
-        func_name = node.func_name
-        args = node.args
-
-        instrs = []
-        #TODO: Check against definitions to named function with correct parameters
-        func_info = self.function_table[func_name][-1]
-
-        funcreg_to_args = {}
-        for idx in range(len(node.arg_list)):
-            # setup register holding arg value, and register which function will work on
-            # save mapping for when we place the value back in the arg register
-            arg = args[idx]
-            arg_instrs, arg_value_at = self.lowerEvaluatable(arg)
-            funcreg_id = func_info.arg_mapping[idx]
-            funcreg_to_args[funcreg_id] = arg_value_at
-            param = node.arg_list[idx]
-            param_name = param.var_name
-            instrs += arg_instrs
-            # copy contents of arg register into func register
-            instrs += [('SET', funcreg_id, arg_value_at)]
-            # Temporarily, add function param names to symbol_table
-            if not param_name in self.symbol_table.keys():
-                self.symbol_table[param_name] = []
-            self.symbol_table[param_name].append(funcreg_id)
-        # execute func code
-        #TODO
-        instrs += func_instrs
-        for idx in range(len(node.arg_list)):
-            param = node.arg_list[idx]
-            param_name = param.var_name
-            funcreg_id = func_info.arg_mapping[idx]
-
-            # copy contents of func register back to arg register
-            # and remove symbol table entries for function params
-            arg_reg = funcreg_to_args[func_reg]
-            instrs += [('SET', arg_reg, func_reg)]
-            self.symbol_table[param_name].pop()
+        func = self.resolve_function(node)
+        inline, assigned_params = self.get_function_info(func)
 
+        arg_regs = []
+        for arg, param in zip(node.args, func.arg_list):
+            value_at = self.lowerEvaluatable(arg)
+            # Arguments are passed by value. A parameter the function changes can't be the caller's
+            # variable, and an array it changes is shared so that it gets copied on the first store.
+            # CALL copies scalars into the function's registers already
+            if param.var_name in assigned_params:
+                if param.return_type == DataTypes.ARRAY:
+                    copy = self.get_next_register()
+                    self.emit(('AMOV', copy, value_at))
+                    value_at = copy
+                elif inline and (isinstance(arg, Variable) or value_at in self.shared_registers):
+                    copy = self.get_next_register()
+                    self.emit(('SET', copy, value_at))
+                    value_at = copy
+            arg_regs.append(value_at)
+
+        if inline:
+            self.inlined_calls += 1
+            return self.inlineFunction(func, arg_regs)
+        self.emitted_calls += 1
+        value_at = self.get_next_register()
+        self.emit(('CALL', value_at, self.function_label(func), tuple(arg_regs)))
+        return value_at
+
+    def unassigned_reads(self, code_block, assigned, reads):
+        """
+        Adds the variables code_block may read before assigning them to reads (a dict, for its order)
+        :param assigned: variables assigned on every path into code_block
+        :return: variables assigned on every path through code_block
+        """
+        assigned = set(assigned)
+
+        def read(*nodes):
+            for node in subtree_nodes(nodes):
+                if isinstance(node, Variable) and node.var_name not in assigned:
+                    reads[node.var_name] = None
+
+        for node in code_block:
+            if isinstance(node, AssignStmt):
+                read(node.evaluation)
+                assigned.add(node.var.var_name)
+            elif isinstance(node, UpdateArrayIndexStmt):
+                read(node.var, node.evaluation)
+            elif isinstance(node, ReturnStmt):
+                read(node.evaluation)
+            elif isinstance(node, IfElseBlock):
+                read(node.bool_cond)
+                assigned = self.unassigned_reads(node.true_block, assigned, reads) & \
+                    self.unassigned_reads(node.false_block, assigned, reads)
+            elif isinstance(node, WhileBlock):
+                read(node.bool_cond)
+                self.unassigned_reads(node.code_block, assigned, reads)
+        return assigned
+
+    def lowerFunctionEntry(self, func):
+        """
+        Every call starts with the function's variables at 0, like the main program's. Only variables that
+        can be read before they're assigned are actually set, so the registers of a call never need clearing
+        """
+        reads = {}
+        self.unassigned_reads(func.code_block, set(param.var_name for param in func.arg_list), reads)
+        for var_name in reads:
+            reg_id = self.get_next_register()
+            self.symbol_table[var_name] = [reg_id]
+            self.emit(('SET', reg_id, 0))
+
+    def lowerFunctionExit(self, func):
+        """
+        What happens when control reaches the end of the function's code without a return
+        """
+        code_block = func.code_block
+        if code_block and isinstance(code_block[-1], ReturnStmt):
+            return
+        if func.return_type == DataTypes.ARRAY:
+            raise Exception("Function {} returns an array, so its code must end with a return".format(func.func_name))
+        self.lowerReturn(ReturnStmt(Constant(0)))
+
+    def inlineFunction(self, func, arg_regs):
+        """
+        func's code lowered in place, with its parameters bound to the argument registers
+        :return: the register holding the result
+        """
+        symbol_table = self.symbol_table
+        self.symbol_table = {param.var_name: [reg_id] for param, reg_id in zip(func.arg_list, arg_regs)}
+        value_at, return_label = self.get_next_register(), ForwardLabel()
+        self.return_targets.append((func, value_at, return_label))
+        self.enter(func)
+
+        self.lowerFunctionEntry(func)
+        self.lowerBlock(func.code_block)
+        self.lowerFunctionExit(func)
+        # The last return falls through to the end instead of jumping there
+        code = self.code
+        if return_label.fixups and return_label.fixups[-1][0] is code and return_label.fixups[-1][1] == len(code) - 1:
+            return_label.fixups.pop()
+            instr = code.pop()
+            if self.source_map is not None:
+                del self.source_map[id(instr)]
+        if return_label.fixups:
+            self.place(return_label)
+
+        self.leave()
+        self.return_targets.pop()
+        self.symbol_table = symbol_table
+        return value_at
+
+    def function_label(self, func):
+        """
+        Label of func's FUNC section, which is generated the first time it's needed
+        """
+        if id(func) not in self.function_labels:
+            label = self.get_next_label()
+            # Set first, so recursive calls in the function's code find it
+            self.function_labels[id(func)] = label
+            self.function_sections.append(self.lowerFunctionSection(func, label))
+        return self.function_labels[id(func)]
+
+    def lowerFunctionSection(self, func, label):
+        """
+        :return: func's FUNC section, which is emitted into a buffer of its own
+        """
+        symbol_table, node_path, code = self.symbol_table, self.node_path, self.code
+        self.symbol_table, self.node_path, self.code = {}, None, []
+        self.enter(func)
+        params = []
+        for param in func.arg_list:
+            reg_id = self.get_next_register()
+            self.symbol_table[param.var_name] = [reg_id]
+            params.append(reg_id)
+        self.return_targets.append((func, None, None))
+
+        self.emit(('FUNC', label, tuple(params)))
+        self.lowerFunctionEntry(func)
+        self.lowerBlock(func.code_block)
+        self.lowerFunctionExit(func)
+        instrs = self.code
+
+        self.return_targets.pop()
+        self.symbol_table, self.node_path, self.code = symbol_table, node_path, code
         return instrs
 
+    def lowerReturn(self, node):
+        if not self.return_targets:
+            raise Exception("Return outside of a function")
+        func, return_reg, return_label = self.return_targets[-1]
+        if node.evaluation.return_type != func.return_type:
+            raise Exception("Function {} returns {}, not {}".format(func.func_name, func.return_type,
+                                                                      node.evaluation.return_type))
+        value_at = self.lowerEvaluatable(node.evaluation)
+        # The caller gets a shared array, in case the function keeps it in a register
+        move = 'AMOV' if func.return_type == DataTypes.ARRAY else 'SET'
+        if return_reg is None:
+            if move == 'AMOV':
+                reg_id = self.get_next_register()
+                self.emit(('AMOV', reg_id, value_at))
+                value_at = reg_id
+            self.emit(('RET', value_at))
+        else:
+            self.emit((move, return_reg, value_at))
+            self.jump(return_label, 'JMP')
+
     def lowerIfElseBlock(self, node):
-        comp_instrs, cmp_value_at = self.lowerBooleanCondition(node.bool_cond)
-        true_block, false_block = node.true_block, node.false_block
-
-        instrs = comp_instrs
-        if_label, else_label, done_label = self.get_next_label(), self.get_next_label(), self.get_next_label()
-        instrs += [('CHK_JMP', cmp_value_at, if_label)]
-        instrs += [('JMP',  else_label)]
-
-        if_instrs = [('LABEL', if_label)]
-        if_instrs += self.generate_bytecode(true_block)
-        if_instrs.append(('JMP', done_label))
-        else_instrs = [('LABEL', else_label)]
-        else_instrs += self.generate_bytecode(false_block)
-        else_instrs.append(('JMP', done_label)) # not needed, but doesn't hurt
-        instrs += if_instrs + else_instrs
-        instrs.append(('LABEL', done_label))
+        cmp_value_at = self.lowerBooleanCondition(node.bool_cond)
+        if_label, else_label, done_label = ForwardLabel(), ForwardLabel(), ForwardLabel()
+        self.jump(if_label, 'CHK_JMP', cmp_value_at)
+        self.jump(else_label, 'JMP')
 
-        return instrs
+        self.place(if_label)
+        self.lowerBlock(node.true_block)
+        self.jump(done_label, 'JMP')
+        self.place(else_label)
+        self.lowerBlock(node.false_block)
+        self.jump(done_label, 'JMP') # not needed, but doesn't hurt
+        self.place(done_label)
 
     def lowerWhileBlock(self, node):
         """
@@ -181,31 +567,29 @@ class BytecodeGenerator:
         :param node:
         :return:
         """
-        code_block = node.code_block
-
-        comp_instrs, cmp_value_at = self.lowerBooleanCondition(node.bool_cond)
-        block_instrs = self.generate_bytecode(code_block)
-        start_loop_label, end_loop_label = self.get_next_label(), self.get_next_label()
-        instrs = [('LABEL', start_loop_label)]
-        instrs += comp_instrs
-        instrs += [('NCHK_JMP', cmp_value_at, end_loop_label)]
-        instrs += block_instrs
-        instrs += [('JMP', start_loop_label)]
-        instrs += [('LABEL', end_loop_label)]
-
-        return instrs
+        start_loop_label, end_loop_label = ForwardLabel(), ForwardLabel()
+        self.place(start_loop_label)
+        cmp_value_at = self.lowerBooleanCondition(node.bool_cond)
+        self.jump(end_loop_label, 'NCHK_JMP', cmp_value_at)
+        self.lowerBlock(node.code_block)
+        self.jump(start_loop_label, 'JMP')
+        self.place(end_loop_label)
 
     def lowerBooleanCondition(self, bool_cond):
+        """
+        :return: the register holding 1 if bool_cond holds, otherwise 0
+        """
         lhs = bool_cond.lhs
         rhs = bool_cond.rhs
         if not (lhs.return_type == DataTypes.SCALAR or rhs.return_type == DataTypes.SCALAR):
             raise NotImplementedError('Currently, only boolean comparison of scalars is supported')
-        lhs_instrs, lhs_value_at = self.lowerEvaluatable(lhs)
-        rhs_instrs, rhs_value_at = self.lowerEvaluatable(rhs)
+        lhs_value_at = self.lowerEvaluatable(lhs)
+        rhs_value_at = self.lowerEvaluatable(rhs)
         cmp_value_at = self.get_next_register()
         if isinstance(bool_cond, CompareEquals):
-            cmp_instr = ('CMP_EQ', cmp_value_at, lhs_value_at, rhs_value_at)
+            self.emit(('CMP_EQ', cmp_value_at, lhs_value_at, rhs_value_at))
         elif isinstance(bool_cond, CompareGreater):
-            cmp_instr = ('CMP_GT', cmp_value_at, lhs_value_at, rhs_value_at)
-        instrs = lhs_instrs + rhs_instrs + [cmp_instr]
-        return instrs, cmp_value_at
\ No newline at end of file
+            self.emit(('CMP_GT', cmp_value_at, lhs_value_at, rhs_value_at))
+        elif isinstance(bool_cond, CompareLess):
+            self.emit(('CMP_GT', cmp_value_at, rhs_value_at, lhs_value_at))
+        return cmp_value_at
@@ -0,0 +1,507 @@
+"""
+    Frontend for the source language of grammar.txt. tokenize turns the lines of a source into tokens
+    in a single pass, and Parser builds the statement tree from them by recursive descent, parsing
+    expressions by precedence climbing. Tokens are made as the parser asks for them, a line at a time,
+    so parsing a file holds no more of it than the current line.
+"""
+import io
+import re
+
+from CFG import *
+from bytecode_generator import subtree_nodes
+from CfgGenerator import CfgGenerator
+from data_types import DataTypes
+
+
+KEYWORDS = frozenset(['if', 'else', 'while', 'func', 'return', 'print', 'input', 'array', 'scalar'])
+PRECEDENCE = {'+': 1, '-': 1, '*': 2}  # binary operator -> how tightly it binds
+UNARY_PRECEDENCE = 3
+TYPE_NAMES = {DataTypes.SCALAR: 'scalar', DataTypes.ARRAY: 'array'}
+
+# Groups: 1 number, 2 name or keyword, 3 string, 4 operator, 5 comment, 6 anything else
+TOKEN = re.compile(r'\s*(?:(\d+)|([A-Za-z_]\w*)|"([^"\n]*)"|(==|->|[-+*<>=(){}\[\],;])|(#.*)|(\S))')
+
+
+def position_error(token, message):
+    return Exception("line {}, column {}: {}".format(token[2], token[3], message))
+
+
+def describe(token):
+    if token[0] == 'end':
+        return 'end of input'
+    if token[0] == 'string':
+        return '"{}"'.format(token[1])
+    return "'{}'".format(token[1])
+
+
+def tokenize(lines):
+    """
+    :param lines: iterable of the source's lines, like an open file
+    :return: generator of (kind, value, line, column) tuples. kind is 'number', 'name' or 'string', or
+             the text of a keyword or operator. The last token is of kind 'end'
+    """
+    line_no = 0
+    for line_no, line in enumerate(lines, 1):
+        for match in TOKEN.finditer(line):
+            group = match.lastindex
+            if group == 4:
+                op = match.group(4)
+                yield op, op, line_no, match.start(4) + 1
+            elif group == 2:
+                name = match.group(2)
+                yield name if name in KEYWORDS else 'name', name, line_no, match.start(2) + 1
+            elif group == 1:
+                yield 'number', int(match.group(1)), line_no, match.start(1) + 1
+            elif group == 3:
+                yield 'string', match.group(3), line_no, match.start(3)
+            elif group == 6:
+                char = match.group(6)
+                message = 'unterminated string' if char == '"' else "unexpected character '{}'".format(char)
+                raise position_error((None, None, line_no, match.start(6) + 1), message)
+    yield 'end', None, line_no + 1, 1
+
+
+class Parser:
+    """
+        Builds the same nodes as the equivalent CfgGenerator calls, checking types, array lengths and
+        calls as it goes so that errors point at the source. Like CfgGenerator.define_func, functions
+        only see their parameters and the variables they assign themselves
+    """
+    def __init__(self, lines):
+        self.next_token = tokenize(lines).__next__
+        self.token = self.next_token()
+        self.cfg = CfgGenerator()
+        self.scope = {}           # variable name -> its Variable, for the function or program being parsed
+        self.functions = {}       # function name -> (parameters, return type) of its last definition
+        self.return_type = None   # of the function being parsed
+        self.depth = 0            # of blocks around the statement being parsed
+        self.statements = {
+            'name': self.assignment,
+            'if': self.if_else,
+            'while': self.while_loop,
+            'array': self.array_declaration,
+            'func': self.function,
+            'return': self.return_value,
+            'print': self.interpreter_debug,
+            'input': self.input_vars,
+        }
+
+    def advance(self):
+        token = self.token
+        self.token = self.next_token()
+        return token
+
+    def expect(self, kind):
+        if self.token[0] != kind:
+            raise position_error(self.token, "expected '{}' but found {}".format(kind, describe(self.token)))
+        return self.advance()
+
+    def parse(self):
+        """
+        :return: a CfgGenerator holding the program, its variables and functions, as if it had built them
+        """
+        program = []
+        try:
+            while self.token[0] != 'end':
+                self.statement(program)
+        except RecursionError:
+            raise position_error(self.token, 'blocks or expressions nested too deeply')
+        cfg = self.cfg
+        cfg.program = program
+        for name, var in self.scope.items():
+            cfg.symbol_type_table[name] = var.return_type
+            if var.return_type == DataTypes.ARRAY:
+                cfg.array_length_table[name] = var.length
+        return cfg
+
+    def statement(self, block):
+        parse_statement = self.statements.get(self.token[0])
+        if parse_statement is None:
+            raise position_error(self.token, 'expected a statement but found {}'.format(describe(self.token)))
+        node = parse_statement()
+        if node is not None:
+            block.append(node)
+
+    def block(self):
+        start = self.expect('{')
+        block = []
+        self.depth += 1
+        while self.token[0] != '}':
+            if self.token[0] == 'end':
+                raise position_error(start, "'{' is never closed")
+            self.statement(block)
+        self.depth -= 1
+        self.advance()
+        return block
+
+    def assignment(self):
+        name_token = self.advance()
+        name = name_token[1]
+        if self.token[0] == '[':
+            self.advance()
+            idx_token = self.expect('number')
+            self.expect(']')
+            self.expect('=')
+            var = self.scope.get(name)
+            if var is None or var.return_type != DataTypes.ARRAY:
+                raise position_error(name_token, "'{}' is not an array, declare it with 'array {}[length]'".format(name, name))
+            if idx_token[1] >= var.length:
+                raise position_error(idx_token, "Index {} out of range for array '{}' of size {}".format(
+                    idx_token[1], name, var.length))
+            value = self.typed_expression(DataTypes.SCALAR)
+            self.expect(';')
+            return UpdateArrayIndexStmt(var, idx_token[1], value)
+
+        self.expect('=')
+        value_token = self.token
+        value = self.expression()
+        self.expect(';')
+        if value.return_type == DataTypes.SCALAR:
+            var = Variable(name, DataTypes.SCALAR)
+        else:
+            length = array_length(value)
+            if length is None:
+                previous = self.scope.get(name)
+                if previous is None or previous.return_type != DataTypes.ARRAY:
+                    raise position_error(value_token, "the length of the array assigned to '{}' isn't known, "
+                                                      "declare it with 'array {}[length] = ...'".format(name, name))
+                length = previous.length
+            var = Variable(name, DataTypes.ARRAY, length)
+        self.scope[name] = var
+        return AssignVarStmt(var, value)
+
+    def array_declaration(self):
+        self.advance()
+        name = self.expect('name')[1]
+        self.expect('[')
+        length = self.expect('number')[1]
+        self.expect(']')
+        if self.token[0] == '=':
+            self.advance()
+            value_token = self.token
+            value = self.typed_expression(DataTypes.ARRAY)
+            value_length = array_length(value)
+            if value_length is not None and value_length != length:
+                raise position_error(value_token, "Array {} of size {} assigned an array of size {}".format(
+                    name, length, value_length))
+        else:
+            value = Constant([0] * length)
+        self.expect(';')
+        var = self.scope[name] = Variable(name, DataTypes.ARRAY, length)
+        return AssignVarStmt(var, value)
+
+    def if_else(self):
+        self.advance()
+        bool_cond = self.condition()
+        true_block = self.block()
+        false_block = []
+        if self.token[0] == 'else':
+            self.advance()
+            if self.token[0] == 'if':
+                false_block = [self.if_else()]
+            else:
+                false_block = self.block()
+        return IfElseBlock(bool_cond, true_block, false_block)
+
+    def while_loop(self):
+        self.advance()
+        bool_cond = self.condition()
+        return WhileBlock(bool_cond, self.block())
+
+    def condition(self):
+        self.expect('(')
+        lhs = self.typed_expression(DataTypes.SCALAR)
+        op_token = self.advance()
+        op = op_token[0]
+        if op not in ('>', '<', '=='):
+            raise position_error(op_token, "expected '>', '<' or '==' but found {}".format(describe(op_token)))
+        rhs = self.typed_expression(DataTypes.SCALAR)
+        self.expect(')')
+        if op == '==':
+            return CompareEquals(lhs, rhs)
+        if op == '>':
+            return CompareGreater(lhs, rhs)
+        # Swapping the operands is the form the passes know best, but calls have to run in source order
+        if any(isinstance(node, FuncCall) for node in subtree_nodes([lhs, rhs])):
+            return CompareLess(lhs, rhs)
+        return CompareGreater(rhs, lhs)
+
+    def function(self):
+        func_token = self.advance()
+        if self.depth > 0 or self.return_type is not None:
+            raise position_error(func_token, 'functions can only be defined at the top level')
+        name = self.expect('name')[1]
+        self.expect('(')
+        outer_scope = self.scope
+        self.scope = {}
+        params = []
+        while self.token[0] != ')':
+            if params:
+                self.expect(',')
+            param_token = self.expect('name')
+            if self.token[0] == '[':
+                self.advance()
+                param = Variable(param_token[1], DataTypes.ARRAY, self.expect('number')[1])
+                self.expect(']')
+            else:
+                param = Variable(param_token[1], DataTypes.SCALAR)
+            if param_token[1] in self.scope:
+                raise position_error(param_token, "duplicate parameter '{}'".format(param_token[1]))
+            self.scope[param_token[1]] = param
+            params.append(param)
+        self.advance()
+        return_type = DataTypes.SCALAR
+        if self.token[0] == '->':
+            self.advance()
+            type_token = self.advance()
+            if type_token[0] == 'array':
+                return_type = DataTypes.ARRAY
+            elif type_token[0] != 'scalar':
+                raise position_error(type_token, "expected 'scalar' or 'array' but found {}".format(describe(type_token)))
+        # Declared before the code is parsed, so that the code can call the function
+        self.functions[name] = (params, return_type)
+        self.return_type = return_type
+        code = self.block()
+        self.return_type = None
+        self.scope = outer_scope
+        func_def = FunctionDef(name, code, return_type, params)
+        self.cfg.function_def_table.setdefault(name, []).append(func_def)
+        return func_def
+
+    def return_value(self):
+        return_token = self.advance()
+        if self.return_type is None:
+            raise position_error(return_token, "'return' outside of a function")
+        value = self.typed_expression(self.return_type)
+        self.expect(';')
+        return ReturnStmt(value)
+
+    def interpreter_debug(self):
+        self.advance()
+        output = self.expect('string')[1]
+        self.expect(';')
+        return InterpreterDebugNode(output)
+
+    def input_vars(self):
+        input_token = self.advance()
+        if self.depth > 0 or self.return_type is not None:
+            raise position_error(input_token, 'inputs can only be declared at the top level')
+        while True:
+            name = self.expect('name')[1]
+            self.cfg.input_var(name)
+            self.scope[name] = Variable(name, DataTypes.SCALAR)
+            if self.token[0] != ',':
+                break
+            self.advance()
+        self.expect(';')
+
+    def typed_expression(self, expected_type):
+        start = self.token
+        value = self.expression()
+        if value.return_type != expected_type:
+            raise position_error(start, 'expected a {} but found a {}'.format(
+                TYPE_NAMES[expected_type], TYPE_NAMES[value.return_type]))
+        return value
+
+    def expression(self, min_precedence=0):
+        """
+            Left operands are combined in a loop, so long sums don't nest calls; only operators binding
+            more tightly than the one on their left recurse
+        """
+        left = self.operand()
+        while True:
+            precedence = PRECEDENCE.get(self.token[0], 0)
+            if precedence <= min_precedence:
+                return left
+            op_token = self.advance()
+            right = self.expression(precedence)
+            if left.return_type != right.return_type:
+                raise position_error(op_token, "cannot apply '{}' to a {} and a {}".format(
+                    op_token[0], TYPE_NAMES[left.return_type], TYPE_NAMES[right.return_type]))
+            if left.return_type == DataTypes.ARRAY:
+                left_length, right_length = array_length(left), array_length(right)
+                if left_length is not None and right_length is not None and left_length != right_length:
+                    raise position_error(op_token, "cannot apply '{}' to arrays of sizes {} and {}".format(
+                        op_token[0], left_length, right_length))
+            left = ArithmeticExpr(op_token[0], left, right)
+
+    def operand(self):
+        token = self.advance()
+        kind = token[0]
+        if kind == 'name':
+            if self.token[0] == '(':
+                return self.call(token)
+            var = self.scope.get(token[1])
+            if var is None:
+                raise position_error(token, "Attempting to evaluate an undefined variable '{}'".format(token[1]))
+            return var
+        if kind == 'number':
+            return Constant(token[1])
+        if kind == '(':
+            value = self.expression()
+            self.expect(')')
+            return value
+        if kind == '-':
+            if self.token[0] == 'number':
+                return Constant(-self.advance()[1])
+            value = self.expression(UNARY_PRECEDENCE)
+            if value.return_type == DataTypes.SCALAR:
+                return ArithmeticExpr('-', Constant(0), value)
+            length = array_length(value)
+            if length is None:
+                raise position_error(token, "the length of the array negated isn't known")
+            return ArithmeticExpr('-', Constant([0] * length), value)
+        if kind == '[':
+            return self.array_literal()
+        raise position_error(token, 'expected an expression but found {}'.format(describe(token)))
+
+    def array_literal(self):
+        items = []
+        while self.token[0] != ']':
+            if items:
+                self.expect(',')
+            sign = 1
+            if self.token[0] == '-':
+                self.advance()
+                sign = -1
+            item_token = self.expect('number')
+            item = sign * item_token[1]
+            if not -127 < item < 128:
+                raise position_error(item_token, 'array items must be between -126 and 127, not {}'.format(item))
+            items.append(item)
+        self.advance()
+        return Constant(items)
+
+    def call(self, name_token):
+        self.advance()
+        args = []
+        arg_tokens = []
+        while self.token[0] != ')':
+            if args:
+                self.expect(',')
+            arg_tokens.append(self.token)
+            args.append(self.expression())
+        self.advance()
+        func_name = name_token[1]
+        signature = self.functions.get(func_name)
+        if signature is None:
+            raise position_error(name_token, "call to undefined function '{}'".format(func_name))
+        params, return_type = signature
+        if len(args) != len(params):
+            raise position_error(name_token, "'{}' takes {} arguments but was given {}".format(
+                func_name, len(params), len(args)))
+        for arg, param, arg_token in zip(args, params, arg_tokens):
+            if arg.return_type != param.return_type or array_length(arg) not in (None, param.length):
+                raise position_error(arg_token, "argument '{}' of '{}' is a {}".format(
+                    param.var_name, func_name, describe_type(param)))
+        return FuncCall(func_name, args, return_type)
+
+
+def array_length(value):
+    """
+    :return: the length of array-valued Evaluatable value, or None for scalars and where that is only
+             known when it runs
+    """
+    if value.return_type != DataTypes.ARRAY:
+        return None
+    if isinstance(value, Variable):
+        return value.length
+    if isinstance(value, Constant):
+        return len(value.val)
+    if isinstance(value, ArithmeticExpr):
+        length = array_length(value.op1)
+        return array_length(value.op2) if length is None else length
+    return None
+
+
+def describe_type(var):
+    if var.return_type == DataTypes.ARRAY:
+        return 'array of size {}'.format(var.length)
+    return 'scalar'
+
+
+def parse(source):
+    """
+    :param source: the program's text, or an iterable of its lines like an open file
+    :return: a CfgGenerator holding the program, see Parser.parse
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    return Parser(source).parse()
+
+
+def parse_file(path):
+    with open(path) as source:
+        return parse(source)
+
+
+def to_source(program, inputs=()):
+    """
+        Source text for program, which parses back to the same statement tree
+    :param inputs: names of the variables the program declares with CfgGenerator.input_var
+    """
+    lines = ['input {};'.format(', '.join(inputs))] if inputs else []
+    lines.extend(source_lines(program, ''))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def source_lines(block, indent):
+    inner = indent + '    '
+    for node in block:
+        if isinstance(node, AssignVarStmt):
+            var = node.var
+            if var.return_type == DataTypes.ARRAY:
+                yield '{}array {}[{}] = {};'.format(indent, var.var_name, var.length, expression_source(node.evaluation))
+            else:
+                yield '{}{} = {};'.format(indent, var.var_name, expression_source(node.evaluation))
+        elif isinstance(node, UpdateArrayIndexStmt):
+            yield '{}{}[{}] = {};'.format(indent, node.var.var_name, node.idx, expression_source(node.evaluation))
+        elif isinstance(node, IfElseBlock):
+            yield '{}if ({}) {{'.format(indent, condition_source(node.bool_cond))
+            yield from source_lines(node.true_block, inner)
+            if node.false_block:
+                yield indent + '} else {'
+                yield from source_lines(node.false_block, inner)
+            yield indent + '}'
+        elif isinstance(node, WhileBlock):
+            yield '{}while ({}) {{'.format(indent, condition_source(node.bool_cond))
+            yield from source_lines(node.code_block, inner)
+            yield indent + '}'
+        elif isinstance(node, FunctionDef):
+            params = ', '.join(param.var_name if param.return_type == DataTypes.SCALAR
+                               else '{}[{}]'.format(param.var_name, param.length) for param in node.arg_list)
+            yield '{}func {}({}) -> {} {{'.format(indent, node.func_name, params, TYPE_NAMES[node.return_type])
+            yield from source_lines(node.code_block, inner)
+            yield indent + '}'
+        elif isinstance(node, ReturnStmt):
+            yield '{}return {};'.format(indent, expression_source(node.evaluation))
+        elif isinstance(node, InterpreterDebugNode):
+            if '"' in node.output or '\n' in node.output:
+                raise Exception("Cannot write debug output {!r} as a string".format(node.output))
+            yield '{}print "{}";'.format(indent, node.output)
+        else:
+            raise Exception("Cannot write {} as source".format(type(node).__name__))
+
+
+def condition_source(bool_cond):
+    op = COMPARISON_OPS[type(bool_cond)]
+    return '{} {} {}'.format(expression_source(bool_cond.lhs), op, expression_source(bool_cond.rhs))
+
+
+def expression_source(value, min_precedence=0):
+    if isinstance(value, Variable):
+        return value.var_name
+    if isinstance(value, Constant):
+        if value.return_type == DataTypes.ARRAY:
+            return '[{}]'.format(', '.join(str(item) for item in value.val))
+        return str(value.val)
+    if isinstance(value, FuncCall):
+        return '{}({})'.format(value.func_name, ', '.join(expression_source(arg) for arg in value.args))
+    if isinstance(value, ArithmeticExpr):
+        precedence = PRECEDENCE[value.op]
+        # Operators are left associative, so a right operand of the same precedence needs parentheses
+        text = '{} {} {}'.format(expression_source(value.op1, precedence), value.op,
+                                 expression_source(value.op2, precedence + 1))
+        return '({})'.format(text) if precedence < min_precedence else text
+    raise Exception("Cannot write {} as source".format(type(value).__name__))
@@ -0,0 +1,404 @@
+import copy
+
+from bytecode_generator import BytecodeGenerator, INLINE_LIMIT
+from CFG import *
+from opcodes import FORMATS, LABEL, instr_defs, instr_uses, rename_registers
+from optimizations.cfg.conditional_constants import ConditionalConstantPropagation
+from optimizations.cfg.counting_loops import CountingLoopOptimizer
+from optimizations.cfg.dead_stores import DeadStoreElimination
+
+# Passes run over each function on its own. Functions only see their own variables, so what these do to
+# a function depends on nothing but its code, and the result is cached with it
+FUNCTION_PASSES = (ConditionalConstantPropagation, CountingLoopOptimizer, DeadStoreElimination)
+
+
+# Node class -> what the structure of a node of it is made of: values of its own, and its children
+STRUCTURE = {
+    Constant: lambda node: ((tuple(node.val) if node.return_type == DataTypes.ARRAY else node.val,), ()),
+    Variable: lambda node: ((node.var_name, node.return_type, node.length), ()),
+    ArithmeticExpr: lambda node: ((node.op,), (node.op1, node.op2)),
+    FuncCall: lambda node: ((node.func_name, node.return_type), node.args),
+    AssignVarStmt: lambda node: ((), (node.var, node.evaluation)),
+    UpdateArrayIndexStmt: lambda node: ((node.idx,), (node.var, node.evaluation)),
+    ReturnStmt: lambda node: ((), (node.evaluation,)),
+    Comparison: lambda node: ((), (node.lhs, node.rhs)),
+    IfElseBlock: lambda node: ((), (node.bool_cond, node.true_block, node.false_block)),
+    WhileBlock: lambda node: ((), (node.bool_cond, node.code_block)),
+    FunctionDef: lambda node: ((node.func_name, node.return_type), (node.arg_list, node.code_block)),
+    InterpreterDebugNode: lambda node: ((node.output,), ()),
+    list: lambda node: ((), node),
+}
+NO_CALLS = frozenset()
+
+
+def structure_fields(node_type):
+    """
+    Entry of STRUCTURE for node_type or the class it derives from, found once per class
+    """
+    if node_type not in STRUCTURE:
+        for base in node_type.__mro__:
+            if base in STRUCTURE:
+                STRUCTURE[node_type] = STRUCTURE[base]
+                break
+        else:
+            raise Exception("No structure for {}".format(node_type.__name__))
+    return STRUCTURE[node_type]
+
+
+def intern(key, interned):
+    """
+    :return: the number interned gives key, a new one if key is new. Keys are compared in full, so unlike
+             hash(), which is equal for -1 and -2, equal numbers always mean equal keys
+    """
+    number = interned.get(key)
+    if number is None:
+        number = interned[key] = len(interned)
+    return number
+
+
+def node_info(node, memo, interned, leaves):
+    """
+    Structure id of node, which is equal for equal subtrees however they were built and different
+    otherwise, the names of the functions it calls, and whether it can be cached as a statement of the
+    main program: it mustn't define functions or return. Memoised in memo by id(node), the children of
+    node included, so memo can only be kept while no node changes
+    :param interned: structure of a node, with the ids of its children -> its id (see intern), kept for
+                     as long as ids are compared
+    :param leaves: memo for Constants and Variables, which can't change, so it can be kept for longer
+    """
+    key = id(node)
+    entry = memo.get(key) or leaves.get(key)
+    if entry is not None:
+        return entry[1]
+    node_type = type(node)
+    fields, children = (STRUCTURE.get(node_type) or structure_fields(node_type))(node)
+    structure, calls, cacheable = [node_type.__name__, fields], NO_CALLS, node_type not in (FunctionDef, ReturnStmt)
+    for child in children:
+        # Most children are leaves met before, looked up here rather than in a call
+        entry = leaves.get(id(child))
+        if entry is not None:
+            structure.append(entry[1][0])
+            continue
+        child_id, child_calls, child_cacheable = node_info(child, memo, interned, leaves)
+        structure.append(child_id)
+        if child_calls:
+            calls = calls | child_calls
+        cacheable = cacheable and child_cacheable
+    if node_type is FuncCall:
+        calls = calls | {node.func_name}
+    info = (intern(tuple(structure), interned), calls, cacheable)
+    # The node is kept so that its id can't be reused
+    if node_type is Constant or node_type is Variable:
+        leaves[key] = (node, info)
+    else:
+        memo[key] = (node, info)
+    return info
+
+
+class Fragment:
+    """
+        Bytecode lowered for a statement of the main program or for a function's FUNC section, kept for
+        the next compilation. Variables always have the same register, so the only registers a fragment
+        doesn't own are in var_regs; the rest, and the labels it defines, are renamed when the fragment
+        is used twice in a program
+    """
+    def __init__(self, instrs, reads, defines, calls, var_regs, nested=(), inlined_calls=0, emitted_calls=0):
+        self.instrs = instrs
+        self.reads = reads      # variables that have to exist before the fragment
+        self.defines = defines  # variables it assigns, which exist after it
+        self.calls = calls      # functions it calls, whose FUNC sections must be in the program
+        self.var_regs = var_regs
+        self.nested = nested    # fragments of the statements in its blocks, whose bytecode is part of its own
+        self.inlined_calls = inlined_calls
+        self.emitted_calls = emitted_calls
+
+
+class SymbolTable(dict):
+    """
+        The main program's symbol table, which notes the variables each statement being lowered reads
+        before assigning them, and the ones it assigns
+    """
+    def __init__(self):
+        super().__init__()
+        self.recording = []  # (reads, defines) of each statement being lowered, innermost last
+
+    def __getitem__(self, var_name):
+        if self.recording:
+            reads, defines = self.recording[-1]
+            if var_name not in defines:
+                reads.add(var_name)
+        return super().__getitem__(var_name)
+
+    def __setitem__(self, var_name, regs):
+        if self.recording:
+            self.recording[-1][1].add(var_name)
+        super().__setitem__(var_name, regs)
+
+
+class IncrementalGenerator(BytecodeGenerator):
+    """
+        BytecodeGenerator that keeps the bytecode of each statement of the main program, IfElseBlock and
+        WhileBlock arms included, and of each FUNC section, keyed by structure id, and splices it back
+        in when the same statement or function comes round again.
+        To make bytecode reusable, every variable of the main program gets a register of its own the first
+        time it's assigned, which stays its register from then on, instead of taking over the register of
+        its first value. FUNC section labels depend only on the function's signature: the structure id
+        of its code and of the functions it calls. Common subexpressions aren't supported, as value
+        numbering works over the whole program.
+    """
+    def __init__(self, inline_limit=INLINE_LIMIT):
+        super().__init__(inline_limit)
+        self.var_registers = {}      # variable name -> its register in every compilation
+        self.fragments = {}          # (structure id, signatures of the functions called) -> Fragment
+        self.sections = {}           # function signature -> Fragment of its FUNC section
+        self.signature_labels = {}   # function signature -> label of its FUNC section
+        self.reused_fragments = 0
+        self.lowered_fragments = 0
+        self.reused_sections = 0
+        self.lowered_sections = 0
+        self.structures = {}         # see node_info, the ids of signatures too
+        self.leaf_infos = {}         # see node_info
+        self.start()
+
+    def start(self):
+        """
+        Forgets the program compiled last, but not the fragments it was made of
+        """
+        self.symbol_table = SymbolTable()
+        if self.source_map is not None:
+            self.source_map = {}
+        self.node_path = None
+        self.code = []
+        self.function_table = {}
+        self.function_info = {}
+        self.function_labels = {}
+        self.function_sections = []
+        self.return_targets = []
+        self.signatures = {}
+        # Structure ids of the nodes met compiling this program. Passes change nodes in place, so they
+        # are worked out again on every compilation
+        self.node_infos = {}
+        self.used_fragments = set()
+        self.emitted_labels = set()
+        # Per statement or FUNC section being lowered, innermost last: fragments placed in it so far, and
+        # the names of the functions whose FUNC sections it needs
+        self.lowering = []
+
+    def variable_register(self, var_name):
+        if var_name not in self.var_registers:
+            self.var_registers[var_name] = self.get_next_register()
+        return self.var_registers[var_name]
+
+    def input_registers(self, var_names):
+        for var_name in var_names:
+            if var_name not in self.symbol_table:
+                self.symbol_table[var_name] = [self.variable_register(var_name)]
+        return {var_name: self.symbol_table[var_name][-1] for var_name in var_names}
+
+    def lowerAssignment(self, node):
+        if self.return_targets:
+            return super().lowerAssignment(node)
+        value_at = self.lowerEvaluatable(node.evaluation)
+        var_name = node.var.var_name
+        var_reg = self.variable_register(var_name)
+        self.symbol_table[var_name] = [var_reg]
+        move = 'AMOV' if node.var.return_type == DataTypes.ARRAY else 'SET'
+        self.emit((move, var_reg, value_at))
+
+    def lowerFunctionDef(self, node):
+        self.signatures = {}
+        super().lowerFunctionDef(node)
+
+    def info(self, node):
+        return node_info(node, self.node_infos, self.structures, self.leaf_infos)
+
+    def function_signature(self, func, visiting=()):
+        """
+        Id of func's code and of the signatures of the functions it calls, as they're defined now
+        """
+        if not visiting and id(func) in self.signatures:
+            return self.signatures[id(func)]
+        func_id, calls, _ = self.info(func)
+        callees = []
+        for func_name in sorted(calls):
+            if func_name not in self.function_table:
+                callees.append((func_name, None))
+                continue
+            callee = self.function_table[func_name][-1]
+            if callee is func or id(callee) in visiting:
+                # Part of a cycle of calls, whose code is in the signature already or will be
+                callees.append((func_name, self.info(callee)[0]))
+            else:
+                callees.append((func_name, self.function_signature(callee, visiting + (id(func),))))
+        signature = intern(('signature', func_id, tuple(callees)), self.structures)
+        if not visiting:
+            self.signatures[id(func)] = signature
+        return signature
+
+    def fragment_key(self, node, calls):
+        callees = []
+        for func_name in sorted(calls):
+            if func_name not in self.function_table:
+                return None
+            callees.append((func_name, self.function_signature(self.function_table[func_name][-1])))
+        return self.info(node)[0], tuple(callees)
+
+    def lowerStatement(self, node):
+        if self.return_targets:
+            return super().lowerStatement(node)
+        _, calls, cacheable = self.info(node)
+        key = self.fragment_key(node, calls) if cacheable else None
+        if key is None:
+            return super().lowerStatement(node)
+        fragment = self.fragments.get(key)
+        if fragment is not None and all(var_name in self.symbol_table for var_name in fragment.reads):
+            self.reused_fragments += 1
+            if self.lowering:
+                self.lowering[-1][0].append(fragment)
+                self.lowering[-1][1].update(fragment.calls)
+            self.splice(fragment)
+            return
+
+        self.lowered_fragments += 1
+        symbol_table = self.symbol_table
+        symbol_table.recording.append((set(), set()))
+        self.lowering.append(([], set()))
+        counts = self.inlined_calls, self.emitted_calls
+        start = len(self.code)
+        try:
+            super().lowerStatement(node)
+        finally:
+            reads, defines = symbol_table.recording.pop()
+            nested, sections = self.lowering.pop()
+        if symbol_table.recording:
+            outer_reads, outer_defines = symbol_table.recording[-1]
+            outer_reads |= reads - outer_defines
+            outer_defines |= defines
+        var_regs = set(self.var_registers[var_name] for var_name in reads | defines if var_name in self.var_registers)
+        fragment = Fragment(self.code[start:], frozenset(reads), frozenset(defines), frozenset(sections), var_regs, tuple(nested),
+                            self.inlined_calls - counts[0], self.emitted_calls - counts[1])
+        self.fragments[key] = fragment
+        self.mark_used(fragment)
+        if self.lowering:
+            self.lowering[-1][0].append(fragment)
+            self.lowering[-1][1].update(sections)
+
+    def mark_used(self, fragment):
+        """
+        :return: whether the fragment's bytecode, or that of a statement in it, is in the program already
+        """
+        used = id(fragment) in self.used_fragments
+        self.used_fragments.add(id(fragment))
+        for nested in fragment.nested:
+            used |= self.mark_used(nested)
+        return used
+
+    def splice(self, fragment):
+        """
+        Emits the fragment's bytecode and makes the program's state what lowering its statement would have left
+        """
+        for var_name in fragment.reads:
+            self.symbol_table[var_name]
+        for var_name in fragment.defines:
+            self.symbol_table[var_name] = [self.variable_register(var_name)]
+        for func_name in fragment.calls:
+            self.function_label(self.function_table[func_name][-1])
+        self.inlined_calls += fragment.inlined_calls
+        self.emitted_calls += fragment.emitted_calls
+        for instr in self.relocate(fragment) if self.mark_used(fragment) else fragment.instrs:
+            self.emit(instr)
+
+    def relocate(self, fragment):
+        """
+        Copy of the fragment's bytecode with registers and labels of its own, for a second use
+        """
+        registers, labels = {}, {}
+        for instr in fragment.instrs:
+            for reg in instr_defs(instr) + instr_uses(instr):
+                if reg not in fragment.var_regs and reg not in registers:
+                    registers[reg] = self.get_next_register()
+            if instr[0] == 'LABEL':
+                labels[instr[1]] = self.get_next_label()
+        relocated = []
+        for instr in fragment.instrs:
+            instr = rename_registers(instr, registers)
+            if labels:
+                instr = tuple(labels.get(operand, operand) if kind == LABEL else operand
+                              for kind, operand in zip((None,) + FORMATS[instr[0]], instr))
+            relocated.append(instr)
+        return relocated
+
+    def function_label(self, func):
+        if self.lowering:
+            self.lowering[-1][1].add(func.func_name)
+        if id(func) in self.function_labels:
+            return self.function_labels[id(func)]
+        signature = self.function_signature(func)
+        if signature not in self.signature_labels:
+            self.signature_labels[signature] = self.get_next_label()
+        label = self.signature_labels[signature]
+        self.function_labels[id(func)] = label
+        if label in self.emitted_labels:
+            return label
+        self.emitted_labels.add(label)
+
+        section = self.sections.get(signature)
+        if section is not None:
+            self.reused_sections += 1
+            self.function_sections.append(list(section.instrs))
+            for func_name in section.calls:
+                self.function_label(self.function_table[func_name][-1])
+            return label
+
+        self.lowered_sections += 1
+        self.lowering.append(([], set()))
+        try:
+            instrs = self.lowerFunctionSection(func, label)
+        finally:
+            sections = self.lowering.pop()[1]
+        self.function_sections.append(instrs)
+        self.sections[signature] = Fragment(instrs, frozenset(), frozenset(), frozenset(sections), set())
+        return label
+
+
+class IncrementalCompiler:
+    """
+        Compiles successive versions of a program, doing again only what changed since the last one:
+        statements and functions with the same structure reuse their bytecode (see IncrementalGenerator), and
+        with optimize_functions, the result of FUNCTION_PASSES on each function is kept too.
+        The main program isn't optimised, since whole-program passes don't split up by subtree.
+        Structure ids are worked out again on every compilation, in one walk of the program, so a new
+        version of a program can change its nodes in place.
+    """
+    def __init__(self, inline_limit=INLINE_LIMIT, optimize_functions=False):
+        self.generator = IncrementalGenerator(inline_limit)
+        self.optimize_functions = optimize_functions
+        self.optimized = {}  # structure id of a FunctionDef -> optimised copy
+        self.optimized_functions = 0
+        self.reused_functions = 0
+
+    def optimize_function(self, func):
+        func_id = self.generator.info(func)[0]
+        if func_id in self.optimized:
+            self.reused_functions += 1
+            return self.optimized[func_id]
+        self.optimized_functions += 1
+        optimized = [copy.deepcopy(func)]
+        for opt_pass in FUNCTION_PASSES:
+            opt_pass().run_pass(optimized)
+        self.optimized[func_id] = optimized[0]
+        return optimized[0]
+
+    def compile(self, program, inputs=()):
+        """
+        :param inputs: variables whose values are supplied when the program runs (see CfgGenerator.input_var)
+        :return: bytecode for program, which is left as it is. The generator, and so the symbol table, is
+                 self.generator
+        """
+        generator = self.generator
+        generator.start()
+        if self.optimize_functions:
+            program = [self.optimize_function(node) if isinstance(node, FunctionDef) else node
+                       for node in program]
+        generator.input_registers(inputs)
+        return generator.generate_bytecode(program)
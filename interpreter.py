@@ -1,65 +1,317 @@
+from aot_compiler import CompiledProgram
+from arrays import check_lengths, new_array, share, store_element
+from opcodes import *
+from output_sinks import StdoutSink
+from program_loader import LoadedProgram, load_program
+
+
 class Interpreter:
-    def __init__(self):
+    def __init__(self, output=None, summary=True):
+        """
+        :param output: OutputSink for DEBUG_PRINT and the interpreter's own messages, buffered
+                       standard output by default
+        :param summary: whether interpret writes the number of instructions run to output
+        """
         self.program_counter = 0
-        self.labels = {}
-        self.registers = {}
+        self.registers = []  # register window of the code running, the main program's outside of calls
+        # (caller's registers, register for the result, return program counter, pool the frame goes back to)
+        self.call_stack = []
+        # Register windows of finished calls, by size, handed out again by CALL instead of new lists
+        self.frame_pools = {}
+        self.summary = summary
+        self.set_output(output if output is not None else StdoutSink())
+        self.dispatch_table = self.build_dispatch_table()
 
-    def interpret(self, bytecode, max_instructions=False):
-        self.setup_labels(bytecode)
-        instrs_run = 0
-        while self.program_counter < len(bytecode):
-            if max_instructions:
+    def set_output(self, output):
+        self.output = output
+        self.write_output = output.write
+
+    def build_dispatch_table(self):
+        """
+        Handlers indexed by integer opcode. Each handler executes one instruction and returns the
+        program counter of the next one
+        """
+        table = [None] * len(OPCODE_NAMES)
+        table[SET_CONST] = self.op_set_const
+        table[SET_REG] = self.op_set_reg
+        table[ADD] = self.op_add
+        table[SUB] = self.op_sub
+        table[MUL] = self.op_mul
+        table[CMP_EQ] = self.op_cmp_eq
+        table[CMP_GT] = self.op_cmp_gt
+        table[CHK_JMP] = self.op_chk_jmp
+        table[NCHK_JMP] = self.op_nchk_jmp
+        table[JMP] = self.op_jmp
+        table[DEBUG_PRINT] = self.op_debug_print
+        table[JMP_GT] = self.op_jmp_gt
+        table[JMP_NGT] = self.op_jmp_ngt
+        table[JMP_EQ] = self.op_jmp_eq
+        table[JMP_NEQ] = self.op_jmp_neq
+        table[ADDI] = self.op_addi
+        table[MOV2] = self.op_mov2
+        table[DECODE] = self.op_decode
+        table[ANEW] = self.op_anew
+        table[AADD] = self.op_aadd
+        table[ASUB] = self.op_asub
+        table[AMUL] = self.op_amul
+        table[AMOV] = self.op_amov
+        table[ASTORE] = self.op_astore
+        table[CALL] = self.op_call
+        table[RET] = self.op_ret
+        return table
+
+    def enable_opcode_counts(self):
+        """
+        Swaps in a dispatch table that counts executions of every opcode into self.opcode_counts.
+        Interpreters that never call this don't pay anything for it.
+        """
+        self.opcode_counts = [0] * len(OPCODE_NAMES)
+        counts = self.opcode_counts
+
+        def counting(opcode, handler):
+            def counted(instr, pc):
+                counts[opcode] += 1
+                return handler(instr, pc)
+            return counted
+
+        self.dispatch_table = [counting(opcode, handler) for opcode, handler in enumerate(self.build_dispatch_table())]
+
+    def opcode_counts_by_name(self):
+        return {OPCODE_NAMES[opcode]: count for opcode, count in enumerate(self.opcode_counts) if count}
+
+    def interpret(self, bytecode, max_instructions=False, profiler=None):
+        """
+        :param bytecode: output of BytecodeGenerator.generate_bytecode, or a LoadedProgram. Passing a
+                         LoadedProgram avoids decoding the bytecode again on every call. A CompiledProgram
+                         from AotCompiler is run as Python code.
+        :param profiler: Profiler created for this program, which runs it through its instrumented loop
+        """
+        if profiler is not None:
+            if isinstance(bytecode, LoadedProgram) and bytecode is not profiler.program:
+                raise Exception("Profiler was created for a different program")
+            instrs_run = profiler.run(self, max_instructions)
+        elif isinstance(bytecode, CompiledProgram):
+            instrs_run = bytecode.run(self, max_instructions)
+        else:
+            if isinstance(bytecode, LoadedProgram):
+                program = bytecode
+            else:
+                program = load_program(bytecode)
+            instrs_run = self.run(program, max_instructions)
+        if self.summary:
+            self.write_output("{} instructions were run in that execution".format(instrs_run))
+        self.output.flush()
+        self.program_counter = 0
+        if self.call_stack:
+            # Stopped inside a call by max_instructions
+            self.registers = self.main_registers()
+            self.call_stack = []
+        return instrs_run
+
+    def run(self, program, max_instructions=False, instrs_run=0):
+        """
+        Runs program from self.program_counter, leaving it at the instruction execution stopped at.
+        :param instrs_run: instructions already run in this execution, counted against max_instructions
+        """
+        registers = self.main_registers()
+        if len(registers) < program.num_registers:
+            registers.extend([0] * (program.num_registers - len(registers)))
+        code = program.code
+        dispatch_table = self.dispatch_table
+        end = len(code)
+        pc = self.program_counter
+        if max_instructions:
+            while pc < end:
                 if instrs_run > max_instructions:
-                    print("Hit max # of instructions to execute")
+                    self.write_output("Hit max # of instructions to execute")
                     break
-            self.interpret_instr(bytecode[self.program_counter])
+                instr = code[pc]
+                pc = dispatch_table[instr[0]](instr, pc)
+                instrs_run += 1
+        else:
+            while pc < end:
+                instr = code[pc]
+                pc = dispatch_table[instr[0]](instr, pc)
+                instrs_run += 1
+        self.program_counter = pc
+        self.output.flush()
+        return instrs_run
+
+    def run_slice(self, program, limit):
+        """
+        Runs at most limit instructions from self.program_counter, for callers that interleave
+        programs and keep their own instruction budget
+        :return: number of instructions run
+        """
+        registers = self.main_registers()
+        if len(registers) < program.num_registers:
+            registers.extend([0] * (program.num_registers - len(registers)))
+        code = program.code
+        dispatch_table = self.dispatch_table
+        stop = len(code)
+        pc = self.program_counter
+        instrs_run = 0
+        while pc < stop and instrs_run < limit:
+            instr = code[pc]
+            pc = dispatch_table[instr[0]](instr, pc)
             instrs_run += 1
-        print("{} instructions were run in that execution".format(instrs_run))
-        self.program_counter = 0
+        self.program_counter = pc
+        return instrs_run
+
+    def main_registers(self):
+        return self.call_stack[0][0] if self.call_stack else self.registers
+
+    def named_registers(self, program):
+        """
+        Register values of the main program keyed by the register names used in the tuple bytecode of program
+        """
+        registers = self.main_registers()
+        return {name: registers[idx] for idx, name in enumerate(program.register_names)}
+
+    def op_set_const(self, instr, pc):
+        self.registers[instr[1]] = instr[2]
+        return pc + 1
+
+    def op_set_reg(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = registers[instr[2]]
+        return pc + 1
+
+    def op_add(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = registers[instr[2]] + registers[instr[3]]
+        return pc + 1
+
+    def op_sub(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = registers[instr[2]] - registers[instr[3]]
+        return pc + 1
+
+    def op_mul(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = registers[instr[2]] * registers[instr[3]]
+        return pc + 1
+
+    def op_cmp_eq(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = 1 if registers[instr[2]] == registers[instr[3]] else 0
+        return pc + 1
+
+    def op_cmp_gt(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = 1 if registers[instr[2]] > registers[instr[3]] else 0
+        return pc + 1
+
+    def op_chk_jmp(self, instr, pc):
+        if self.registers[instr[1]]:
+            return instr[2]
+        return pc + 1
+
+    def op_nchk_jmp(self, instr, pc):
+        if not self.registers[instr[1]]:
+            return instr[2]
+        return pc + 1
+
+    def op_jmp(self, instr, pc):
+        return instr[1]
+
+    def op_debug_print(self, instr, pc):
+        self.write_output(instr[1])
+        return pc + 1
+
+    def op_jmp_gt(self, instr, pc):
+        registers = self.registers
+        if registers[instr[1]] > registers[instr[2]]:
+            return instr[3]
+        return pc + 1
+
+    def op_jmp_ngt(self, instr, pc):
+        registers = self.registers
+        if not registers[instr[1]] > registers[instr[2]]:
+            return instr[3]
+        return pc + 1
+
+    def op_jmp_eq(self, instr, pc):
+        registers = self.registers
+        if registers[instr[1]] == registers[instr[2]]:
+            return instr[3]
+        return pc + 1
+
+    def op_jmp_neq(self, instr, pc):
+        registers = self.registers
+        if registers[instr[1]] != registers[instr[2]]:
+            return instr[3]
+        return pc + 1
+
+    def op_addi(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = registers[instr[2]] + instr[3]
+        return pc + 1
+
+    def op_mov2(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = registers[instr[2]]
+        registers[instr[3]] = registers[instr[4]]
+        return pc + 1
+
+    def op_decode(self, instr, pc):
+        decoded = instr[1].decode_instruction(pc)
+        return self.dispatch_table[decoded[0]](decoded, pc)
+
+    def op_anew(self, instr, pc):
+        self.registers[instr[1]] = new_array(instr[2])
+        return pc + 1
+
+    def op_aadd(self, instr, pc):
+        registers = self.registers
+        lhs, rhs = registers[instr[2]], registers[instr[3]]
+        check_lengths(lhs, rhs)
+        registers[instr[1]] = lhs + rhs
+        return pc + 1
+
+    def op_asub(self, instr, pc):
+        registers = self.registers
+        lhs, rhs = registers[instr[2]], registers[instr[3]]
+        check_lengths(lhs, rhs)
+        registers[instr[1]] = lhs - rhs
+        return pc + 1
+
+    def op_amul(self, instr, pc):
+        registers = self.registers
+        lhs, rhs = registers[instr[2]], registers[instr[3]]
+        check_lengths(lhs, rhs)
+        registers[instr[1]] = lhs * rhs
+        return pc + 1
+
+    def op_amov(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = share(registers[instr[2]])
+        return pc + 1
+
+    def op_astore(self, instr, pc):
+        registers = self.registers
+        registers[instr[1]] = store_element(registers[instr[1]], instr[2], registers[instr[3]])
+        return pc + 1
+
+    def op_call(self, instr, pc):
+        caller = self.registers
+        pool = self.frame_pools.get(instr[3])
+        if pool is None:
+            pool = self.frame_pools[instr[3]] = []
+        # Functions set every register before reading it, so a reused window needs no clearing
+        frame = pool.pop() if pool else [0] * instr[3]
+        param = 0
+        for arg in instr[4]:
+            frame[param] = caller[arg]
+            param += 1
+        self.call_stack.append((caller, instr[1], pc + 1, pool))
+        self.registers = frame
+        return instr[2]
 
-    def interpret_instr(self, instr):
-            cmd = instr[0]
-            if cmd == 'ADD':
-                dest, src1, src2 = instr[1:4]
-                self.registers[dest] = self.registers[src1] + self.registers[src2]
-            elif cmd == 'CHK_JMP':
-                reg_id, label = instr[1], instr[2]
-                if self.registers[reg_id]:
-                    self.program_counter = self.labels[label]
-            elif cmd == 'NCHK_JMP':
-                reg_id, label = instr[1], instr[2]
-                if not self.registers[reg_id]:
-                    self.program_counter = self.labels[label]
-            elif cmd == 'CMP_EQ':
-                dest, src1, src2 = instr[1:4]
-                if self.registers[src1] == self.registers[src2]:
-                    self.registers[dest] = 1
-                else:
-                    self.registers[dest] = 0
-            elif cmd == 'CMP_GT':
-                dest, src1, src2 = instr[1:4]
-                if self.registers[src1] > self.registers[src2]:
-                    self.registers[dest] = 1
-                else:
-                    self.registers[dest] = 0
-            elif cmd == 'DEBUG_PRINT':
-                output = instr[1]
-                print(output)
-            elif cmd == 'LABEL':
-                pass
-            elif cmd == 'JMP':
-                label = instr[1]
-                self.program_counter = self.labels[label]
-            elif cmd == 'SET':
-                dest = instr[1]
-                val = instr[2]
-                if isinstance(val, str):
-                    val = self.registers[val]
-                self.registers[dest] = val
-            self.program_counter += 1
-
-    def setup_labels(self, bytecode):
-        for instr_idx in range(len(bytecode)):
-            instr = bytecode[instr_idx]
-            if instr[0] == 'LABEL':
-                self.labels[instr[1]] = instr_idx
\ No newline at end of file
+    def op_ret(self, instr, pc):
+        frame = self.registers
+        caller, dst, return_pc, pool = self.call_stack.pop()
+        caller[dst] = frame[instr[1]]
+        pool.append(frame)
+        self.registers = caller
+        return return_pc
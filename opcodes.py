@@ -0,0 +1,226 @@
+"""
+    Instruction formats of the tuple bytecode produced by BytecodeGenerator, and the
+    integer opcodes it is decoded into by the program loader
+"""
+
+# Operand kinds of the tuple bytecode
+DST = 'dst'      # register written by the instruction
+SRC = 'src'      # register read by the instruction
+VAL = 'val'      # either a register name or an immediate value
+LABEL = 'label'  # label name
+TEXT = 'text'    # literal output
+IMM = 'imm'      # immediate value
+UPD = 'upd'      # register read and written in place by the instruction
+ARGS = 'args'    # tuple of registers read by the instruction
+PARAMS = 'params'  # tuple of registers written by the instruction
+
+FORMATS = {
+    'SET': (DST, VAL),
+    'ADD': (DST, SRC, SRC),
+    'SUB': (DST, SRC, SRC),
+    'MUL': (DST, SRC, SRC),
+    'CMP_EQ': (DST, SRC, SRC),
+    'CMP_GT': (DST, SRC, SRC),
+    'CHK_JMP': (SRC, LABEL),
+    'NCHK_JMP': (SRC, LABEL),
+    'JMP': (LABEL,),
+    'LABEL': (LABEL,),
+    'DEBUG_PRINT': (TEXT,),
+    # Superinstructions, see optimizations/bytecode/superinstructions.py
+    'JMP_GT': (SRC, SRC, LABEL),
+    'JMP_NGT': (SRC, SRC, LABEL),
+    'JMP_EQ': (SRC, SRC, LABEL),
+    'JMP_NEQ': (SRC, SRC, LABEL),
+    'ADDI': (DST, SRC, IMM),
+    'MOV2': (DST, SRC, DST, SRC),
+    # Whole-array instructions, see arrays.py
+    'ANEW': (DST, IMM),          # new array holding a tuple of elements
+    'AADD': (DST, SRC, SRC),
+    'ASUB': (DST, SRC, SRC),
+    'AMUL': (DST, SRC, SRC),
+    'AMOV': (DST, SRC),          # shares the array instead of copying it
+    'ASTORE': (UPD, IMM, SRC),   # array[index] = scalar
+    # Functions that aren't inlined. The main program ends with HALT and each function follows it as a
+    # section of its own, starting at a FUNC, with registers of its own: every call runs in a fresh window
+    'CALL': (DST, LABEL, ARGS),  # dst = the function starting at the FUNC with this label, called with args
+    'RET': (SRC,),
+    'FUNC': (LABEL, PARAMS),     # not executed, like LABEL. The parameters are set to the arguments
+    'HALT': (),
+}
+
+CONDITIONAL_JUMPS = {'CHK_JMP', 'NCHK_JMP', 'JMP_GT', 'JMP_NGT', 'JMP_EQ', 'JMP_NEQ'}
+UNCONDITIONAL_JUMPS = {'JMP'}
+EXITS = {'RET', 'HALT'}  # leave the function or program, so control never continues past them
+PSEUDO_INSTRUCTIONS = {'LABEL', 'FUNC'}  # removed by the program loader
+
+# Integer opcodes of a LoadedProgram. 'SET' is split in two, depending on whether it
+# copies a register or loads an immediate, so that the interpreter never has to check
+SET_CONST = 0
+SET_REG = 1
+ADD = 2
+SUB = 3
+MUL = 4
+CMP_EQ = 5
+CMP_GT = 6
+CHK_JMP = 7
+NCHK_JMP = 8
+JMP = 9
+DEBUG_PRINT = 10
+JMP_GT = 11
+JMP_NGT = 12
+JMP_EQ = 13
+JMP_NEQ = 14
+ADDI = 15
+MOV2 = 16
+DECODE = 17  # placeholder for an instruction of a mapped bytecode file that hasn't been decoded yet
+ANEW = 18
+AADD = 19
+ASUB = 20
+AMUL = 21
+AMOV = 22
+ASTORE = 23
+CALL = 24
+RET = 25
+
+OPCODE_NAMES = [
+    'SET_CONST',
+    'SET_REG',
+    'ADD',
+    'SUB',
+    'MUL',
+    'CMP_EQ',
+    'CMP_GT',
+    'CHK_JMP',
+    'NCHK_JMP',
+    'JMP',
+    'DEBUG_PRINT',
+    'JMP_GT',
+    'JMP_NGT',
+    'JMP_EQ',
+    'JMP_NEQ',
+    'ADDI',
+    'MOV2',
+    'DECODE',
+    'ANEW',
+    'AADD',
+    'ASUB',
+    'AMUL',
+    'AMOV',
+    'ASTORE',
+    'CALL',
+    'RET',
+]
+
+# Operand kinds of LoadedProgram instructions, indexed by opcode. Label operands have been
+# resolved to program counters
+LOADED_FORMATS = [
+    (DST, IMM),             # SET_CONST
+    (DST, SRC),             # SET_REG
+    (DST, SRC, SRC),        # ADD
+    (DST, SRC, SRC),        # SUB
+    (DST, SRC, SRC),        # MUL
+    (DST, SRC, SRC),        # CMP_EQ
+    (DST, SRC, SRC),        # CMP_GT
+    (SRC, LABEL),           # CHK_JMP
+    (SRC, LABEL),           # NCHK_JMP
+    (LABEL,),               # JMP
+    (TEXT,),                # DEBUG_PRINT
+    (SRC, SRC, LABEL),      # JMP_GT
+    (SRC, SRC, LABEL),      # JMP_NGT
+    (SRC, SRC, LABEL),      # JMP_EQ
+    (SRC, SRC, LABEL),      # JMP_NEQ
+    (DST, SRC, IMM),        # ADDI
+    (DST, SRC, DST, SRC),   # MOV2
+    (),                     # DECODE
+    (DST, IMM),             # ANEW
+    (DST, SRC, SRC),        # AADD
+    (DST, SRC, SRC),        # ASUB
+    (DST, SRC, SRC),        # AMUL
+    (DST, SRC),             # AMOV
+    (UPD, IMM, SRC),        # ASTORE
+    (DST, LABEL, IMM, ARGS),  # CALL, the immediate is the size of the function's register window
+    (SRC,),                 # RET
+]
+
+# Jump target is always the last operand
+CONDITIONAL_JUMP_OPCODES = {CHK_JMP, NCHK_JMP, JMP_GT, JMP_NGT, JMP_EQ, JMP_NEQ}
+
+MNEMONIC_OPCODES = {
+    'ADD': ADD,
+    'SUB': SUB,
+    'MUL': MUL,
+    'CMP_EQ': CMP_EQ,
+    'CMP_GT': CMP_GT,
+    'CHK_JMP': CHK_JMP,
+    'NCHK_JMP': NCHK_JMP,
+    'JMP': JMP,
+    'DEBUG_PRINT': DEBUG_PRINT,
+    'JMP_GT': JMP_GT,
+    'JMP_NGT': JMP_NGT,
+    'JMP_EQ': JMP_EQ,
+    'JMP_NEQ': JMP_NEQ,
+    'ADDI': ADDI,
+    'MOV2': MOV2,
+    'ANEW': ANEW,
+    'AADD': AADD,
+    'ASUB': ASUB,
+    'AMUL': AMUL,
+    'AMOV': AMOV,
+    'ASTORE': ASTORE,
+    'CALL': CALL,
+    'RET': RET,
+}
+
+
+def is_register(operand):
+    return isinstance(operand, str)
+
+
+def instr_defs(instr):
+    """
+    Registers written by a tuple bytecode instruction
+    """
+    defs = []
+    for kind, operand in zip(FORMATS[instr[0]], instr[1:]):
+        if kind in (DST, UPD):
+            defs.append(operand)
+        elif kind == PARAMS:
+            defs.extend(operand)
+    return defs
+
+
+def instr_uses(instr):
+    """
+    Registers read by a tuple bytecode instruction
+    """
+    uses = []
+    for kind, operand in zip(FORMATS[instr[0]], instr[1:]):
+        if kind in (SRC, UPD) or (kind == VAL and is_register(operand)):
+            uses.append(operand)
+        elif kind == ARGS:
+            uses.extend(operand)
+    return uses
+
+
+def instr_label(instr):
+    """
+    Label referenced by a jump or defined by a LABEL, None for every other instruction
+    """
+    for kind, operand in zip(FORMATS[instr[0]], instr[1:]):
+        if kind == LABEL:
+            return operand
+    return None
+
+
+def rename_registers(instr, mapping):
+    """
+    Copy of instr with every register operand found in mapping replaced
+    """
+    renamed = [instr[0]]
+    for kind, operand in zip(FORMATS[instr[0]], instr[1:]):
+        if kind in (DST, SRC, UPD) or (kind == VAL and is_register(operand)):
+            operand = mapping.get(operand, operand)
+        elif kind in (ARGS, PARAMS):
+            operand = tuple(mapping.get(reg, reg) for reg in operand)
+        renamed.append(operand)
+    return tuple(renamed)
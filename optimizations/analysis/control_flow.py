@@ -0,0 +1,161 @@
+from CFG import *
+
+
+def expression_vars(node):
+    """
+    Names of the variables an Evaluatable or Comparison reads, function call arguments included
+    """
+    found = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Variable):
+            found.add(node.var_name)
+        elif isinstance(node, ArithmeticExpr):
+            stack += [node.op1, node.op2]
+        elif isinstance(node, FuncCall):
+            stack += node.args
+        elif isinstance(node, Comparison):
+            stack += [node.lhs, node.rhs]
+    return found
+
+
+def stmt_uses(stmt):
+    if isinstance(stmt, UpdateArrayIndexStmt):
+        # Storing to an element keeps the rest of the array
+        return expression_vars(stmt.evaluation) | {stmt.var.var_name}
+    if isinstance(stmt, (AssignStmt, ReturnStmt)):
+        return expression_vars(stmt.evaluation)
+    return set()
+
+
+def stmt_defs(stmt):
+    if isinstance(stmt, (AssignStmt, UpdateArrayIndexStmt)):
+        return {stmt.var.var_name}
+    return set()
+
+
+class BasicBlock:
+    def __init__(self, index):
+        self.index = index
+        self.stmts = []       # AssignStmt, UpdateArrayIndexStmt, ReturnStmt and InterpreterDebugNode in order
+        self.branch = None    # IfElseBlock or WhileBlock whose condition is evaluated at the end of the block
+        self.successors = []  # after a branch: [where it goes when the condition holds, where it goes otherwise]
+        self.predecessors = []
+
+    def uses(self):
+        """
+        Variables read in the block before it assigns them
+        """
+        used, defined = set(), set()
+        for stmt in self.stmts:
+            used |= stmt_uses(stmt) - defined
+            defined |= stmt_defs(stmt)
+        if self.branch is not None:
+            used |= expression_vars(self.branch.bool_cond) - defined
+        return used
+
+    def defs(self):
+        defined = set()
+        for stmt in self.stmts:
+            defined |= stmt_defs(stmt)
+        return defined
+
+
+class ControlFlowGraph:
+    """
+        Basic blocks of a list of CFG nodes, like CfgGenerator.program, which despite its name is a tree.
+        A block ends where a condition is evaluated, and a ReturnStmt ends its block with an edge to the
+        exit block. Statements after a return go in blocks without predecessors.
+        Each FunctionDef gets a graph of its own in function_graphs, since functions only see their own
+        variables. Building is a single walk over the tree.
+    """
+    def __init__(self, code_block, func=None):
+        self.func = func
+        self.blocks = []
+        self.branch_blocks = {}    # id(IfElseBlock or WhileBlock) -> block that ends with its condition
+        self.function_graphs = {}  # id(FunctionDef) -> ControlFlowGraph of its code
+        self.return_blocks = []
+        self._reverse_postorder = None
+
+        self.entry = self.new_block()
+        end = self.add_code(code_block, self.entry)
+        self.exit = self.new_block()
+        if end is not None:
+            self.add_edge(end, self.exit)
+        for block in self.return_blocks:
+            self.add_edge(block, self.exit)
+
+    def new_block(self):
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def add_edge(self, src, dest):
+        src.successors.append(dest)
+        dest.predecessors.append(src)
+
+    def add_code(self, code_block, block):
+        """
+        :return: block control continues in after code_block, or None if every path through it returns
+        """
+        for node in code_block:
+            if block is None:
+                block = self.new_block()
+            if isinstance(node, IfElseBlock):
+                block.branch = node
+                self.branch_blocks[id(node)] = block
+                true_start, false_start = self.new_block(), self.new_block()
+                self.add_edge(block, true_start)
+                self.add_edge(block, false_start)
+                true_end = self.add_code(node.true_block, true_start)
+                false_end = self.add_code(node.false_block, false_start)
+                block = None
+                if true_end is not None or false_end is not None:
+                    block = self.new_block()
+                    for end in (true_end, false_end):
+                        if end is not None:
+                            self.add_edge(end, block)
+            elif isinstance(node, WhileBlock):
+                head = self.new_block()
+                self.add_edge(block, head)
+                head.branch = node
+                self.branch_blocks[id(node)] = head
+                body, after = self.new_block(), self.new_block()
+                self.add_edge(head, body)
+                self.add_edge(head, after)
+                body_end = self.add_code(node.code_block, body)
+                if body_end is not None:
+                    self.add_edge(body_end, head)
+                block = after
+            elif isinstance(node, FunctionDef):
+                self.function_graphs[id(node)] = ControlFlowGraph(node.code_block, func=node)
+            elif isinstance(node, ReturnStmt):
+                block.stmts.append(node)
+                self.return_blocks.append(block)
+                block = None
+            else:
+                block.stmts.append(node)
+        return block
+
+    def reverse_postorder(self):
+        """
+        Blocks reachable from the entry, each before its successors except along back edges
+        """
+        if self._reverse_postorder is None:
+            order = []
+            visited = {self.entry.index}
+            stack = [(self.entry, iter(self.entry.successors))]
+            while stack:
+                block, successors = stack[-1]
+                for succ in successors:
+                    if succ.index not in visited:
+                        visited.add(succ.index)
+                        stack.append((succ, iter(succ.successors)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(block)
+            order.reverse()
+            self._reverse_postorder = order
+        return self._reverse_postorder
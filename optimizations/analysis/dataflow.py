@@ -0,0 +1,99 @@
+import heapq
+
+
+class DataflowAnalysis:
+    """
+        Worklist solver for a dataflow problem over a ControlFlowGraph. Subclasses set forward and
+        define boundary (the value entering the entry block, or leaving the exit block when backward),
+        initial (the value every other block starts out with), meet and transfer, and optionally
+        edge_value. block_in and block_out are indexed by block index and hold the values at the start
+        and end of each block, whichever the direction.
+        The worklist always hands out the earliest queued block in reverse postorder (postorder when
+        backward), so on the structured graphs of CfgGenerator programs each block is only revisited
+        for the loops around it.
+    """
+    forward = True
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.block_in = [self.initial() for _ in graph.blocks]
+        self.block_out = [self.initial() for _ in graph.blocks]
+        self.visits = 0
+        self.solve()
+
+    def boundary(self):
+        raise NotImplementedError()
+
+    def initial(self):
+        raise NotImplementedError()
+
+    def meet(self, values):
+        raise NotImplementedError()
+
+    def transfer(self, block, value):
+        raise NotImplementedError()
+
+    def edge_value(self, source, target, value):
+        """
+        Value that flows along the edge from source to target, in the direction of the analysis
+        """
+        return value
+
+    def solve(self):
+        graph = self.graph
+        order = graph.reverse_postorder()
+        if not self.forward:
+            order = order[::-1]
+        rank = {block.index: position for position, block in enumerate(order)}
+        if self.forward:
+            start, before, after = graph.entry, self.block_in, self.block_out
+        else:
+            start, before, after = graph.exit, self.block_out, self.block_in
+
+        worklist = [(position, block.index) for position, block in enumerate(order)]
+        queued = set(rank)
+        while worklist:
+            _, idx = heapq.heappop(worklist)
+            queued.discard(idx)
+            block = graph.blocks[idx]
+            self.visits += 1
+
+            sources = block.predecessors if self.forward else block.successors
+            values = [self.edge_value(source, block, after[source.index]) for source in sources if source.index in rank]
+            if block is start:
+                values.append(self.boundary())
+            value = self.meet(values) if values else self.initial()
+            before[idx] = value
+            value = self.transfer(block, value)
+            if value != after[idx]:
+                after[idx] = value
+                for target in (block.successors if self.forward else block.predecessors):
+                    if target.index in rank and target.index not in queued:
+                        queued.add(target.index)
+                        heapq.heappush(worklist, (rank[target.index], target.index))
+
+
+class LiveVariables(DataflowAnalysis):
+    """
+        Backward liveness of variables: block_in and block_out are the variables whose current values
+        can still be read at the start and end of each block
+    """
+    forward = False
+
+    def __init__(self, graph, live_at_exit=()):
+        self.live_at_exit = frozenset(live_at_exit)
+        self.use_def = [(frozenset(block.uses()), frozenset(block.defs())) for block in graph.blocks]
+        super().__init__(graph)
+
+    def boundary(self):
+        return self.live_at_exit
+
+    def initial(self):
+        return frozenset()
+
+    def meet(self, values):
+        return frozenset().union(*values)
+
+    def transfer(self, block, value):
+        used, defined = self.use_def[block.index]
+        return used | (value - defined)
@@ -0,0 +1,55 @@
+class Dominators:
+    """
+        Immediate dominators of the blocks of a ControlFlowGraph, using the iterative algorithm of Cooper,
+        Harvey and Kennedy over reverse postorder. idom is indexed by block index, with None for the entry
+        and for unreachable blocks
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.idom = [None] * len(graph.blocks)
+        self.order = {}  # block index -> position in reverse postorder
+        self.children = [[] for _ in graph.blocks]
+        self.solve()
+
+    def intersect(self, a, b):
+        order, idom = self.order, self.idom
+        while a is not b:
+            while order[a.index] > order[b.index]:
+                a = idom[a.index]
+            while order[b.index] > order[a.index]:
+                b = idom[b.index]
+        return a
+
+    def solve(self):
+        blocks = self.graph.reverse_postorder()
+        for position, block in enumerate(blocks):
+            self.order[block.index] = position
+        entry = self.graph.entry
+        # The entry is its own dominator while solving, which stops intersect walking past it
+        self.idom[entry.index] = entry
+        changed = True
+        while changed:
+            changed = False
+            for block in blocks[1:]:
+                new_idom = None
+                for pred in block.predecessors:
+                    if self.idom[pred.index] is not None:
+                        new_idom = pred if new_idom is None else self.intersect(pred, new_idom)
+                if new_idom is not self.idom[block.index]:
+                    self.idom[block.index] = new_idom
+                    changed = True
+        self.idom[entry.index] = None
+        for block in blocks[1:]:
+            self.children[self.idom[block.index].index].append(block)
+
+    def dominates(self, a, b):
+        """
+        True if every path from the entry to block b goes through block a
+        """
+        if a.index not in self.order or b.index not in self.order:
+            return False
+        while b is not None and self.order[b.index] >= self.order[a.index]:
+            if b is a:
+                return True
+            b = self.idom[b.index]
+        return False
@@ -0,0 +1,181 @@
+from collections import Counter
+
+from CFG import *
+from optimizations.analysis.control_flow import expression_vars
+from optimizations.cfg.dead_stores import calls_function
+
+
+def count_assignments(code_block, counts):
+    for node in code_block:
+        if isinstance(node, IfElseBlock):
+            count_assignments(node.true_block, counts)
+            count_assignments(node.false_block, counts)
+        elif isinstance(node, WhileBlock):
+            count_assignments(node.code_block, counts)
+        elif isinstance(node, (AssignStmt, UpdateArrayIndexStmt)):
+            counts[node.var.var_name] += 1
+
+
+def step_update(stmt):
+    """
+    :return: (x, sign) if stmt is v = v + x, v = x + v or v = v - x, where sign is 1 or -1, otherwise None
+    """
+    node, var_name = stmt.evaluation, stmt.var.var_name
+    if not isinstance(node, ArithmeticExpr) or node.op not in '+-':
+        return None
+    sign = 1 if node.op == '+' else -1
+    if isinstance(node.op1, Variable) and node.op1.var_name == var_name:
+        return node.op2, sign
+    if node.op == '+' and isinstance(node.op2, Variable) and node.op2.var_name == var_name:
+        return node.op1, sign
+    return None
+
+
+def iterations(holds, start, step, bound):
+    """
+    Number of times a loop runs when its condition is holds(value, bound) and value goes start, start + step,
+    ..., or None if it never stops
+    :param holds: one of '>' (value > bound), '<' (value < bound) or '=='
+    """
+    if holds == '>':
+        if start <= bound:
+            return 0
+        return None if step >= 0 else (start - bound - step - 1) // -step
+    if holds == '<':
+        if start >= bound:
+            return 0
+        return None if step <= 0 else (bound - start + step - 1) // step
+    if start != bound:
+        return 0
+    return None if step == 0 else 1
+
+
+def scale(node, factor):
+    if factor == 1:
+        return node
+    return ArithmeticExpr('*', node, Constant(factor))
+
+
+def offset(node, amount):
+    if amount == 0:
+        return node
+    return ArithmeticExpr('+', node, Constant(amount))
+
+
+class LoopVariables:
+    """
+        Scalar evolution of the variables of a WhileBlock. basic maps each basic induction variable, one
+        the body assigns once, in a top-level v = v + c or v = v - c with c a Constant, to (step, position
+        of its update in the body). When the condition compares a basic induction variable with a value
+        the loop doesn't change, and both are known on entry, trip_count is the number of times the body
+        runs, or None if the loop never stops.
+    """
+    def __init__(self, loop, entry_state):
+        self.loop = loop
+        self.entry_state = entry_state
+        self.assigned = Counter()
+        count_assignments(loop.code_block, self.assigned)
+
+        self.basic = {}
+        for position, stmt in enumerate(loop.code_block):
+            if not isinstance(stmt, AssignVarStmt) or stmt.var.return_type != DataTypes.SCALAR or \
+                    self.assigned[stmt.var.var_name] != 1:
+                continue
+            update = step_update(stmt)
+            if update is not None and isinstance(update[0], Constant):
+                self.basic[stmt.var.var_name] = (update[1] * update[0].val, position)
+
+        self.controlling = None
+        self.trip_count = None
+        self.count_trips()
+
+    def known(self, node):
+        """
+        Value of node on entry if it's a Constant or a scalar variable the loop doesn't assign, otherwise None
+        """
+        if isinstance(node, Constant) and node.return_type == DataTypes.SCALAR:
+            return node.val
+        if isinstance(node, Variable) and self.entry_state is not None and not self.assigned[node.var_name]:
+            value = self.entry_state.get(node.var_name)
+            if isinstance(value, int):
+                return value
+        return None
+
+    def count_trips(self):
+        bool_cond = self.loop.bool_cond
+        lhs, rhs = bool_cond.lhs, bool_cond.rhs
+        if isinstance(bool_cond, CompareLess):
+            lhs, rhs = rhs, lhs
+        for var_side, bound_side, holds in [(lhs, rhs, '>'), (rhs, lhs, '<')]:
+            if not isinstance(var_side, Variable) or var_side.var_name not in self.basic:
+                continue
+            bound, start = self.known(bound_side), None
+            if self.entry_state is not None:
+                start = self.entry_state.get(var_side.var_name)
+            if bound is None or not isinstance(start, int):
+                continue
+            if isinstance(bool_cond, CompareEquals):
+                holds = '=='
+            self.controlling = var_side.var_name
+            self.trip_count = iterations(holds, start, self.basic[var_side.var_name][0], bound)
+            return
+
+    def closed_form(self):
+        """
+        Assignments with the same effect as the whole loop, or None if the body does more than update
+        induction variables, add them or values the loop doesn't change to other variables, and assign
+        such values, or calls a function, or if the number of iterations isn't known
+        """
+        if self.controlling is None or self.trip_count is None:
+            return None
+        body = self.loop.code_block
+        loop_vars = set(self.assigned)
+        if expression_vars(self.loop.bool_cond) & loop_vars != {self.controlling}:
+            return None
+
+        for stmt in body:
+            if not isinstance(stmt, AssignVarStmt) or stmt.var.return_type != DataTypes.SCALAR or \
+                    self.assigned[stmt.var.var_name] != 1:
+                return None
+            # A call has to run once per iteration, for whatever it prints
+            if calls_function(stmt.evaluation):
+                return None
+
+        trips = self.trip_count
+        final, updates = [], []
+        for position, stmt in enumerate(body):
+            var_name = stmt.var.var_name
+            var = Variable(var_name, DataTypes.SCALAR)
+            if var_name in self.basic:
+                updates.append(AssignVarStmt(var, offset(Variable(var_name, DataTypes.SCALAR), trips * self.basic[var_name][0])))
+                continue
+            # Nothing else may read a variable the loop assigns, as its value depends on the iteration
+            if any(var_name in expression_vars(other.evaluation) for other in body if other is not stmt):
+                return None
+            update = step_update(stmt)
+            if update is None:
+                # The same value every time
+                if expression_vars(stmt.evaluation) & loop_vars:
+                    return None
+                value = stmt.evaluation
+            else:
+                addend, sign = update
+                if isinstance(addend, Constant):
+                    total = Constant(addend.val * trips)
+                elif isinstance(addend, Variable) and addend.var_name in self.basic:
+                    # The sum of an arithmetic series, starting from the variable's value at the update
+                    step, update_position = self.basic[addend.var_name]
+                    first = step if update_position < position else 0
+                    total = offset(scale(Variable(addend.var_name, DataTypes.SCALAR), trips),
+                                   first * trips + step * trips * (trips - 1) // 2)
+                elif isinstance(addend, Variable) and addend.var_name not in loop_vars:
+                    total = scale(Variable(addend.var_name, DataTypes.SCALAR), trips)
+                else:
+                    return None
+                value = ArithmeticExpr('+' if sign == 1 else '-', Variable(var_name, DataTypes.SCALAR), total)
+            final.append(AssignVarStmt(var, value))
+
+        if trips == 0:
+            return []
+        # Every value above is worked out from the values on entry, so the induction variables go last
+        return final + updates
@@ -0,0 +1,88 @@
+from CFG import *
+from optimizations.analysis.control_flow import expression_vars, stmt_defs, stmt_uses
+
+
+class ModRef:
+    """
+        Names of the variables a statement or block may assign (mod) and may read (ref), through every
+        block nested in it. Calls only read their arguments: functions run in their own variables, so
+        their code only counts towards their own summary (see function_summary)
+    """
+    __slots__ = ('mod', 'ref')
+
+    def __init__(self, mod, ref):
+        self.mod = mod
+        self.ref = ref
+
+
+EMPTY = ModRef(frozenset(), frozenset())
+
+
+def summary(node):
+    """
+        ModRef of a statement. Those of IfElseBlocks and WhileBlocks are cached on them, so asking again
+        costs nothing, and a new one is made from the cached summaries of the blocks inside. A pass that
+        changes the blocks of a node or the expressions in them calls invalidate on it. Defining a
+        function reads and writes nothing
+    """
+    if isinstance(node, (IfElseBlock, WhileBlock)):
+        try:
+            return node._mod_ref
+        except AttributeError:
+            pass
+        mod, ref = set(), expression_vars(node.bool_cond)
+        if isinstance(node, IfElseBlock):
+            add_block(node.true_block, mod, ref)
+            add_block(node.false_block, mod, ref)
+        else:
+            add_block(node.code_block, mod, ref)
+        node._mod_ref = ModRef(frozenset(mod), frozenset(ref))
+        return node._mod_ref
+    if isinstance(node, FunctionDef):
+        return EMPTY
+    return ModRef(stmt_defs(node), stmt_uses(node))
+
+
+def function_summary(func):
+    """
+    ModRef of the code of FunctionDef func, cached on it like summary's
+    """
+    try:
+        return func._mod_ref
+    except AttributeError:
+        pass
+    mod, ref = set(), set()
+    add_block(func.code_block, mod, ref)
+    func._mod_ref = ModRef(frozenset(mod), frozenset(ref))
+    return func._mod_ref
+
+
+def block_summary(code_block):
+    """
+    ModRef of a list of statements, like CfgGenerator.program. Lists can't hold it, so it isn't cached
+    """
+    mod, ref = set(), set()
+    add_block(code_block, mod, ref)
+    return ModRef(mod, ref)
+
+
+def add_block(code_block, mod, ref):
+    for node in code_block:
+        if isinstance(node, (IfElseBlock, WhileBlock)):
+            node_summary = summary(node)
+            mod |= node_summary.mod
+            ref |= node_summary.ref
+        elif not isinstance(node, FunctionDef):
+            mod |= stmt_defs(node)
+            ref |= stmt_uses(node)
+
+
+def invalidate(node):
+    """
+    Drops the summary cached on node, after its blocks or their expressions changed. The nodes around it
+    have to be invalidated too
+    """
+    try:
+        del node._mod_ref
+    except AttributeError:
+        pass
@@ -0,0 +1,124 @@
+from CFG import *
+from optimizations.analysis.dominators import Dominators
+
+MISSING = object()
+
+
+class ValueNumbering:
+    """
+        Dominator-based global value numbering of the scalar ArithmeticExprs of a ControlFlowGraph and of
+        its functions' graphs. Two expressions get the same number when they apply the same operator to
+        operands with the same numbers, either way round for + and *. A variable that may have been
+        assigned on the way into a join or loop header gets a fresh number there.
+        reuse maps id(expr) to an earlier expression with the same number that is evaluated on every path
+        to it, so its result can be used instead, and targets holds the ids of those earlier expressions.
+    """
+    def __init__(self, graph):
+        self.reuse = {}
+        self.targets = set()
+        self.next_number = 0
+        self.number_graph(graph)
+
+    def new_number(self):
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def number_graph(self, graph):
+        for function_graph in graph.function_graphs.values():
+            self.number_graph(function_graph)
+
+        dominators = Dominators(graph)
+        self.var_numbers = {}
+        self.available = {}  # expression key -> (number, first expression with it)
+        self.constant_numbers = {}
+        # Changes to var_numbers and available, undone when leaving a block's dominator subtree
+        self.undo = []
+        stack = [(graph.entry, None)]
+        while stack:
+            block, mark = stack.pop()
+            if mark is not None:
+                self.rollback(mark)
+                continue
+            stack.append((block, len(self.undo)))
+            self.number_block(block, dominators)
+            for child in reversed(dominators.children[block.index]):
+                stack.append((child, None))
+
+    def set(self, table, key, value):
+        self.undo.append((table, key, table.get(key, MISSING)))
+        table[key] = value
+
+    def rollback(self, mark):
+        while len(self.undo) > mark:
+            table, key, value = self.undo.pop()
+            if value is MISSING:
+                del table[key]
+            else:
+                table[key] = value
+
+    def region_defs(self, block, idom):
+        """
+        Variables assigned on some path from idom to block
+        """
+        defined = set()
+        stack = [pred for pred in block.predecessors if pred is not idom]
+        seen = set(pred.index for pred in stack)
+        while stack:
+            pred = stack.pop()
+            defined |= pred.defs()
+            for source in pred.predecessors:
+                if source is not idom and source.index not in seen:
+                    seen.add(source.index)
+                    stack.append(source)
+        return defined
+
+    def number_block(self, block, dominators):
+        idom = dominators.idom[block.index]
+        if idom is not None and block.predecessors != [idom]:
+            for var_name in self.region_defs(block, idom):
+                self.set(self.var_numbers, var_name, self.new_number())
+        for stmt in block.stmts:
+            if isinstance(stmt, AssignStmt):
+                number = self.number(stmt.evaluation)
+                if stmt.var.return_type == DataTypes.ARRAY:
+                    number = self.new_number()
+                self.set(self.var_numbers, stmt.var.var_name, number)
+            elif isinstance(stmt, UpdateArrayIndexStmt):
+                self.number(stmt.evaluation)
+                self.set(self.var_numbers, stmt.var.var_name, self.new_number())
+            elif isinstance(stmt, ReturnStmt):
+                self.number(stmt.evaluation)
+        if block.branch is not None:
+            self.number(block.branch.bool_cond.lhs)
+            self.number(block.branch.bool_cond.rhs)
+
+    def number(self, node):
+        if isinstance(node, Constant):
+            if node.return_type == DataTypes.ARRAY:
+                return self.new_number()
+            if node.val not in self.constant_numbers:
+                self.constant_numbers[node.val] = self.new_number()
+            return self.constant_numbers[node.val]
+        if isinstance(node, Variable):
+            if node.var_name not in self.var_numbers:
+                # Read before being assigned here, but it holds the same value until it is
+                self.set(self.var_numbers, node.var_name, self.new_number())
+            return self.var_numbers[node.var_name]
+        if isinstance(node, ArithmeticExpr):
+            op1, op2 = self.number(node.op1), self.number(node.op2)
+            if node.return_type == DataTypes.ARRAY:
+                return self.new_number()
+            key = (node.op, min(op1, op2), max(op1, op2)) if node.op in '+*' else (node.op, op1, op2)
+            if key in self.available:
+                number, earlier = self.available[key]
+                self.reuse[id(node)] = earlier
+                self.targets.add(id(earlier))
+                return number
+            number = self.new_number()
+            self.set(self.available, key, (number, node))
+            return number
+        if isinstance(node, FuncCall):
+            for arg in node.args:
+                self.number(arg)
+        return self.new_number()
@@ -0,0 +1,50 @@
+from opcodes import instr_defs, instr_uses
+from optimizations.bytecode.liveness import Liveness
+from optimizations.opt_pass import OptPass
+
+# Instructions that do nothing but write their destinations. AMOV only marks the array shared, and
+# ASTORE changes an array no other register holds (see arrays.py). Array arithmetic is left out, as
+# arrays of different lengths make it fail at run time
+REMOVABLE = {'SET', 'ADD', 'SUB', 'MUL', 'ADDI', 'CMP_EQ', 'CMP_GT', 'MOV2', 'ANEW', 'AMOV', 'ASTORE'}
+
+
+class DeadCodeElimination(OptPass):
+    """
+        Removes instructions whose results are never read: dead stores to variables and unused
+        temporaries. Liveness is solved over the whole flow graph, back edges included, and only
+        instructions without side effects are candidates, so DEBUG_PRINT and CALL always stay.
+        Walking each block backwards, a removed instruction's operands aren't made live, so chains of
+        dead instructions in a block go at once; the analysis is repeated for chains across blocks.
+    """
+    def __init__(self):
+        super().__init__()
+        self.removed = 0
+        self.iterations = 0
+
+    def run_pass(self, bytecode, live_at_exit=(), liveness=None):
+        """
+        :param live_at_exit: registers whose values must survive until the end of the program
+        :param liveness: Liveness of bytecode for live_at_exit, if it has been worked out already
+        :return: bytecode without its dead instructions
+        """
+        super().run_pass(bytecode)
+        while True:
+            self.iterations += 1
+            if liveness is None:
+                liveness = Liveness(bytecode, live_at_exit=live_at_exit)
+            dead = set()
+            for block in liveness.graph.blocks:
+                live = set(liveness.live_out[block.index])
+                for idx in range(block.end - 1, block.start - 1, -1):
+                    instr = bytecode[idx]
+                    defs = instr_defs(instr)
+                    if instr[0] in REMOVABLE and not any(reg in live for reg in defs):
+                        dead.add(idx)
+                        continue
+                    live.difference_update(defs)
+                    live.update(instr_uses(instr))
+            if not dead:
+                return bytecode
+            self.removed += len(dead)
+            bytecode = [instr for idx, instr in enumerate(bytecode) if idx not in dead]
+            liveness = None
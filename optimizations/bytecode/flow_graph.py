@@ -0,0 +1,66 @@
+from opcodes import *
+
+
+class BasicBlock:
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start  # position of the first instruction in the bytecode list
+        self.end = end      # one past the last instruction
+        self.successors = []
+        self.predecessors = []
+
+
+class FlowGraph:
+    """
+        Basic blocks of a tuple bytecode list. A block starts at a LABEL or FUNC or right after a jump,
+        RET or HALT. Function sections aren't linked to the main program: to the caller, a CALL is an
+        ordinary instruction that reads its arguments and writes its result
+    """
+    def __init__(self, bytecode):
+        self.bytecode = bytecode
+        self.blocks = []
+        self.label_blocks = {}
+        self.build_blocks()
+        self.link_blocks()
+
+    def build_blocks(self):
+        block_start = 0
+        for idx, instr in enumerate(self.bytecode):
+            cmd = instr[0]
+            if cmd in PSEUDO_INSTRUCTIONS:
+                if idx > block_start:
+                    self.add_block(block_start, idx)
+                    block_start = idx
+                self.label_blocks[instr[1]] = len(self.blocks)
+            elif cmd in CONDITIONAL_JUMPS or cmd in UNCONDITIONAL_JUMPS or cmd in EXITS:
+                self.add_block(block_start, idx + 1)
+                block_start = idx + 1
+        if block_start < len(self.bytecode):
+            self.add_block(block_start, len(self.bytecode))
+        for label, block_idx in self.label_blocks.items():
+            self.label_blocks[label] = self.blocks[block_idx]
+
+    def add_block(self, start, end):
+        self.blocks.append(BasicBlock(len(self.blocks), start, end))
+
+    def link_blocks(self):
+        for block in self.blocks:
+            last = self.bytecode[block.end - 1]
+            if last[0] in CONDITIONAL_JUMPS or last[0] in UNCONDITIONAL_JUMPS:
+                self.add_edge(block, self.label_blocks[instr_label(last)])
+            if last[0] not in UNCONDITIONAL_JUMPS and last[0] not in EXITS and block.index + 1 < len(self.blocks):
+                self.add_edge(block, self.blocks[block.index + 1])
+
+    def add_edge(self, src, dest):
+        if dest not in src.successors:
+            src.successors.append(dest)
+            dest.predecessors.append(src)
+
+    def exits_program(self, block):
+        """
+        True if execution can run off the end of the program from this block
+        """
+        last = self.bytecode[block.end - 1]
+        if last[0] == 'HALT':
+            return True
+        return block.index == len(self.blocks) - 1 and last[0] not in UNCONDITIONAL_JUMPS and last[0] not in EXITS
@@ -0,0 +1,65 @@
+from opcodes import instr_defs, instr_uses
+from optimizations.bytecode.flow_graph import FlowGraph
+
+
+class Liveness:
+    """
+        Backward liveness of registers over the basic blocks of a tuple bytecode list.
+        live_in and live_out are indexed by block index. Registers in untracked are left out of the
+        analysis altogether, which keeps the sets small when the caller already knows their fate.
+    """
+    def __init__(self, bytecode, live_at_exit=(), graph=None, untracked=()):
+        self.bytecode = bytecode
+        self.graph = graph if graph is not None else FlowGraph(bytecode)
+        self.untracked = set(untracked)
+        self.live_at_exit = set(live_at_exit) - self.untracked
+        self.live_in = [set() for _ in self.graph.blocks]
+        self.live_out = [set() for _ in self.graph.blocks]
+        self.solve()
+
+    def block_use_def(self, block):
+        used, defined = set(), set()
+        for idx in range(block.start, block.end):
+            instr = self.bytecode[idx]
+            for reg in instr_uses(instr):
+                if reg not in defined:
+                    used.add(reg)
+            defined.update(instr_defs(instr))
+        return used - self.untracked, defined - self.untracked
+
+    def solve(self):
+        blocks = self.graph.blocks
+        use_def = [self.block_use_def(block) for block in blocks]
+        worklist = list(blocks)
+        queued = set(block.index for block in blocks)
+        while worklist:
+            block = worklist.pop()
+            queued.discard(block.index)
+
+            live_out = set()
+            if self.graph.exits_program(block):
+                live_out |= self.live_at_exit
+            for succ in block.successors:
+                live_out |= self.live_in[succ.index]
+            used, defined = use_def[block.index]
+            live_in = used | (live_out - defined)
+
+            self.live_out[block.index] = live_out
+            if live_in != self.live_in[block.index]:
+                self.live_in[block.index] = live_in
+                for pred in block.predecessors:
+                    if pred.index not in queued:
+                        queued.add(pred.index)
+                        worklist.append(pred)
+
+    def walk_backward(self, block):
+        """
+        Yields (position, instr, live) for every instruction of block from last to first, where live is
+        the set of registers live right after the instruction. The set is reused between steps.
+        """
+        live = set(self.live_out[block.index])
+        for idx in range(block.end - 1, block.start - 1, -1):
+            instr = self.bytecode[idx]
+            yield idx, instr, live
+            live.difference_update(instr_defs(instr))
+            live.update(reg for reg in instr_uses(instr) if reg not in self.untracked)
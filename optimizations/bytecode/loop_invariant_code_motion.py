@@ -0,0 +1,138 @@
+from collections import Counter
+
+from opcodes import *
+from optimizations.bytecode.flow_graph import FlowGraph
+from optimizations.bytecode.liveness import Liveness
+from optimizations.opt_pass import OptPass
+
+# Scalar instructions that only write their destination and can't fail, so running one an extra time
+# before the loop is harmless. Array instructions make new arrays that ASTORE could change in place
+HOISTABLE = {'SET', 'ADD', 'SUB', 'MUL', 'ADDI', 'CMP_EQ', 'CMP_GT'}
+
+
+class Loop:
+    """
+        A loop of the flow graph: the blocks from header to latch, where the latch jumps back to the header.
+        mod counts the definitions of each register in the loop
+    """
+    def __init__(self, bytecode, graph, header, latch):
+        self.header = header
+        self.blocks = graph.blocks[header.index:latch.index + 1]
+        self.start, self.end = header.start, latch.end
+        self.mod = Counter()
+        for idx in range(self.start, self.end):
+            self.mod.update(instr_defs(bytecode[idx]))
+
+    def contains(self, block):
+        return self.header.index <= block.index <= self.blocks[-1].index
+
+    def has_preheader(self, bytecode, graph):
+        """
+        True if the loop is only entered by falling into its header from the block before, so code
+        placed in front of the header's LABEL runs once before the loop
+        """
+        if bytecode[self.start][0] != 'LABEL' or self.header.index == 0:
+            return False
+        before = graph.blocks[self.header.index - 1]
+        last = bytecode[before.end - 1]
+        if last[0] in UNCONDITIONAL_JUMPS or last[0] in EXITS or instr_label(last) == bytecode[self.start][1]:
+            return False
+        for block in self.blocks:
+            for pred in block.predecessors:
+                if not self.contains(pred) and not (block is self.header and pred is before):
+                    return False
+        return True
+
+
+class LoopInvariantCodeMotion(OptPass):
+    """
+        Moves computations whose operands don't change in a loop, constant loads included, in front of
+        the loop's header, so they run once instead of on every iteration. An instruction is hoisted when
+        the loop's mod summary shows that none of its operands are written in the loop (or only by
+        instructions hoisted already), its destination is written nowhere else in the loop, and the
+        destination's value isn't read before it in the loop or after the loop. Inner loops go first, so
+        an invariant of several nested loops ends up in front of the outermost one.
+        Expects bytecode straight from BytecodeGenerator, before register allocation.
+    """
+    def __init__(self):
+        super().__init__()
+        self.loops = 0
+        self.hoisted = 0
+
+    def find_loops(self, bytecode, graph):
+        latches = {}
+        for block in graph.blocks:
+            last = bytecode[block.end - 1]
+            if last[0] in CONDITIONAL_JUMPS or last[0] in UNCONDITIONAL_JUMPS:
+                header = graph.label_blocks[instr_label(last)]
+                if header.index <= block.index:
+                    latches[header.index] = max(latches.get(header.index, block.index), block.index)
+        loops = [Loop(bytecode, graph, graph.blocks[header], graph.blocks[latch]) for header, latch in latches.items()]
+        loops.sort(key=lambda loop: loop.end - loop.start)
+        return loops
+
+    def live_after(self, loop, liveness):
+        """
+        Registers that can be read once the loop has been left
+        """
+        live = set()
+        for block in loop.blocks:
+            for succ in block.successors:
+                if not loop.contains(succ):
+                    live |= liveness.live_in[succ.index]
+            if liveness.graph.exits_program(block):
+                live |= liveness.live_at_exit
+        return live
+
+    def invariants(self, bytecode, loop, liveness):
+        """
+        Positions of the instructions of loop that can be hoisted out of it
+        """
+        blocked = liveness.live_in[loop.header.index] | self.live_after(loop, liveness)
+        hoisted, hoisted_regs = set(), set()
+        changed = True
+        while changed:
+            changed = False
+            for idx in range(loop.start, loop.end):
+                instr = bytecode[idx]
+                if idx in hoisted or instr[0] not in HOISTABLE:
+                    continue
+                dest = instr[1]
+                if loop.mod[dest] != 1 or dest in blocked:
+                    continue
+                if all(loop.mod[reg] == 0 or reg in hoisted_regs for reg in instr_uses(instr)):
+                    hoisted.add(idx)
+                    hoisted_regs.add(dest)
+                    changed = True
+        return hoisted
+
+    def run_pass(self, bytecode, live_at_exit=(), liveness=None):
+        """
+        :param live_at_exit: registers whose values must survive until the end of the program
+        :param liveness: Liveness of bytecode for live_at_exit, if it has been worked out already
+        :return: bytecode with invariant instructions moved in front of their loops
+        """
+        super().run_pass(bytecode)
+
+        if liveness is None:
+            liveness = Liveness(bytecode, live_at_exit=live_at_exit, graph=FlowGraph(bytecode))
+        graph = liveness.graph
+        # Position of the header each hoisted instruction now goes in front of
+        destination = {}
+        for loop in self.find_loops(bytecode, graph):
+            if not loop.has_preheader(bytecode, graph):
+                continue
+            self.loops += 1
+            for idx in self.invariants(bytecode, loop, liveness):
+                destination[idx] = loop.start
+
+        self.hoisted += len(destination)
+        moved = {}
+        for idx in sorted(destination):
+            moved.setdefault(destination[idx], []).append(bytecode[idx])
+        result = []
+        for idx, instr in enumerate(bytecode):
+            result += moved.get(idx, [])
+            if idx not in destination:
+                result.append(instr)
+        return result
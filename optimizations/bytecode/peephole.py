@@ -0,0 +1,148 @@
+from opcodes import CONDITIONAL_JUMPS, EXITS, PSEUDO_INSTRUCTIONS, UNCONDITIONAL_JUMPS
+from optimizations.opt_pass import OptPass
+
+
+INVERTED_BRANCHES = {
+    'CHK_JMP': 'NCHK_JMP',
+    'NCHK_JMP': 'CHK_JMP',
+    'JMP_GT': 'JMP_NGT',
+    'JMP_NGT': 'JMP_GT',
+    'JMP_EQ': 'JMP_NEQ',
+    'JMP_NEQ': 'JMP_EQ',
+}
+
+
+def is_jump(instr):
+    return instr[0] in CONDITIONAL_JUMPS or instr[0] in UNCONDITIONAL_JUMPS
+
+
+def retarget(instr, label):
+    # Every jump has its label as the last operand
+    return instr[:-1] + (label,)
+
+
+def static_count(bytecode):
+    return sum(1 for instr in bytecode if instr[0] not in PSEUDO_INSTRUCTIONS)
+
+
+class PeepholeOptimizer(OptPass):
+    """
+        Cleans up the jumps BytecodeGenerator emits, repeating until nothing changes:
+            jump threading         a jump to a label followed by JMP M jumps to M instead
+            branch inversion       CHK_JMP c L1; JMP L2; LABEL L1  ->  NCHK_JMP c L2; LABEL L1
+            jump to next           a jump to a label right after it is deleted
+            unreachable code       instructions after a JMP, RET or HALT are deleted up to the next LABEL or FUNC
+            unreferenced labels    LABELs that nothing jumps to are deleted
+        static_before and static_after count instructions, not including LABELs. rewrite_counts records
+        how often each rewrite was applied.
+    """
+    def __init__(self):
+        super().__init__()
+        self.rewrite_counts = {'jump threading': 0, 'branch inversion': 0, 'jump to next': 0,
+                               'unreachable code': 0, 'unreferenced labels': 0}
+        self.static_before = 0
+        self.static_after = 0
+        self.iterations = 0
+
+    def labels_after(self, bytecode, idx):
+        """
+        Labels between idx and the next instruction that isn't a LABEL, and the position of that instruction
+        """
+        labels = set()
+        while idx < len(bytecode) and bytecode[idx][0] == 'LABEL':
+            labels.add(bytecode[idx][1])
+            idx += 1
+        return labels, idx
+
+    def thread_jumps(self, bytecode):
+        positions = {instr[1]: idx for idx, instr in enumerate(bytecode) if instr[0] == 'LABEL'}
+
+        def final_target(label):
+            seen = {label}
+            while True:
+                _, idx = self.labels_after(bytecode, positions[label])
+                if idx == len(bytecode) or bytecode[idx][0] != 'JMP' or bytecode[idx][1] in seen:
+                    return label
+                label = bytecode[idx][1]
+                seen.add(label)
+
+        threaded = []
+        for instr in bytecode:
+            if is_jump(instr) and instr[-1] in positions:
+                target = final_target(instr[-1])
+                if target != instr[-1]:
+                    self.rewrite_counts['jump threading'] += 1
+                    instr = retarget(instr, target)
+            threaded.append(instr)
+        return threaded
+
+    def invert_branches(self, bytecode):
+        inverted = []
+        idx = 0
+        while idx < len(bytecode):
+            instr = bytecode[idx]
+            if instr[0] in INVERTED_BRANCHES and idx + 1 < len(bytecode) and bytecode[idx + 1][0] == 'JMP':
+                labels, _ = self.labels_after(bytecode, idx + 2)
+                if instr[-1] in labels:
+                    self.rewrite_counts['branch inversion'] += 1
+                    inverted.append((INVERTED_BRANCHES[instr[0]],) + instr[1:-1] + (bytecode[idx + 1][1],))
+                    idx += 2
+                    continue
+            inverted.append(instr)
+            idx += 1
+        return inverted
+
+    def remove_jumps_to_next(self, bytecode):
+        kept = []
+        for idx, instr in enumerate(bytecode):
+            # A conditional jump has no effect besides jumping, so it can go as well
+            if is_jump(instr) and instr[-1] in self.labels_after(bytecode, idx + 1)[0]:
+                self.rewrite_counts['jump to next'] += 1
+                continue
+            kept.append(instr)
+        return kept
+
+    def remove_unreachable(self, bytecode):
+        kept = []
+        reachable = True
+        for instr in bytecode:
+            if instr[0] in PSEUDO_INSTRUCTIONS:
+                reachable = True
+            elif not reachable:
+                self.rewrite_counts['unreachable code'] += 1
+                continue
+            kept.append(instr)
+            if instr[0] in UNCONDITIONAL_JUMPS or instr[0] in EXITS:
+                reachable = False
+        return kept
+
+    def remove_unreferenced_labels(self, bytecode):
+        referenced = {instr[-1] for instr in bytecode if is_jump(instr)}
+        kept = []
+        for instr in bytecode:
+            if instr[0] == 'LABEL' and instr[1] not in referenced:
+                self.rewrite_counts['unreferenced labels'] += 1
+                continue
+            kept.append(instr)
+        return kept
+
+    def run_pass(self, bytecode):
+        """
+        :return: the optimised bytecode
+        """
+        super().run_pass(bytecode)
+
+        self.static_before = static_count(bytecode)
+        self.iterations = 0
+        while True:
+            self.iterations += 1
+            before = bytecode
+            bytecode = self.thread_jumps(bytecode)
+            bytecode = self.invert_branches(bytecode)
+            bytecode = self.remove_jumps_to_next(bytecode)
+            bytecode = self.remove_unreachable(bytecode)
+            bytecode = self.remove_unreferenced_labels(bytecode)
+            if bytecode == before:
+                break
+        self.static_after = static_count(bytecode)
+        return bytecode
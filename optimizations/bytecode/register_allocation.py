@@ -0,0 +1,86 @@
+import heapq
+
+from opcodes import instr_defs, instr_uses, rename_registers
+from optimizations.bytecode.liveness import Liveness
+from optimizations.opt_pass import OptPass
+
+
+class LinearScanRegisterAllocator(OptPass):
+    """
+        Maps the virtual registers handed out by BytecodeGenerator onto a dense set of physical
+        registers, reusing a physical register once the live interval of its previous owner has ended
+    """
+    def __init__(self):
+        super().__init__()
+        self.assignment = {}
+        self.virtual_count = 0
+        self.physical_count = 0
+
+    def live_intervals(self, bytecode, liveness):
+        """
+        Interval of positions over which each register is live, holes included
+        """
+        intervals = {}
+
+        def extend(reg, idx):
+            if reg in intervals:
+                start, end = intervals[reg]
+                intervals[reg] = (min(start, idx), max(end, idx))
+            else:
+                intervals[reg] = (idx, idx)
+
+        for block in liveness.graph.blocks:
+            for reg in liveness.live_in[block.index]:
+                extend(reg, block.start)
+            for reg in liveness.live_out[block.index]:
+                extend(reg, block.end - 1)
+        for idx, instr in enumerate(bytecode):
+            for reg in instr_defs(instr) + instr_uses(instr):
+                if reg not in liveness.untracked:
+                    extend(reg, idx)
+        return intervals
+
+    def run_pass(self, bytecode, live_at_exit=()):
+        """
+        :param live_at_exit: registers whose values must survive until the end of the program. These
+                             are given physical registers of their own and left out of the liveness analysis
+        :return: bytecode rewritten to use physical registers
+        """
+        super().run_pass(bytecode)
+
+        assignment = {}
+        physical_count = 0
+        pinned = set()
+        for instr in bytecode:
+            for reg in instr_defs(instr) + instr_uses(instr):
+                if reg in live_at_exit and reg not in assignment:
+                    assignment[reg] = 'REG_' + str(physical_count)
+                    physical_count += 1
+                    pinned.add(reg)
+        # Registers the code never touches, like an input nothing reads any more, still need a slot of
+        # their own, or keeping their virtual names would collide with a physical register
+        for reg in sorted(set(live_at_exit) - pinned, key=lambda reg: (len(reg), reg)):
+            assignment[reg] = 'REG_' + str(physical_count)
+            physical_count += 1
+            pinned.add(reg)
+
+        liveness = Liveness(bytecode, untracked=pinned)
+        intervals = self.live_intervals(bytecode, liveness)
+
+        active = []  # (end of interval, physical register) of the intervals being allocated
+        free = []
+        for reg, (start, end) in sorted(intervals.items(), key=lambda item: item[1][0]):
+            while active and active[0][0] < start:
+                heapq.heappush(free, heapq.heappop(active)[1])
+            if free:
+                physical = heapq.heappop(free)
+            else:
+                physical = physical_count
+                physical_count += 1
+            assignment[reg] = 'REG_' + str(physical)
+            heapq.heappush(active, (end, physical))
+
+        self.assignment = assignment
+        self.virtual_count = len(intervals) + len(pinned)
+        self.physical_count = physical_count
+        return [rename_registers(instr, assignment) for instr in bytecode]
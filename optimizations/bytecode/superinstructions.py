@@ -0,0 +1,99 @@
+from opcodes import instr_defs, instr_uses, is_register
+from optimizations.bytecode.liveness import Liveness
+from optimizations.opt_pass import OptPass
+
+
+FUSED_BRANCHES = {
+    ('CMP_GT', 'CHK_JMP'): 'JMP_GT',
+    ('CMP_GT', 'NCHK_JMP'): 'JMP_NGT',
+    ('CMP_EQ', 'CHK_JMP'): 'JMP_EQ',
+    ('CMP_EQ', 'NCHK_JMP'): 'JMP_NEQ',
+}
+
+
+class SuperinstructionFusion(OptPass):
+    """
+        Replaces common pairs of adjacent instructions with a single instruction:
+            CMP_x c a b; (N)CHK_JMP c L  ->  JMP_(N)x a b L
+            SET t imm; ADD/SUB d a t     ->  ADDI d a (-)imm
+            <op> t ...; SET d t          ->  <op> d ...         (move collapse)
+            <array op> t ...; AMOV d t   ->  <array op> d ...   (move collapse, d doesn't become shared)
+            SET a b; SET c d             ->  MOV2 a b c d       (register moves only)
+        A pair is only fused when the intermediate register t is dead afterwards, so it doesn't matter
+        how else the register is used. pattern_counts records how often each pattern was fused.
+    """
+    def __init__(self):
+        super().__init__()
+        self.pattern_counts = {'compare+branch': 0, 'SET+ADD': 0, 'move collapse': 0, 'SET+SET': 0}
+
+    def is_dead_after(self, reg, live_after):
+        return reg not in live_after and reg not in self.pinned
+
+    def fuse(self, first, second, live_after):
+        """
+        Single instruction equivalent to first followed by second, or None
+        :param live_after: registers live after second
+        """
+        cmd1, cmd2 = first[0], second[0]
+        if (cmd1, cmd2) in FUSED_BRANCHES:
+            cmp_reg = first[1]
+            if second[1] == cmp_reg and self.is_dead_after(cmp_reg, live_after):
+                self.pattern_counts['compare+branch'] += 1
+                return (FUSED_BRANCHES[(cmd1, cmd2)], first[2], first[3], second[2])
+
+        if cmd1 == 'SET' and not is_register(first[2]) and cmd2 in ('ADD', 'SUB'):
+            tmp, imm = first[1], first[2]
+            dest, src1, src2 = second[1:4]
+            if self.is_dead_after(tmp, live_after) and isinstance(imm, int):
+                if src2 == tmp and src1 != tmp:
+                    self.pattern_counts['SET+ADD'] += 1
+                    return ('ADDI', dest, src1, imm if cmd2 == 'ADD' else -imm)
+                if cmd2 == 'ADD' and src1 == tmp and src2 != tmp:
+                    self.pattern_counts['SET+ADD'] += 1
+                    return ('ADDI', dest, src2, imm)
+
+        if (cmd2 == 'SET' and cmd1 in ('SET', 'ADD', 'SUB', 'MUL', 'ADDI', 'CALL')) or \
+                (cmd2 == 'AMOV' and cmd1 in ('ANEW', 'AADD', 'ASUB', 'AMUL')):
+            tmp = first[1]
+            if second[2] == tmp and second[1] != tmp and self.is_dead_after(tmp, live_after):
+                self.pattern_counts['move collapse'] += 1
+                return (cmd1, second[1]) + tuple(first[2:])
+
+        if cmd1 == 'SET' and cmd2 == 'SET' and is_register(first[2]) and is_register(second[2]):
+            self.pattern_counts['SET+SET'] += 1
+            return ('MOV2',) + tuple(first[1:]) + tuple(second[1:])
+        return None
+
+    def run_pass(self, bytecode, live_at_exit=()):
+        """
+        :param live_at_exit: registers whose values must survive until the end of the program. These are
+                             never treated as dead.
+        :return: the fused bytecode
+        """
+        super().run_pass(bytecode)
+
+        self.pinned = set(live_at_exit)
+        liveness = Liveness(bytecode, untracked=self.pinned)
+        fused = []
+        for block in liveness.graph.blocks:
+            # Walk backwards so that the liveness after each instruction is at hand, keeping
+            # (instr, live after instr) pairs of the block in reverse order
+            block_instrs = []
+            live = set(liveness.live_out[block.index])
+            for idx in range(block.end - 1, block.start - 1, -1):
+                instr = bytecode[idx]
+                if block_instrs and instr[0] != 'LABEL':
+                    next_instr, next_live = block_instrs[-1]
+                    combined = self.fuse(instr, next_instr, next_live)
+                    if combined is not None:
+                        block_instrs[-1] = (combined, next_live)
+                        instr = combined
+                        live = set(next_live)
+                        live.difference_update(instr_defs(instr))
+                        live.update(instr_uses(instr))
+                        continue
+                block_instrs.append((instr, set(live)))
+                live.difference_update(instr_defs(instr))
+                live.update(instr_uses(instr))
+            fused.extend(instr for instr, _ in reversed(block_instrs))
+        return fused
@@ -0,0 +1,239 @@
+from arrays import wrap_element
+from CFG import *
+from optimizations.analysis.control_flow import ControlFlowGraph
+from optimizations.analysis.dataflow import DataflowAnalysis
+from optimizations.analysis.mod_ref import invalidate
+from optimizations.cfg.removed_vars import declare_removed_vars
+from optimizations.opt_pass import OptPass
+
+
+def evaluate(node, state):
+    """
+    Value of an Evaluatable given the constant variables in state: an int, a tuple for an array, or None
+    if it isn't known at compile time
+    """
+    if isinstance(node, Constant):
+        return tuple(node.val) if node.return_type == DataTypes.ARRAY else node.val
+    if isinstance(node, Variable):
+        return state.get(node.var_name)
+    if isinstance(node, ArithmeticExpr):
+        op1, op2 = evaluate(node.op1, state), evaluate(node.op2, state)
+        if op1 is None or op2 is None:
+            return None
+        if node.return_type == DataTypes.ARRAY:
+            # Lengths that differ are left for the interpreter to complain about
+            if len(op1) != len(op2):
+                return None
+            return tuple(wrap_element(calculate(node.op, a, b)) for a, b in zip(op1, op2))
+        return calculate(node.op, op1, op2)
+    return None
+
+
+def calculate(op, a, b):
+    if op == '+':
+        return a + b
+    elif op == '-':
+        return a - b
+    return a * b
+
+
+def decide(bool_cond, state):
+    """
+    :return: True or False if the condition is known at compile time, otherwise None
+    """
+    lhs, rhs = evaluate(bool_cond.lhs, state), evaluate(bool_cond.rhs, state)
+    if not isinstance(lhs, int) or not isinstance(rhs, int):
+        return None
+    if isinstance(bool_cond, CompareEquals):
+        return lhs == rhs
+    if isinstance(bool_cond, CompareLess):
+        return lhs < rhs
+    return lhs > rhs
+
+
+def to_constant(value):
+    if isinstance(value, tuple):
+        # Constant can't hold -128
+        return Constant(list(value)) if all(-127 < item < 128 for item in value) else None
+    return Constant(value)
+
+
+class ConstantStates(DataflowAnalysis):
+    """
+        Variables holding a known value at the start and end of each block, as a dict from name to value.
+        Blocks that can't be reached have None. A branch whose condition is known only passes its state
+        along the edge it takes.
+    """
+    def boundary(self):
+        return {}
+
+    def initial(self):
+        return None
+
+    def meet(self, values):
+        values = [value for value in values if value is not None]
+        if not values:
+            return None
+        state = dict(values[0])
+        for value in values[1:]:
+            for var_name in list(state):
+                if value.get(var_name, None) != state[var_name]:
+                    del state[var_name]
+        return state
+
+    def transfer(self, block, state):
+        if state is None:
+            return None
+        state = dict(state)
+        for stmt in block.stmts:
+            self.step(stmt, state)
+        return state
+
+    def step(self, stmt, state):
+        if isinstance(stmt, AssignStmt):
+            value = evaluate(stmt.evaluation, state)
+            if value is None:
+                state.pop(stmt.var.var_name, None)
+            else:
+                state[stmt.var.var_name] = value
+        elif isinstance(stmt, UpdateArrayIndexStmt):
+            state.pop(stmt.var.var_name, None)
+
+    def edge_value(self, source, target, state):
+        if state is None or source.branch is None:
+            return state
+        taken = decide(source.branch.bool_cond, state)
+        if taken is None or target is source.successors[0 if taken else 1]:
+            return state
+        return None
+
+
+class ConditionalConstantPropagation(OptPass):
+    """
+        Sparse conditional constant propagation over the basic blocks of the program (see
+        optimizations/analysis). Constants only flow along the branches that can be taken, so an
+        IfElseBlock whose condition is known is replaced by the arm that runs, a WhileBlock whose condition
+        is false on entry is removed, and the constants of the surviving arm carry on past it.
+        Expressions with a known value are folded, and known scalar variables are replaced by Constants.
+        Statements that can't be reached, like those after a return, are removed.
+    """
+    def __init__(self):
+        super().__init__()
+        self.removed_branches = 0
+        self.removed_loops = 0
+        self.removed_stmts = 0
+        self.folded = 0
+
+    def run_pass(self, cfg, inputs=(), graph=None):
+        """
+        :param inputs: variables whose values are supplied when the program runs (see
+                       BytecodeGenerator.input_registers)
+        :param graph: ControlFlowGraph of cfg, if one has been built already
+        """
+        super().run_pass(cfg)
+        if graph is None:
+            graph = ControlFlowGraph(cfg)
+        dropped = self.rewrite_graph(graph, cfg)
+        declare_removed_vars(cfg, dropped, inputs)
+        return cfg
+
+    def rewrite_graph(self, graph, code_block):
+        """
+        :return: name -> Variable for the variables assigned in removed code
+        """
+        states = ConstantStates(graph)
+        reachable = set()
+        decisions = {}
+        for block in graph.blocks:
+            state = states.block_in[block.index]
+            if state is None:
+                continue
+            state = dict(state)
+            for stmt in block.stmts:
+                reachable.add(id(stmt))
+                self.fold_stmt(stmt, state)
+                states.step(stmt, state)
+            if block.branch is not None:
+                bool_cond = block.branch.bool_cond
+                decisions[id(block.branch)] = decide(bool_cond, state)
+                bool_cond.lhs = self.fold(bool_cond.lhs, state)
+                bool_cond.rhs = self.fold(bool_cond.rhs, state)
+
+        dropped = {}
+        code_block[:] = self.rewrite(code_block, graph, reachable, decisions, dropped)
+        return dropped
+
+    def fold(self, node, state):
+        if isinstance(node, Constant):
+            return node
+        if isinstance(node, FuncCall):
+            node.args = [self.fold(arg, state) for arg in node.args]
+            return node
+        # Known arrays stay in their variables, which are cheaper to share than to build again
+        if isinstance(node, Variable) and node.return_type == DataTypes.ARRAY:
+            return node
+        value = evaluate(node, state)
+        if value is not None:
+            constant = to_constant(value)
+            if constant is not None:
+                self.folded += 1
+                return constant
+        if isinstance(node, ArithmeticExpr):
+            node.op1 = self.fold(node.op1, state)
+            node.op2 = self.fold(node.op2, state)
+        return node
+
+    def fold_stmt(self, stmt, state):
+        if isinstance(stmt, (AssignStmt, UpdateArrayIndexStmt, ReturnStmt)):
+            stmt.evaluation = self.fold(stmt.evaluation, state)
+
+    def drop(self, code_block, dropped):
+        for node in code_block:
+            self.removed_stmts += 1
+            if isinstance(node, (AssignStmt, UpdateArrayIndexStmt)):
+                dropped[node.var.var_name] = node.var
+            elif isinstance(node, IfElseBlock):
+                self.drop(node.true_block, dropped)
+                self.drop(node.false_block, dropped)
+            elif isinstance(node, WhileBlock):
+                self.drop(node.code_block, dropped)
+
+    def rewrite(self, code_block, graph, reachable, decisions, dropped):
+        stmts = []
+        for node in code_block:
+            if isinstance(node, IfElseBlock):
+                if id(node) not in decisions:
+                    self.drop([node], dropped)
+                    continue
+                taken = decisions[id(node)]
+                if taken is None:
+                    node.true_block = self.rewrite(node.true_block, graph, reachable, decisions, dropped)
+                    node.false_block = self.rewrite(node.false_block, graph, reachable, decisions, dropped)
+                    invalidate(node)
+                    stmts.append(node)
+                    continue
+                self.removed_branches += 1
+                live, dead = (node.true_block, node.false_block) if taken else (node.false_block, node.true_block)
+                self.drop(dead, dropped)
+                stmts += self.rewrite(live, graph, reachable, decisions, dropped)
+            elif isinstance(node, WhileBlock):
+                # The condition is decided on the values from both before the loop and its back edge, so
+                # False means the body never runs
+                if id(node) not in decisions or decisions[id(node)] is False:
+                    if id(node) in decisions:
+                        self.removed_loops += 1
+                    self.drop([node], dropped)
+                    continue
+                node.code_block = self.rewrite(node.code_block, graph, reachable, decisions, dropped)
+                invalidate(node)
+                stmts.append(node)
+            elif isinstance(node, FunctionDef):
+                # Functions don't see the program's variables, so whatever they drop stays theirs
+                self.rewrite_graph(graph.function_graphs[id(node)], node.code_block)
+                invalidate(node)
+                stmts.append(node)
+            elif id(node) in reachable:
+                stmts.append(node)
+            else:
+                self.drop([node], dropped)
+        return stmts
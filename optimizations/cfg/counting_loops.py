@@ -0,0 +1,187 @@
+import copy
+
+from bytecode_generator import subtree_nodes
+from CFG import *
+from optimizations.analysis.control_flow import ControlFlowGraph
+from optimizations.analysis.induction_variables import LoopVariables
+from optimizations.analysis.mod_ref import invalidate
+from optimizations.cfg.conditional_constants import ConstantStates, evaluate, to_constant
+from optimizations.cfg.removed_vars import declare_removed_vars
+from optimizations.opt_pass import OptPass
+
+UNROLL_TRIPS = 8    # loops that run at most this many times are unrolled...
+UNROLL_LIMIT = 60   # ...if the copies of their body hold at most this many CFG nodes between them
+
+
+class CountingLoopOptimizer(OptPass):
+    """
+        Uses the induction variables of WhileBlocks (see optimizations/analysis/induction_variables.py).
+        A loop whose body only updates induction variables and sums is replaced by the values they have
+        when it ends, and a loop that runs a few times known at compile time is unrolled. In the loops
+        that stay, a product of a basic induction variable and a Constant gets a variable of its own, set
+        before the loop and stepped by an addition wherever the induction variable is.
+        Inner loops go first, and the whole program is analysed again while anything changes, as
+        values known after a loop that's gone can decide the number of iterations of the next one.
+    """
+    def __init__(self, unroll_trips=UNROLL_TRIPS, unroll_limit=UNROLL_LIMIT):
+        super().__init__()
+        self.unroll_trips = unroll_trips
+        self.unroll_limit = unroll_limit
+        self.closed_forms = 0
+        self.unrolled = 0
+        self.strength_reduced = 0
+        self.rounds = 0
+
+    def run_pass(self, cfg, inputs=(), graph=None):
+        """
+        :param inputs: variables whose values are supplied when the program runs (see
+                       BytecodeGenerator.input_registers)
+        :param graph: ControlFlowGraph of cfg, if one has been built already
+        """
+        super().run_pass(cfg)
+        removed = {}
+        while True:
+            self.rounds += 1
+            changes = self.closed_forms + self.unrolled + self.strength_reduced
+            if graph is None:
+                graph = ControlFlowGraph(cfg)
+            self.rewrite_graph(graph, cfg, removed)
+            graph = None
+            if changes == self.closed_forms + self.unrolled + self.strength_reduced:
+                break
+        declare_removed_vars(cfg, removed, inputs)
+        return cfg
+
+    def rewrite_graph(self, graph, code_block, removed):
+        self.states = ConstantStates(graph)
+        self.graph = graph
+        code_block[:] = self.rewrite(code_block, removed)
+
+    def rewrite(self, code_block, removed):
+        stmts = []
+        for node in code_block:
+            if isinstance(node, IfElseBlock):
+                node.true_block = self.rewrite(node.true_block, removed)
+                node.false_block = self.rewrite(node.false_block, removed)
+                invalidate(node)
+            elif isinstance(node, WhileBlock):
+                node.code_block = self.rewrite(node.code_block, removed)
+                invalidate(node)
+                if id(node) in self.graph.branch_blocks:
+                    stmts += self.rewrite_loop(node, removed)
+                    continue
+            elif isinstance(node, FunctionDef):
+                graph, states = self.graph, self.states
+                self.rewrite_graph(graph.function_graphs[id(node)], node.code_block, {})
+                self.graph, self.states = graph, states
+                invalidate(node)
+            stmts.append(node)
+        return stmts
+
+    def entry_state(self, loop):
+        head = self.graph.branch_blocks[id(loop)]
+        # The edge into the loop is added before the back edge
+        before = head.predecessors[0]
+        return self.states.edge_value(before, head, self.states.block_out[before.index])
+
+    def rewrite_loop(self, loop, removed):
+        """
+        :return: the statements to put in the place of loop
+        """
+        entry_state = self.entry_state(loop)
+        loop_vars = LoopVariables(loop, entry_state)
+
+        final = loop_vars.closed_form()
+        if final is not None:
+            self.closed_forms += 1
+            for stmt in final:
+                value = evaluate(stmt.evaluation, entry_state)
+                if value is not None:
+                    stmt.evaluation = to_constant(value)
+            for stmt in loop.code_block:
+                removed[stmt.var.var_name] = stmt.var
+            return final
+
+        trips = loop_vars.trip_count
+        if trips is not None and trips <= self.unroll_trips:
+            size = sum(1 for _ in subtree_nodes(loop.code_block))
+            if trips * size <= self.unroll_limit:
+                self.unrolled += 1
+                if trips == 0:
+                    self.drop(loop.code_block, removed)
+                    return []
+                return loop.code_block + [node for _ in range(trips - 1) for node in copy.deepcopy(loop.code_block)]
+
+        return self.reduce_strength(loop, loop_vars)
+
+    def drop(self, code_block, removed):
+        for node in code_block:
+            if isinstance(node, (AssignStmt, UpdateArrayIndexStmt)):
+                removed[node.var.var_name] = node.var
+            elif isinstance(node, IfElseBlock):
+                self.drop(node.true_block, removed)
+                self.drop(node.false_block, removed)
+            elif isinstance(node, WhileBlock):
+                self.drop(node.code_block, removed)
+
+    def reduce_strength(self, loop, loop_vars):
+        """
+        :return: the assignments of the products' variables, then loop
+        """
+        products = {}  # (var_name, factor) -> Variable holding the product
+        loop.bool_cond.lhs = self.replace_products(loop.bool_cond.lhs, loop_vars, products)
+        loop.bool_cond.rhs = self.replace_products(loop.bool_cond.rhs, loop_vars, products)
+        self.replace_in_block(loop.code_block, loop_vars, products)
+        if not products:
+            return [loop]
+
+        self.strength_reduced += len(products)
+        inits = []
+        steps = {}
+        for (var_name, factor), product in products.items():
+            inits.append(AssignVarStmt(product, ArithmeticExpr('*', Variable(var_name, DataTypes.SCALAR), Constant(factor))))
+            step = loop_vars.basic[var_name][0] * factor
+            steps.setdefault(var_name, []).append(
+                AssignVarStmt(product, ArithmeticExpr('+', Variable(product.var_name, DataTypes.SCALAR), Constant(step))))
+        body = []
+        for stmt in loop.code_block:
+            body.append(stmt)
+            if isinstance(stmt, AssignVarStmt):
+                body += steps.get(stmt.var.var_name, [])
+        loop.code_block = body
+        return inits + [loop]
+
+    def replace_in_block(self, code_block, loop_vars, products):
+        for node in code_block:
+            if isinstance(node, (AssignStmt, UpdateArrayIndexStmt, ReturnStmt)):
+                node.evaluation = self.replace_products(node.evaluation, loop_vars, products)
+            elif isinstance(node, IfElseBlock):
+                node.bool_cond.lhs = self.replace_products(node.bool_cond.lhs, loop_vars, products)
+                node.bool_cond.rhs = self.replace_products(node.bool_cond.rhs, loop_vars, products)
+                self.replace_in_block(node.true_block, loop_vars, products)
+                self.replace_in_block(node.false_block, loop_vars, products)
+                invalidate(node)
+            elif isinstance(node, WhileBlock):
+                node.bool_cond.lhs = self.replace_products(node.bool_cond.lhs, loop_vars, products)
+                node.bool_cond.rhs = self.replace_products(node.bool_cond.rhs, loop_vars, products)
+                self.replace_in_block(node.code_block, loop_vars, products)
+                invalidate(node)
+
+    def replace_products(self, node, loop_vars, products):
+        if isinstance(node, FuncCall):
+            node.args = [self.replace_products(arg, loop_vars, products) for arg in node.args]
+            return node
+        if not isinstance(node, ArithmeticExpr):
+            return node
+        node.op1 = self.replace_products(node.op1, loop_vars, products)
+        node.op2 = self.replace_products(node.op2, loop_vars, products)
+        if node.op != '*' or node.return_type != DataTypes.SCALAR:
+            return node
+        for var, factor in [(node.op1, node.op2), (node.op2, node.op1)]:
+            if isinstance(var, Variable) and var.var_name in loop_vars.basic and isinstance(factor, Constant):
+                key = (var.var_name, factor.val)
+                if key not in products:
+                    # Not a name the frontend accepts, so it can't clash with the program's variables
+                    products[key] = Variable('{}*{}'.format(var.var_name, factor.val), DataTypes.SCALAR)
+                return Variable(products[key].var_name, DataTypes.SCALAR)
+        return node
@@ -0,0 +1,106 @@
+from CFG import *
+from optimizations.analysis.control_flow import ControlFlowGraph, expression_vars, stmt_defs, stmt_uses
+from optimizations.analysis.dataflow import LiveVariables
+from optimizations.analysis.mod_ref import block_summary, invalidate
+from optimizations.cfg.removed_vars import declare_removed_vars
+from optimizations.opt_pass import OptPass
+
+
+def calls_function(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, FuncCall):
+            return True
+        if isinstance(node, ArithmeticExpr):
+            stack += [node.op1, node.op2]
+    return False
+
+
+class DeadStoreElimination(OptPass):
+    """
+        Removes assignments whose value is never read, found by backward liveness over the basic-block
+        graph (see optimizations/analysis). Liveness flows around the back edge of a WhileBlock, so a store
+        read on the next iteration stays. Assignments from function calls stay too, since the function
+        may print. Removing a store can leave the stores its value was computed from dead, so the
+        analysis runs again until nothing changes.
+    """
+    def __init__(self):
+        super().__init__()
+        self.removed = 0
+        self.iterations = 0
+
+    def run_pass(self, cfg, live_at_exit=None, inputs=(), graph=None):
+        """
+        :param live_at_exit: variables whose final values are wanted, all of them by default
+        :param inputs: variables whose values are supplied when the program runs (see
+                       BytecodeGenerator.input_registers)
+        :param graph: ControlFlowGraph of cfg, if one has been built already
+        """
+        super().run_pass(cfg)
+        if live_at_exit is None:
+            live_at_exit = block_summary(cfg).mod
+
+        removed_vars = {}
+        while True:
+            self.iterations += 1
+            dead = set()
+            if graph is None:
+                graph = ControlFlowGraph(cfg)
+            liveness = self.find_dead(graph, live_at_exit, dead)
+            if not dead:
+                break
+            self.removed += len(dead)
+            self.remove(cfg, dead, removed_vars)
+            graph = None
+        declare_removed_vars(cfg, removed_vars, inputs, liveness.block_in[graph.entry.index])
+        return cfg
+
+    def find_dead(self, graph, live_at_exit, dead):
+        """
+        Adds the ids of the dead stores of graph, and of its functions' graphs, to dead
+        :return: the LiveVariables of graph
+        """
+        for function_graph in graph.function_graphs.values():
+            self.find_dead(function_graph, (), dead)
+        liveness = LiveVariables(graph, live_at_exit)
+        for block in graph.blocks:
+            live = set(liveness.block_out[block.index])
+            if block.branch is not None:
+                live |= expression_vars(block.branch.bool_cond)
+            for stmt in reversed(block.stmts):
+                if isinstance(stmt, (AssignStmt, UpdateArrayIndexStmt)) and stmt.var.var_name not in live and \
+                        not calls_function(stmt.evaluation):
+                    # Its own reads don't keep anything alive
+                    dead.add(id(stmt))
+                    continue
+                live -= stmt_defs(stmt)
+                live |= stmt_uses(stmt)
+        return liveness
+
+    def remove(self, code_block, dead, removed_vars):
+        """
+        :return: whether anything was removed from code_block or the blocks inside it
+        """
+        stmts = []
+        removed = False
+        for node in code_block:
+            if id(node) in dead:
+                removed_vars[node.var.var_name] = node.var
+                removed = True
+                continue
+            changed = False
+            if isinstance(node, IfElseBlock):
+                changed = self.remove(node.true_block, dead, removed_vars)
+                changed = self.remove(node.false_block, dead, removed_vars) or changed
+            elif isinstance(node, WhileBlock):
+                changed = self.remove(node.code_block, dead, removed_vars)
+            elif isinstance(node, FunctionDef):
+                # Variables of functions are set to 0 on entry when read before being assigned
+                changed = self.remove(node.code_block, dead, {})
+            if changed:
+                invalidate(node)
+                removed = True
+            stmts.append(node)
+        code_block[:] = stmts
+        return removed
@@ -1,4 +1,6 @@
+from arrays import wrap_element
 from CFG import *
+from optimizations.analysis.mod_ref import invalidate, summary
 from optimizations.opt_pass import OptPass
 
 
@@ -7,7 +9,6 @@ class PropagateConstants(OptPass):
         super().__init__()
         self.const_table = {}
         self.scope_stack = [set()]
-        self.function_vars_table = {}
 
     def deepen_scope_level(self):
         self.scope_stack.append(set())
@@ -18,13 +19,21 @@ class PropagateConstants(OptPass):
             self.pop_var(var_name)
 
     def push_var(self, var_name, const_node):
+        # A scope pops each of its variables once, so assigning one again replaces its constant
+        if var_name in self.scope_stack[-1] and var_name in self.const_table:
+            self.const_table[var_name][-1] = const_node
+            return
         self.scope_stack[-1].add(var_name)
         if var_name not in self.const_table.keys():
             self.const_table[var_name] = []
         self.const_table[var_name].append(const_node)
 
     def pop_var(self, var_name):
-        return self.const_table[var_name].pop()
+        # Gone already if it was invalidated in a block inside the scope
+        if var_name in self.const_table:
+            self.const_table[var_name].pop()
+            if not self.const_table[var_name]:
+                del self.const_table[var_name]
 
     def invalidate_var(self, var_name):
         if var_name in self.scope_stack[-1]:
@@ -41,9 +50,25 @@ class PropagateConstants(OptPass):
                 const_node = self.const_table[evaluation.var_name][-1]
                 node.evaluation = const_node
                 node = self.foldAssignVarStmt(node)
+            else:
+                self.invalidate_var(var.var_name)
         elif isinstance(evaluation, ArithmeticExpr):
             node.evaluation = self.foldArithmetixExpr(evaluation)
-            node = self.foldAssignVarStmt(node)
+            if isinstance(node.evaluation, Constant):
+                node = self.foldAssignVarStmt(node)
+            else:
+                self.invalidate_var(var.var_name)
+        elif isinstance(evaluation, FuncCall):
+            node.evaluation = self.foldFuncCall(evaluation)
+            self.invalidate_var(var.var_name)
+        return node
+
+    def foldUpdateArrayIndexStmt(self, node):
+        node.evaluation = self.foldEvaluatable(node.evaluation)
+        if isinstance(node.evaluation, Variable) and node.evaluation.var_name in self.const_table:
+            node.evaluation = self.const_table[node.evaluation.var_name][-1]
+        # The array is changed in place, so whatever constant it held is gone
+        self.invalidate_var(node.var.var_name)
         return node
 
     def foldEvaluatable(self, node):
@@ -61,13 +86,19 @@ class PropagateConstants(OptPass):
                 node.op1 = self.const_table[op1.var_name][-1]
         elif isinstance(op1, ArithmeticExpr):
             node.op1 = self.foldArithmetixExpr(op1)
+        elif isinstance(op1, FuncCall):
+            node.op1 = self.foldFuncCall(op1)
         if isinstance(op2, Variable):
             if op2.var_name in self.const_table.keys():
                 node.op2 = self.const_table[op2.var_name][-1]
         elif isinstance(op2, ArithmeticExpr):
             node.op2 = self.foldArithmetixExpr(op2)
+        elif isinstance(op2, FuncCall):
+            node.op2 = self.foldFuncCall(op2)
 
         if isinstance(node.op1, Constant) and isinstance(node.op2, Constant):
+            if node.return_type == DataTypes.ARRAY:
+                return self.foldArrayArithmetic(node)
             val = None
             if node.op == '+':
                 val = node.op1.val + node.op2.val
@@ -78,64 +109,88 @@ class PropagateConstants(OptPass):
             return Constant(val)
         return node
 
+    def foldArrayArithmetic(self, node):
+        """
+        Element-wise, wrapping like the interpreter's arrays. Left alone if the lengths differ, so the
+        error still happens when the program runs, or if an element ends up outside what a Constant holds
+        """
+        lhs, rhs = node.op1.val, node.op2.val
+        if len(lhs) != len(rhs):
+            return node
+        if node.op == '+':
+            val = [wrap_element(a + b) for a, b in zip(lhs, rhs)]
+        elif node.op == '-':
+            val = [wrap_element(a - b) for a, b in zip(lhs, rhs)]
+        else:
+            val = [wrap_element(a * b) for a, b in zip(lhs, rhs)]
+        if not all(-127 < item < 128 for item in val):
+            return node
+        return Constant(val)
+
     def foldIfElseBlock(self, node):
-        true_block = node.true_block
-        false_block = node.false_block
+        altered_vars = self.get_altered_vars(node)
+        # The condition is evaluated before either block runs
+        bool_cond = node.bool_cond
+        bool_cond.lhs = self.foldEvaluatable(bool_cond.lhs)
+        bool_cond.rhs = self.foldEvaluatable(bool_cond.rhs)
+
         self.deepen_scope_level()
-        self.run_pass(true_block)
+        self.run_pass(node.true_block)
         self.unwind_scope_level()
         self.deepen_scope_level()
-        self.run_pass(false_block)
-        self.deepen_scope_level()
-        altered_vars = self.get_altered_vars(true_block).union( self.get_altered_vars(false_block) )
+        self.run_pass(node.false_block)
+        self.unwind_scope_level()
         for var_name in altered_vars:
             self.invalidate_var(var_name)
-
-        bool_cond = node.bool_cond
-        bool_cond.lhs = self.foldEvaluatable(bool_cond.lhs)
-        bool_cond.rhs = self.foldEvaluatable(bool_cond.rhs)
+        invalidate(node)
         return node
 
     def foldWhileBlock(self, node):
-        code_block = node.code_block
+        # Values from before the loop only hold on its first iteration
+        altered_vars = self.get_altered_vars(node)
+        for var_name in altered_vars:
+            self.invalidate_var(var_name)
         self.deepen_scope_level()
-        self.run_pass(code_block)
+        self.run_pass(node.code_block)
         self.unwind_scope_level()
-        altered_vars = self.get_altered_vars(code_block)
         for var_name in altered_vars:
             self.invalidate_var(var_name)
+        invalidate(node)
         return node
 
     def foldFunctionDef(self, node):
-        altered_vars = self.get_altered_vars(node.code_block)
-        # Allow for dynamic re-defining of functions by just keeping
-        # track of any variables that are defined in function def
-        if node.func_name not in self.function_vars_table.keys():
-            self.function_vars_table[node.func_name] = set()
-        self.function_vars_table[node.func_name].union(altered_vars)
-
-        # Only perform constant propagation for variables defined in the function
-        # foldFuncCall invalidates all vars defined in the func, so no need to
-        # keep track of changes in const_table or scope_stack
+        # Functions only see their own variables, and arguments are passed by value, so constants don't
+        # flow into or out of the code, and calls leave the caller's constants alone (see foldFuncCall)
         scope_stack, const_table = self.scope_stack, self.const_table
-        self.scope_stack, self.const_table = [], {}
+        self.scope_stack, self.const_table = [set()], {}
         self.run_pass(node.code_block)
         self.scope_stack, self.const_table = scope_stack, const_table
+        invalidate(node)
         return node
 
     def foldFuncCall(self, node):
-        func_name, args = node.func_name, node.args
-        # TODO, add propagation into functions for vars defined outside of func def
-        altered_vars = self.function_vars_table[func_name]
-        for var_name in altered_vars:
-            self.invalidate_var(var_name)
+        # Arguments are passed by value and functions only see their own variables, so a call can't
+        # change the caller's variables
+        args = []
+        for arg in node.args:
+            arg = self.foldEvaluatable(arg)
+            if isinstance(arg, Variable) and arg.var_name in self.const_table:
+                arg = self.const_table[arg.var_name][-1]
+            args.append(arg)
+        node.args = args
+        return node
+
+    def foldReturnStmt(self, node):
+        node.evaluation = self.foldEvaluatable(node.evaluation)
+        if isinstance(node.evaluation, Variable) and node.evaluation.var_name in self.const_table:
+            node.evaluation = self.const_table[node.evaluation.var_name][-1]
+        return node
 
-    def get_altered_vars(self, code_block):
-        altered_vars = set()
-        for node in code_block:
-            if isinstance(node, AssignStmt):
-                altered_vars.add(node.var.var_name)
-        return altered_vars
+    def get_altered_vars(self, node):
+        """
+        Variables the blocks of IfElseBlock or WhileBlock node may assign, in the blocks nested in them too
+        """
+        return summary(node).mod
 
     def run_pass(self, cfg):
         super().run_pass(cfg)
@@ -144,12 +199,16 @@ class PropagateConstants(OptPass):
             node = cfg[i]
             if isinstance(node, AssignVarStmt):
                 node = self.foldAssignVarStmt(node)
+            elif isinstance(node, UpdateArrayIndexStmt):
+                node = self.foldUpdateArrayIndexStmt(node)
             elif isinstance(node, IfElseBlock):
                 node = self.foldIfElseBlock(node)
             elif isinstance(node, WhileBlock):
                 node = self.foldWhileBlock(node)
             elif isinstance(node, FunctionDef):
                 node = self.foldFunctionDef(node)
+            elif isinstance(node, ReturnStmt):
+                node = self.foldReturnStmt(node)
             elif isinstance(node, InterpreterDebugNode):
                 pass
             else:
@@ -0,0 +1,31 @@
+from CFG import *
+from optimizations.analysis.control_flow import ControlFlowGraph
+from optimizations.analysis.dataflow import LiveVariables
+from optimizations.analysis.mod_ref import block_summary
+
+
+def declare_removed_vars(cfg, removed, inputs=(), live_on_entry=None):
+    """
+    Puts an assignment of 0 at the start of the program for each variable that lost assignments to a pass
+    and can still be read before it's assigned. It had a register all the same, which reads as 0 until
+    it's written, and BytecodeGenerator has to find it wherever it's read, like in the body of a loop
+    that assigns it further down. One assigned before every read needs nothing
+    :param removed: name -> Variable for the variables assigned in removed statements
+    :param inputs: variables whose values are supplied when the program runs, which have registers anyway
+    :param live_on_entry: variables live at the start of cfg, if the pass has worked them out already
+    """
+    cfg_summary = block_summary(cfg)
+    read = [var for var_name, var in removed.items() if var_name in cfg_summary.ref and var_name not in inputs]
+    if not read:
+        return
+    if live_on_entry is None:
+        graph = ControlFlowGraph(cfg)
+        live_on_entry = LiveVariables(graph).block_in[graph.entry.index]
+    declarations = []
+    for var in read:
+        if var.var_name in live_on_entry:
+            if var.return_type == DataTypes.ARRAY:
+                declarations.append(AssignVarStmt(var, Constant([0] * var.length)))
+            else:
+                declarations.append(AssignVarStmt(var, Constant(0)))
+    cfg[:0] = declarations
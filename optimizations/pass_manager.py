@@ -0,0 +1,290 @@
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from bytecode_generator import BytecodeGenerator
+from CFG import *
+from optimizations.analysis.control_flow import ControlFlowGraph
+from optimizations.bytecode.dead_code import DeadCodeElimination
+from optimizations.bytecode.flow_graph import FlowGraph
+from optimizations.bytecode.liveness import Liveness
+from optimizations.bytecode.loop_invariant_code_motion import LoopInvariantCodeMotion
+from optimizations.bytecode.peephole import PeepholeOptimizer
+from optimizations.bytecode.superinstructions import SuperinstructionFusion
+from optimizations.cfg.conditional_constants import ConditionalConstantPropagation
+from optimizations.cfg.counting_loops import CountingLoopOptimizer
+from optimizations.cfg.dead_stores import DeadStoreElimination
+
+MAX_ITERATIONS = 4  # rounds of a group of passes before giving up on reaching a fixpoint
+OPT_FLAGS = {'-O0': 0, '-O1': 1, '-O2': 2}
+
+# What a pass works on
+TREE = 'tree'            # the statement tree, changed in place
+BYTECODE = 'bytecode'    # tuple bytecode with a register per value, as BytecodeGenerator makes it
+ALLOCATED = 'allocated'  # tuple bytecode after register allocation
+
+
+def structure(node, count=None):
+    """
+    Nested tuples that are equal for two trees exactly when they're the same program
+    :param count: a one-item list, whose item the number of CFG nodes in node is added to
+    """
+    if isinstance(node, list):
+        return tuple(structure(item, count) for item in node)
+    if count is not None:
+        count[0] += 1
+    if isinstance(node, Constant):
+        return ('const', tuple(node.val) if node.return_type == DataTypes.ARRAY else node.val)
+    if isinstance(node, Variable):
+        return ('var', node.var_name, node.length)
+    if isinstance(node, ArithmeticExpr):
+        return (node.op, structure(node.op1, count), structure(node.op2, count))
+    if isinstance(node, FuncCall):
+        return ('call', node.func_name, structure(node.args, count))
+    if isinstance(node, AssignVarStmt):
+        return ('=', structure(node.var, count), structure(node.evaluation, count))
+    if isinstance(node, UpdateArrayIndexStmt):
+        return ('[]=', node.var.var_name, node.idx, structure(node.evaluation, count))
+    if isinstance(node, ReturnStmt):
+        return ('return', structure(node.evaluation, count))
+    if isinstance(node, Comparison):
+        op = COMPARISON_OPS[type(node)]
+        return (op, structure(node.lhs, count), structure(node.rhs, count))
+    if isinstance(node, IfElseBlock):
+        return ('if', structure(node.bool_cond, count), structure(node.true_block, count),
+                structure(node.false_block, count))
+    if isinstance(node, WhileBlock):
+        return ('while', structure(node.bool_cond, count), structure(node.code_block, count))
+    if isinstance(node, FunctionDef):
+        return ('def', node.func_name, node.return_type, structure(node.arg_list, count),
+                structure(node.code_block, count))
+    if isinstance(node, InterpreterDebugNode):
+        return ('debug', node.output)
+    raise Exception("Can't take the structure of {}".format(node))
+
+
+# Analyses passes can ask for by name: the IR they're worked out from, and how
+ANALYSES = {
+    'graph': (TREE, lambda manager: ControlFlowGraph(manager.ir)),
+    'flow_graph': (BYTECODE, lambda manager: FlowGraph(manager.ir)),
+    'liveness': (BYTECODE, lambda manager: Liveness(manager.ir, live_at_exit=manager.context['live_at_exit'],
+                                                    graph=manager.analysis('flow_graph'))),
+}
+
+
+class PassManager:
+    """
+        Runs a pipeline of optimisation passes over a program, lowers it and runs another over its
+        bytecode. Each pass is registered with the names of the arguments its run_pass takes beyond the
+        IR: analyses (see ANALYSES) or values of the compilation like the program's inputs. Analyses are
+        cached until a pass changes the IR, so passes that change nothing share them.
+        Consecutive passes on the same IR registered with fixpoint=True run as a group, again and again
+        until a round changes nothing or max_iterations rounds have run. Once compiling has taken longer
+        than time_budget seconds, the passes left are skipped, register allocation and those of later
+        groups included; lowering always runs.
+        Every pass run is recorded with its wall time, the change in allocated memory blocks (and in
+        traced bytes if tracemalloc is tracing) and the size of the IR before and after.
+    """
+    def __init__(self, level=1, max_iterations=MAX_ITERATIONS, time_budget=None):
+        """
+        :param level: 0, 1 or 2, or the same as '-O0', '-O1' or '-O2', for one of the standard pipelines.
+                      Passes added with add_pass run after those
+        """
+        self.level = OPT_FLAGS.get(level, level)
+        self.max_iterations = max_iterations
+        self.time_budget = time_budget
+        self.groups = []  # [IR, whether to repeat until a fixpoint, [(pass, argument names)]]
+        self.generator_options = {}
+        self.allocate = self.level >= 1
+
+        self.ir = None
+        self.context = {}
+        self.generator = None
+        self.cache = {}
+        self.analyses_built = Counter()
+        self.analyses_reused = Counter()
+        self.analysis_time = Counter()
+        self.records = []
+        self.skipped = []  # names of the passes skipped for the time budget
+        self.start_time = None
+        self.compile_time = None
+
+        if self.level == 0:
+            self.generator_options['inline_limit'] = 0
+        if self.level >= 1:
+            self.add_pass(TREE, ConditionalConstantPropagation(), requires=('inputs', 'graph'))
+            if self.level >= 2:
+                self.add_pass(TREE, CountingLoopOptimizer(), requires=('inputs', 'graph'))
+            self.add_pass(TREE, DeadStoreElimination(), requires=('inputs', 'graph'))
+        if self.level >= 2:
+            self.generator_options['common_subexpressions'] = True
+            self.add_pass(BYTECODE, LoopInvariantCodeMotion(), requires=('live_at_exit', 'liveness'))
+            self.add_pass(BYTECODE, DeadCodeElimination(), requires=('live_at_exit', 'liveness'))
+        if self.level >= 1:
+            self.add_pass(ALLOCATED, SuperinstructionFusion(), requires=('live_at_exit',), fixpoint=False)
+            self.add_pass(ALLOCATED, PeepholeOptimizer(), fixpoint=False)
+
+    def add_pass(self, ir, opt_pass, requires=(), fixpoint=True):
+        """
+        :param ir: TREE, BYTECODE or ALLOCATED. Adding an ALLOCATED pass turns on register allocation
+        :param requires: names of the keyword arguments to give run_pass, from ANALYSES or the context of the
+                         compilation: 'inputs' for the tree and 'live_at_exit' for bytecode
+        :param fixpoint: whether to repeat the pass with its neighbours until they stop changing the IR,
+                         otherwise it runs once
+        """
+        if ir not in (TREE, BYTECODE, ALLOCATED):
+            raise Exception("Unknown IR for a pass: {}".format(ir))
+        for name in requires:
+            if name in ANALYSES and ANALYSES[name][0] != ir and not (ir == ALLOCATED and ANALYSES[name][0] == BYTECODE):
+                raise Exception("{} is worked out from the {}, not from the {}".format(name, ANALYSES[name][0], ir))
+        if ir == ALLOCATED:
+            self.allocate = True
+        if not self.groups or self.groups[-1][0] != ir or self.groups[-1][1] != fixpoint:
+            self.groups.append([ir, fixpoint, []])
+        self.groups[-1][2].append((opt_pass, tuple(requires)))
+
+    def compile(self, program, inputs=()):
+        """
+        Optimises program, which is changed in place, lowers it and optimises the bytecode
+        :param inputs: variables whose values are supplied when the program runs (see CfgGenerator.input_var)
+        :return: the bytecode. The BytecodeGenerator that made it, and its symbol_table, is in self.generator
+        """
+        self.start_time = time.perf_counter()
+        self.ir, self.context = program, {'inputs': tuple(inputs)}
+        self.run_groups(TREE)
+
+        self.generator = BytecodeGenerator(**self.generator_options)
+        self.generator.input_registers(inputs)
+        size = self.measure(TREE)[1]
+        record = self.step('BytecodeGenerator', lambda: self.generator.generate_bytecode(self.ir))
+        record.update(ir=TREE, size_before=size, size_after=len(self.ir))
+        self.cache = {}
+        self.context = {'live_at_exit': self.generator.variable_registers()}
+        self.run_groups(BYTECODE)
+
+        if self.allocate:
+            if not self.skip('LinearScanRegisterAllocator'):
+                record = self.step('LinearScanRegisterAllocator', lambda: self.generator.allocate_registers(self.ir))
+                record.update(ir=BYTECODE, size_before=len(self.ir), size_after=len(self.ir))
+                self.cache = {}
+                self.context = {'live_at_exit': self.generator.variable_registers()}
+            # Skipped as well if allocation was, the budget being spent
+            self.run_groups(ALLOCATED)
+        self.compile_time = time.perf_counter() - self.start_time
+        return self.ir
+
+    def over_budget(self):
+        return self.time_budget is not None and time.perf_counter() - self.start_time > self.time_budget
+
+    def skip(self, name):
+        """
+        :return: whether the time budget is spent, in which case the pass called name is recorded as skipped
+        """
+        if self.over_budget():
+            self.skipped.append(name)
+            return True
+        return False
+
+    def run_groups(self, ir):
+        for group_ir, fixpoint, passes in self.groups:
+            if group_ir != ir:
+                continue
+            for iteration in range(1, self.max_iterations + 1 if fixpoint else 2):
+                changed = False
+                for opt_pass, requires in passes:
+                    if self.skip(type(opt_pass).__name__):
+                        continue
+                    changed |= self.run_pass(opt_pass, requires, ir, iteration)
+                if not changed or self.over_budget():
+                    break
+
+    def analysis(self, name):
+        if name in self.cache:
+            self.analyses_reused[name] += 1
+            return self.cache[name]
+        start = time.perf_counter()
+        result = ANALYSES[name][1](self)
+        self.analysis_time[name] += time.perf_counter() - start
+        self.analyses_built[name] += 1
+        self.cache[name] = result
+        return result
+
+    def run_pass(self, opt_pass, requires, ir, iteration):
+        """
+        :return: whether the pass changed the IR
+        """
+        kwargs = {name: self.analysis(name) if name in ANALYSES else self.context[name] for name in requires}
+        before, size_before = self.measure(ir)
+        record = self.step(type(opt_pass).__name__, lambda: opt_pass.run_pass(self.ir, **kwargs), iteration)
+        after, size_after = self.measure(ir)
+        changed = after != before
+        if changed:
+            self.cache = {}
+        record.update(ir=ir, size_before=size_before, size_after=size_after, changed=changed)
+        return changed
+
+    def measure(self, ir):
+        """
+        :return: something that's equal for two versions of the IR only if they're the same, and the IR's size
+        """
+        if ir == TREE:
+            count = [0]
+            return structure(self.ir, count), count[0]
+        return list(self.ir), len(self.ir)
+
+    def step(self, name, func, iteration=1):
+        """
+        Runs func, which returns the new IR or None if it changed it in place, and records what it cost
+        :return: the record
+        """
+        tracing = tracemalloc.is_tracing()
+        traced_before = tracemalloc.get_traced_memory()[0] if tracing else None
+        blocks_before = sys.getallocatedblocks()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        blocks = sys.getallocatedblocks() - blocks_before
+        traced = tracemalloc.get_traced_memory()[0] - traced_before if tracing else None
+        if result is not None:
+            self.ir = result
+        record = {
+            'pass': name,
+            'iteration': iteration,
+            'time': elapsed,
+            'allocated_blocks': blocks,
+            'allocated_bytes': traced,
+            'changed': True,
+        }
+        self.records.append(record)
+        return record
+
+    def report(self):
+        """
+        :return: the record of every pass run in order, the analyses built and reused, and the wall time of
+                 the whole compilation, which includes the manager's own bookkeeping
+        """
+        return {
+            'level': self.level,
+            'total_time': self.compile_time,
+            'passes': list(self.records),
+            'skipped': list(self.skipped),
+            'analyses': {name: {'built': self.analyses_built[name], 'reused': self.analyses_reused[name],
+                                'time': self.analysis_time[name]}
+                         for name in self.analyses_built},
+        }
+
+    def format_report(self):
+        lines = ['{:<32} {:>4} {:>10} {:>10} {:>12} {:>8} -> {:<8}'.format(
+            'pass', 'iter', 'time (ms)', 'blocks', 'bytes', 'size', 'size')]
+        for record in self.records:
+            lines.append('{:<32} {:>4} {:>10.3f} {:>+10} {:>12} {:>8} -> {:<8}{}'.format(
+                record['pass'], record['iteration'], record['time'] * 1000, record['allocated_blocks'],
+                '' if record['allocated_bytes'] is None else '{:+}'.format(record['allocated_bytes']),
+                record['size_before'], record['size_after'], '' if record['changed'] else ' unchanged'))
+        if self.skipped:
+            lines.append('skipped for the time budget: {}'.format(', '.join(self.skipped)))
+        for name in self.analyses_built:
+            lines.append('analysis {:<23} built {} times, reused {} times, {:.3f} ms'.format(
+                name, self.analyses_built[name], self.analyses_reused[name], self.analysis_time[name] * 1000))
+        return '\n'.join(lines)
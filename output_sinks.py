@@ -0,0 +1,116 @@
+"""
+    Destinations for the lines an Interpreter outputs: DEBUG_PRINT text, the budget message and the
+    summary line of Interpreter.interpret. Sinks buffer lines and write them out in bulk on flush.
+"""
+import sys
+
+
+class OutputSink:
+    def write(self, line):
+        raise NotImplementedError()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class StdoutSink(OutputSink):
+    """
+        Buffered standard output. sys.stdout is looked up on every flush, so contextlib.redirect_stdout
+        around a run still captures it
+    """
+    def __init__(self, buffer_lines=1000):
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+
+    def write(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            sys.stdout.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+
+
+class MemorySink(OutputSink):
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def getvalue(self):
+        return ''.join(line + '\n' for line in self.lines)
+
+
+class FileSink(OutputSink):
+    """
+        Appends to a file in batches of buffer_lines lines
+    """
+    def __init__(self, path, buffer_lines=10000):
+        self.file = open(path, 'a')
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+
+    def write(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class DiscardSink(OutputSink):
+    def __init__(self):
+        self.lines_discarded = 0
+
+    def write(self, line):
+        self.lines_discarded += 1
+
+
+class LimitedSink(OutputSink):
+    """
+        Passes lines on to another sink, thinning out lines that repeat, like a DEBUG_PRINT inside a hot
+        loop. Each distinct line is passed on the first max_repeats times, and after that only every
+        sample_every-th time, if sample_every is given. suppressed counts the lines held back.
+    """
+    def __init__(self, sink, max_repeats=10, sample_every=None):
+        self.sink = sink
+        self.max_repeats = max_repeats
+        self.sample_every = sample_every
+        self.counts = {}
+        self.suppressed = {}
+
+    def write(self, line):
+        count = self.counts.get(line, 0) + 1
+        self.counts[line] = count
+        if count <= self.max_repeats or (self.sample_every and count % self.sample_every == 0):
+            self.sink.write(line)
+        else:
+            self.suppressed[line] = self.suppressed.get(line, 0) + 1
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+    def write_summary(self):
+        """
+        Passes on one line per suppressed message saying how many times it was held back
+        """
+        for line, count in self.suppressed.items():
+            self.sink.write("[{} more: {}]".format(count, line))
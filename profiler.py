@@ -0,0 +1,215 @@
+import json
+import time
+
+from bytecode_generator import BytecodeGenerator
+from CFG import WhileBlock
+from opcodes import *
+from program_loader import load_program
+
+
+class Profiler:
+    """
+        Runs a program through its own instrumented dispatch loop, so the interpreter's normal loop
+        doesn't pay anything for profiling. Counts how often each opcode, program counter, label and
+        basic block executes, and times each instruction.
+
+        Given the bytecode a LoadedProgram was loaded from and the BytecodeGenerator that produced it,
+        each program counter is mapped back to the CFG nodes that emitted it, which gives the time spent
+        in each WhileBlock and the stacks of the collapsed-stack export. The generator has to record its
+        source map, see compile_for_profiling.
+    """
+    def __init__(self, program, bytecode=None, generator=None):
+        self.program = program
+        self.code = program.instructions()
+        self.opcode_counts = [0] * len(OPCODE_NAMES)
+        self.pc_counts = [0] * len(self.code)
+        self.pc_times = [0.0] * len(self.code)
+        self.instrs_run = 0
+
+        self.pc_paths = [()] * len(self.code)  # program counter -> CFG node path
+        self.label_paths = {}                  # label name -> CFG node path of the block that emitted it
+        if bytecode is not None and generator is not None:
+            if generator.source_map is None:
+                raise Exception("Profiling needs the source map, create the BytecodeGenerator with source_map=True")
+            pc = 0
+            for instr in bytecode:
+                if instr[0] in PSEUDO_INSTRUCTIONS:
+                    self.label_paths[instr[1]] = generator.source_path(instr)
+                else:
+                    self.pc_paths[pc] = generator.source_path(instr)
+                    pc += 1
+        # Nodes are named in program order, see node_name
+        self.node_names = {}
+        for path in self.pc_paths + list(self.label_paths.values()):
+            for node in path:
+                self.node_name(node)
+
+    def run(self, interpreter, max_instructions=False, instrs_run=0):
+        """
+        Same as interpreter.run(self.program, ...), while collecting the profile
+        """
+        program = self.program
+        registers = interpreter.main_registers()
+        if len(registers) < program.num_registers:
+            registers.extend([0] * (program.num_registers - len(registers)))
+        code = self.code
+        dispatch_table = interpreter.dispatch_table
+        opcode_counts, pc_counts, pc_times = self.opcode_counts, self.pc_counts, self.pc_times
+        clock = time.perf_counter
+        end = len(code)
+        pc = interpreter.program_counter
+        start_instrs = instrs_run
+        while pc < end:
+            if max_instructions and instrs_run > max_instructions:
+                interpreter.write_output("Hit max # of instructions to execute")
+                break
+            instr = code[pc]
+            started = clock()
+            next_pc = dispatch_table[instr[0]](instr, pc)
+            pc_times[pc] += clock() - started
+            pc_counts[pc] += 1
+            opcode_counts[instr[0]] += 1
+            pc = next_pc
+            instrs_run += 1
+        interpreter.program_counter = pc
+        interpreter.output.flush()
+        self.instrs_run += instrs_run - start_instrs
+        return instrs_run
+
+    def node_name(self, node):
+        """
+        Readable name for a CFG node: its class and the order it first appears in the program
+        """
+        if id(node) not in self.node_names:
+            self.node_names[id(node)] = (node, '{}#{}'.format(type(node).__name__, len(self.node_names)))
+        return self.node_names[id(node)][1]
+
+    def block_starts(self):
+        starts = {0}
+        for pc, instr in enumerate(self.code):
+            if instr[0] in CONDITIONAL_JUMP_OPCODES or instr[0] == JMP:
+                starts.add(instr[-1])
+                starts.add(pc + 1)
+            elif instr[0] == CALL:
+                starts.add(instr[2])
+            elif instr[0] == RET:
+                starts.add(pc + 1)
+        return sorted(start for start in starts if start < len(self.code))
+
+    def opcode_report(self):
+        return {OPCODE_NAMES[opcode]: count for opcode, count in enumerate(self.opcode_counts) if count}
+
+    def label_report(self):
+        """
+        How often control passed each label. A label at the end of the program never executes
+        """
+        report = {}
+        for name, pc in sorted(self.program.labels.items(), key=lambda item: item[1]):
+            path = self.label_paths.get(name, ())
+            report[name] = {
+                'pc': pc,
+                'count': self.pc_counts[pc] if pc < len(self.code) else 0,
+                'node': self.node_name(path[-1]) if path else None,
+            }
+        return report
+
+    def block_report(self):
+        starts = self.block_starts()
+        labels_at = {}
+        for name, pc in self.program.labels.items():
+            labels_at.setdefault(pc, []).append(name)
+        blocks = []
+        for idx, start in enumerate(starts):
+            end = starts[idx + 1] if idx + 1 < len(starts) else len(self.code)
+            blocks.append({
+                'start': start,
+                'end': end,
+                'count': self.pc_counts[start],
+                'time': sum(self.pc_times[start:end]),
+                'labels': sorted(labels_at.get(start, [])),
+            })
+        return blocks
+
+    def loop_report(self):
+        """
+        Time spent in each WhileBlock, including the blocks nested inside it, and how often its
+        condition was checked
+        """
+        loops = {}
+        for pc, path in enumerate(self.pc_paths):
+            for depth, node in enumerate(path):
+                if isinstance(node, WhileBlock):
+                    entry = loops.setdefault(self.node_name(node), {'time': 0.0, 'instrs': 0, 'checks': 0})
+                    entry['time'] += self.pc_times[pc]
+                    entry['instrs'] += self.pc_counts[pc]
+                    if depth == len(path) - 1 and self.code[pc][0] in CONDITIONAL_JUMP_OPCODES:
+                        # The loop's own conditional jump runs once per condition check
+                        entry['checks'] += self.pc_counts[pc]
+        return loops
+
+    def pc_report(self):
+        return [{
+            'pc': pc,
+            'instr': [OPCODE_NAMES[instr[0]]] + list(instr[1:]),
+            'count': self.pc_counts[pc],
+            'time': self.pc_times[pc],
+            'nodes': [self.node_name(node) for node in self.pc_paths[pc]],
+        } for pc, instr in enumerate(self.code)]
+
+    def report(self):
+        return {
+            'instructions_run': self.instrs_run,
+            'total_time': sum(self.pc_times),
+            'opcodes': self.opcode_report(),
+            'labels': self.label_report(),
+            'blocks': self.block_report(),
+            'loops': self.loop_report(),
+            'pcs': self.pc_report(),
+        }
+
+    def to_json(self, path=None):
+        """
+        :return: the report as JSON text, also written to path if one is given
+        """
+        text = json.dumps(self.report(), indent=2, default=str)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def collapsed_stacks(self, weight='count'):
+        """
+        Lines of 'frame;frame;...;OPCODE value' as read by flamegraph.pl and speedscope, one per distinct
+        stack. The frames are the CFG nodes enclosing the instruction.
+        :param weight: 'count' for executed instructions, 'time' for microseconds
+        """
+        totals = {}
+        for pc, instr in enumerate(self.code):
+            if weight == 'count':
+                value = self.pc_counts[pc]
+            elif weight == 'time':
+                value = int(round(self.pc_times[pc] * 1000000))
+            else:
+                raise Exception("Unknown collapsed stack weight: {}".format(weight))
+            if not value:
+                continue
+            frames = [self.node_name(node) for node in self.pc_paths[pc]] or ['program']
+            stack = ';'.join(frames + [OPCODE_NAMES[instr[0]]])
+            totals[stack] = totals.get(stack, 0) + value
+        return ['{} {}'.format(stack, value) for stack, value in totals.items()]
+
+    def write_collapsed(self, path, weight='count'):
+        with open(path, 'w') as f:
+            for line in self.collapsed_stacks(weight):
+                f.write(line + '\n')
+
+
+def compile_for_profiling(program, **generator_options):
+    """
+    Lowers program with a BytecodeGenerator that records its source map, and loads it
+    :param generator_options: other arguments of BytecodeGenerator
+    :return: a Profiler for the loaded program
+    """
+    generator = BytecodeGenerator(source_map=True, **generator_options)
+    bytecode = generator.generate_bytecode(program)
+    return Profiler(load_program(bytecode), bytecode, generator)
@@ -0,0 +1,110 @@
+from opcodes import *
+
+
+class LoadedProgram:
+    """
+        Bytecode decoded once into integer opcodes, with LABELs removed and jump targets
+        resolved to program counters. A LoadedProgram can be handed to Interpreter.interpret
+        any number of times without being decoded again. Register names are numbered densely in
+        order of first appearance, so the interpreter can keep registers in a list.
+
+        Each function section (see 'FUNC' in opcodes.py) has its own register window numbered the same
+        way, parameters first. register_names only covers the main program.
+    """
+    def __init__(self, code, labels, register_names, functions=None):
+        self.code = code                      # list of (opcode, operands...) tuples
+        self.labels = labels                  # label name -> program counter, kept for debugging
+        self.register_names = register_names  # register number -> name in the tuple bytecode
+        self.register_index = {name: idx for idx, name in enumerate(register_names)}
+        self.functions = functions or {}      # FUNC label -> register names of the function's window
+
+    def __len__(self):
+        return len(self.code)
+
+    @property
+    def num_registers(self):
+        return len(self.register_names)
+
+    def instructions(self):
+        """
+        The fully decoded instruction list
+        """
+        return self.code
+
+
+def load_program(bytecode):
+    # Labels are removed, so each one points at the first real instruction following it
+    labels = {}
+    pc = 0
+    for instr in bytecode:
+        if instr[0] in PSEUDO_INSTRUCTIONS:
+            if instr[1] in labels:
+                raise Exception("Label defined more than once: {}".format(instr[1]))
+            labels[instr[1]] = pc
+        else:
+            pc += 1
+    end = pc
+
+    main_registers = {}
+    register_index = main_registers
+    functions = {}
+    param_counts = {}
+    calls = []  # positions of CALLs, which get the size of the called function's window at the end
+
+    def register_number(name):
+        if name not in register_index:
+            register_index[name] = len(register_index)
+        return register_index[name]
+
+    code = []
+    for instr in bytecode:
+        cmd = instr[0]
+        if cmd == 'LABEL':
+            continue
+        if cmd == 'FUNC':
+            register_index = {}
+            functions[instr[1]] = register_index
+            param_counts[instr[1]] = len(instr[2])
+            for name in instr[2]:
+                register_number(name)
+            continue
+        if cmd == 'HALT':
+            # Jumping to the end stops the interpreter, so the function sections after it never run by accident
+            code.append((JMP, end))
+            continue
+        if cmd not in FORMATS:
+            raise Exception("Unknown instruction: {}".format(instr))
+        operand_kinds = FORMATS[cmd]
+        if len(instr) - 1 != len(operand_kinds):
+            raise Exception("Wrong number of operands: {}".format(instr))
+
+        operands = []
+        for kind, operand in zip(operand_kinds, instr[1:]):
+            if kind == LABEL:
+                if operand not in labels:
+                    raise Exception("Jump to undefined label: {}".format(instr))
+                operand = labels[operand]
+            elif kind in (DST, SRC, UPD) or (kind == VAL and is_register(operand)):
+                operand = register_number(operand)
+            elif kind == ARGS:
+                operand = tuple(register_number(reg) for reg in operand)
+            operands.append(operand)
+
+        if cmd == 'SET':
+            opcode = SET_REG if is_register(instr[2]) else SET_CONST
+        elif cmd == 'CALL':
+            calls.append((len(code), instr[2]))
+            opcode = CALL
+        else:
+            opcode = MNEMONIC_OPCODES[cmd]
+        code.append((opcode, *operands))
+
+    for idx, label in calls:
+        if label not in functions:
+            raise Exception("Call to a label that doesn't start a function: {}".format(label))
+        _, dst, entry, args = code[idx]
+        if len(args) != param_counts[label]:
+            raise Exception("Call to {} with {} arguments, it takes {}".format(label, len(args), param_counts[label]))
+        code[idx] = (CALL, dst, entry, len(functions[label]), args)
+    return LoadedProgram(code, labels, list(main_registers),
+                         {label: list(registers) for label, registers in functions.items()})
@@ -0,0 +1,50 @@
+"""
+    Interpreter vs ahead-of-time translation to Python on loop-heavy programs
+"""
+import contextlib
+import time
+
+from aot_compiler import AotCompiler
+from bench_dispatch import best_of, counting_loop
+from bytecode_generator import BytecodeGenerator
+from interpreter import Interpreter
+from program_loader import load_program
+
+
+class DiscardOutput:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def run(target, max_instructions):
+    interpreter = Interpreter()
+    with contextlib.redirect_stdout(DiscardOutput()):
+        instrs_run = interpreter.interpret(target, max_instructions)
+    return instrs_run, interpreter.registers
+
+
+def compare(name, program, max_instructions=False):
+    bytecode = BytecodeGenerator().generate_bytecode(program)
+    loaded = load_program(bytecode)
+
+    start = time.perf_counter()
+    compiled = AotCompiler().compile(loaded)
+    compile_time = time.perf_counter() - start
+
+    interp_time, interp_result = best_of(3, lambda: run(loaded, max_instructions))
+    aot_time, aot_result = best_of(3, lambda: run(compiled, max_instructions))
+    assert interp_result == aot_result, "compiled program diverged from the interpreter"
+
+    print("{:<22} {:>9} instrs  interpreter {:.3f}s  aot {:.3f}s (+{:.1f}ms compile)  speedup {:.1f}x".format(
+        name, interp_result[0], interp_time, aot_time, compile_time * 1000, interp_time / aot_time))
+
+
+if __name__ == '__main__':
+    from test3 import _ as test3
+
+    # tests/test3.py never leaves its loop, so it only ends at the instruction budget
+    compare('test3 (500k budget)', test3.program, max_instructions=500000)
+    compare('counting loop', counting_loop(50000))
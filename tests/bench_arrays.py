@@ -0,0 +1,47 @@
+"""
+    Whole-array arithmetic against the same arithmetic written out one scalar variable per element
+"""
+from bench_aot import run
+from bench_dispatch import best_of
+from bytecode_generator import BytecodeGenerator
+from CfgGenerator import CfgGenerator
+from program_loader import load_program
+
+ITERATIONS = 200
+
+
+def array_program(length):
+    _ = CfgGenerator()
+    _.program = [
+        _.set_array('acc', length),
+        _.set_array('step', length, [idx % 100 for idx in range(length)]),
+        _.set_var('i', 0),
+        _.while_loop(bool_cond=_.is_greater(ITERATIONS, 'i'), code_block=[
+            _.set_array('acc', length, _.calc('+', 'acc', 'step')),
+            _.set_var('i', _.calc('+', 'i', 1)),
+        ]),
+    ]
+    return _
+
+
+def scalar_program(length):
+    _ = CfgGenerator()
+    program = []
+    for idx in range(length):
+        program += [_.set_var('acc' + str(idx), 0), _.set_var('step' + str(idx), idx % 100)]
+    program.append(_.set_var('i', 0))
+    body = [_.set_var('acc' + str(idx), _.calc('+', 'acc' + str(idx), 'step' + str(idx))) for idx in range(length)]
+    body.append(_.set_var('i', _.calc('+', 'i', 1)))
+    program.append(_.while_loop(bool_cond=_.is_greater(ITERATIONS, 'i'), code_block=body))
+    _.program = program
+    return _
+
+
+if __name__ == '__main__':
+    for length in [4, 32, 256, 1024]:
+        array_loaded = load_program(BytecodeGenerator().generate_bytecode(array_program(length).program))
+        scalar_loaded = load_program(BytecodeGenerator().generate_bytecode(scalar_program(length).program))
+        array_time, (array_instrs, _) = best_of(3, lambda: run(array_loaded, False))
+        scalar_time, (scalar_instrs, _) = best_of(3, lambda: run(scalar_loaded, False))
+        print("{:>5} elements: arrays {:>6} instrs {:.4f}s  scalars {:>7} instrs {:.4f}s  speedup {:.1f}x".format(
+            length, array_instrs, array_time, scalar_instrs, scalar_time, scalar_time / array_time))
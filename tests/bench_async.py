@@ -0,0 +1,59 @@
+"""
+    Many programs interleaved on one event loop: overhead of yielding against running them one after
+    another, for a few slice sizes
+"""
+import contextlib
+import time
+
+from async_interpreter import Scheduler
+from bench_aot import DiscardOutput
+from bytecode_generator import BytecodeGenerator
+from generated_programs import generated_program
+from interpreter import Interpreter
+from program_loader import load_program
+
+
+def programs(count):
+    loaded = [load_program(BytecodeGenerator().generate_bytecode(generated_program(60, seed=seed, loop_bound=6).program))
+              for seed in range(20)]
+    return [loaded[idx % len(loaded)] for idx in range(count)]
+
+
+def sequential(loaded):
+    start = time.perf_counter()
+    instrs_run = sum(Interpreter().run(program) for program in loaded)
+    return instrs_run, time.perf_counter() - start
+
+
+def interleaved(loaded, slice_size):
+    scheduler = Scheduler(slice_size)
+    for program in loaded:
+        scheduler.add(program)
+    start = time.perf_counter()
+    report = scheduler.run_until_complete()
+    elapsed = time.perf_counter() - start
+    return sum(entry['instructions'] for entry in report), elapsed, report
+
+
+if __name__ == '__main__':
+    from test3 import _ as test3
+
+    loaded = programs(2000)
+    instrs_run, sequential_time = sequential(loaded)
+    print("sequential: {} programs, {} instrs, {:.3f}s".format(len(loaded), instrs_run, sequential_time))
+    for slice_size in [100, 1000, 10000]:
+        total, elapsed, report = interleaved(loaded, slice_size)
+        assert total == instrs_run
+        slowest = max(entry['wall_time'] for entry in report)
+        print("slice {:>5}: {:.3f}s ({:.2f}x sequential), {} slices, slowest program finished after {:.3f}s".format(
+            slice_size, elapsed, elapsed / sequential_time, sum(entry['slices'] for entry in report), slowest))
+
+    # A program that never ends only holds up the others for its own slices, then hits its timeout
+    scheduler = Scheduler(1000)
+    endless = scheduler.add(load_program(BytecodeGenerator().generate_bytecode(test3.program)), timeout=0.2, name='test3')
+    for program in loaded[:200]:
+        scheduler.add(program)
+    with contextlib.redirect_stdout(DiscardOutput()):
+        scheduler.run_until_complete()
+    print("test3 alongside 200 programs: {} after {} instrs, {:.3f}s wall, {:.3f}s running".format(
+        endless.status, endless.instrs_run, endless.wall_time, endless.run_time))
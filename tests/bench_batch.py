@@ -0,0 +1,63 @@
+"""
+    One interpreter run per input against a single batched run over all inputs as lanes
+"""
+import contextlib
+import random
+import time
+
+from bench_aot import DiscardOutput
+from batch_interpreter import BatchInterpreter
+from bytecode_generator import BytecodeGenerator
+from CfgGenerator import CfgGenerator
+from interpreter import Interpreter
+from program_loader import load_program
+
+
+def triangle_program():
+    # total = x + (x - 1) + ... + 1, so each lane loops a different number of times
+    _ = CfgGenerator()
+    _.input_var('x')
+    _.program = [
+        _.set_var('total', 0),
+        _.while_loop(bool_cond=_.is_greater('x', 0), code_block=[
+            _.set_var('total', _.calc('+', 'total', 'x')),
+            _.set_var('x', _.calc('-', 'x', 1)),
+        ]),
+    ]
+    return _
+
+
+def compare(num_lanes, min_x, max_x):
+    bg = BytecodeGenerator()
+    x_reg = bg.input_registers(['x'])['x']
+    program = load_program(bg.generate_bytecode(triangle_program().program))
+    rand = random.Random(num_lanes)
+    xs = [rand.randint(min_x, max_x) for _ in range(num_lanes)]
+    x_idx, total_idx = program.register_index[x_reg], program.register_index[bg.symbol_table['total'][-1]]
+
+    start = time.perf_counter()
+    totals = []
+    for x in xs:
+        interpreter = Interpreter()
+        interpreter.registers = [0] * program.num_registers
+        interpreter.registers[x_idx] = x
+        with contextlib.redirect_stdout(DiscardOutput()):
+            interpreter.run(program)
+        totals.append(interpreter.registers[total_idx])
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = BatchInterpreter()
+    batch.run(program, num_lanes, {x_reg: xs})
+    batch_time = time.perf_counter() - start
+    assert list(batch.registers[total_idx]) == totals, "batched run diverged from the interpreter"
+
+    print("{:>6} lanes, {:>2} <= x <= {:>2}: one run per input {:.3f}s  batched {:.3f}s  speedup {:.1f}x".format(
+        num_lanes, min_x, max_x, single_time, batch_time, single_time / batch_time))
+
+
+if __name__ == '__main__':
+    for num_lanes in [100, 1000, 10000, 100000]:
+        compare(num_lanes, 0, 50)
+    # Every lane loops the same number of times, so they never diverge
+    compare(10000, 50, 50)
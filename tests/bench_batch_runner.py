@@ -0,0 +1,43 @@
+"""
+    Throughput of run_batch over a generated corpus for 1 up to N worker processes (all cores by
+    default, or the first command line argument), against running the corpus in this process
+"""
+import multiprocessing
+import os
+import sys
+import time
+
+from batch_runner import run_batch, run_job
+from generated_programs import generated_program
+
+
+def corpus(count, num_stmts=150):
+    return [generated_program(num_stmts, seed=seed, debug_prints=True) for seed in range(count)]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def run_job_pickled(args):
+    # Baseline that ships every program with its task instead of once per worker
+    return run_job(*args)
+
+
+if __name__ == '__main__':
+    max_processes = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+    jobs = corpus(400)
+
+    inline, inline_time = timed(lambda: [run_job(idx, job) for idx, job in enumerate(jobs)])
+    print("in process: {:.3f}s, {:.0f} programs/s".format(inline_time, len(jobs) / inline_time))
+    for processes in range(1, max_processes + 1):
+        results, elapsed = timed(lambda: run_batch(jobs, processes))
+        assert [result.variables for result in results] == [result.variables for result in inline]
+        print("{:>2} processes: {:.3f}s, {:.0f} programs/s, {:.2f}x in process".format(
+            processes, elapsed, len(jobs) / elapsed, inline_time / elapsed))
+
+    with multiprocessing.Pool(max_processes) as pool:
+        _, pickled_time = timed(lambda: pool.map(run_job_pickled, list(enumerate(jobs))))
+    print("{:>2} processes, programs pickled per task: {:.3f}s".format(max_processes, pickled_time))
@@ -0,0 +1,39 @@
+"""
+    Start-up cost of rebuilding a program from its CFG against opening a saved bytecode file
+"""
+import os
+import tempfile
+import time
+
+from bytecode_file import open_program, save_program
+from bytecode_generator import BytecodeGenerator
+from generated_programs import generated_program
+from interpreter import Interpreter
+from program_loader import load_program
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    path = os.path.join(tempfile.mkdtemp(), 'program.bytc')
+    for num_stmts in [1000, 10000, 50000]:
+        _ = generated_program(num_stmts, seed=num_stmts)
+
+        def rebuild():
+            bg = BytecodeGenerator()
+            return load_program(bg.allocate_registers(bg.generate_bytecode(_.program)))
+
+        loaded, rebuild_time = timed(rebuild)
+        save_program(loaded, path)
+        mapped, open_time = timed(lambda: open_program(path))
+        instrs_run, first_run_time = timed(lambda: Interpreter().run(mapped))
+        assert instrs_run == Interpreter().run(loaded)
+        mapped.close()
+
+        print("{:>6} stmts {:>7} instrs {:>9} bytes: rebuild {:8.1f}ms  open {:6.2f}ms  first run {:7.1f}ms".format(
+            num_stmts, len(loaded), os.path.getsize(path), rebuild_time * 1000, open_time * 1000, first_run_time * 1000))
+    os.remove(path)
@@ -0,0 +1,60 @@
+"""
+    Instructions removed by sparse conditional constant propagation on the test programs and on
+    generated ones, statically and when run
+"""
+import contextlib
+import copy
+import io
+
+from bytecode_generator import BytecodeGenerator
+from frontend import parse
+from generated_programs import generated_program
+from interpreter import Interpreter
+from optimizations.cfg.conditional_constants import ConditionalConstantPropagation
+from output_sinks import DiscardSink
+from program_loader import load_program
+
+
+# y is assigned in a branch that never runs, and read in the loop before the assignment that's left
+READ_BEFORE_ASSIGNED = '''
+input a;
+if (1 > 2) { y = 5; }
+z = 0;
+c = 0;
+while (3 > c) { z = z + y; y = a; c = c + 1; }
+'''
+
+
+def compile_and_run(program, inputs=()):
+    generator = BytecodeGenerator()
+    generator.input_registers(inputs)
+    bytecode = generator.generate_bytecode(program)
+    instrs_run = Interpreter(DiscardSink(), summary=False).interpret(load_program(bytecode), 1000000)
+    return len(bytecode), instrs_run
+
+
+def report(name, program, inputs=()):
+    before = compile_and_run(copy.deepcopy(program), inputs)
+    sccp = ConditionalConstantPropagation()
+    optimised = copy.deepcopy(program)
+    sccp.run_pass(optimised, inputs)
+    after = compile_and_run(optimised, inputs)
+    print("{:<24} {:>6} -> {:>6} static {:>8} -> {:>8} dynamic   {} branches, {} loops, {} stmts removed, {} folded".format(
+        name, before[0], after[0], before[1], after[1],
+        sccp.removed_branches, sccp.removed_loops, sccp.removed_stmts, sccp.folded))
+
+
+if __name__ == '__main__':
+    # The test programs print as they're imported
+    with contextlib.redirect_stdout(io.StringIO()):
+        from test import _ as test
+        from test2 import _ as test2
+        from test3 import _ as test3
+        from test4 import _ as test4
+
+    for name, module in [('test', test), ('test2', test2), ('test3', test3), ('test4', test4)]:
+        report(name, module.program)
+    read_before_assigned = parse(READ_BEFORE_ASSIGNED)
+    report('read before assigned', read_before_assigned.program, read_before_assigned.inputs)
+    for num_stmts in [200, 2000]:
+        report('generated, {} stmts'.format(num_stmts), generated_program(num_stmts, seed=num_stmts).program)
@@ -0,0 +1,102 @@
+"""
+    Counting loops replaced by their closed form, unrolled or strength-reduced, and what that does to the
+    number of instructions run and to run time. Both sides go through the usual bytecode passes
+"""
+import contextlib
+import copy
+import io
+
+from CfgGenerator import CfgGenerator
+from bytecode_generator import BytecodeGenerator
+from frontend import parse
+from generated_programs import compare_runs, generated_program
+from optimizations.bytecode.peephole import PeepholeOptimizer
+from optimizations.bytecode.superinstructions import SuperinstructionFusion
+from optimizations.cfg.counting_loops import CountingLoopOptimizer
+from program_loader import load_program
+
+
+def sum_loop(iterations):
+    """
+    Sums of the counter and of a constant, which have a closed form
+    """
+    _ = CfgGenerator()
+    _.program = [
+        _.set_var('i', 0),
+        _.set_var('total', 0),
+        _.set_var('evens', 0),
+        _.while_loop(_.is_greater(iterations, 'i'), [
+            _.set_var('total', _.calc('+', 'total', 'i')),
+            _.set_var('evens', _.calc('+', 'evens', 2)),
+            _.set_var('i', _.calc('+', 'i', 1)),
+        ]),
+    ]
+    return _.program
+
+
+def product_loop(iterations):
+    """
+    A loop that has to stay, as it branches, reading multiples of its counter
+    """
+    _ = CfgGenerator()
+    _.program = [
+        _.set_var('i', 0),
+        _.set_var('total', 0),
+        _.while_loop(_.is_greater(iterations, 'i'), [
+            _.if_else(_.is_greater(_.calc('*', 'i', 6), 'total'),
+                      [_.set_var('total', _.calc('+', 'total', _.calc('*', 'i', 6)))],
+                      [_.set_var('total', _.calc('-', 'total', 1))]),
+            _.set_var('i', _.calc('+', 'i', 1)),
+        ]),
+    ]
+    return _.program
+
+
+# The call has to run on every iteration, so the loop has no closed form
+CALLING_LOOP = '''
+func f() { print "called"; return 7; }
+k = 0;
+while (3 > k) { r = f(); k = k + 1; }
+'''
+
+
+def compile_program(program):
+    """
+    :return: the bytecode of program and the symbol table of its variables
+    """
+    bg = BytecodeGenerator()
+    bytecode = bg.allocate_registers(bg.generate_bytecode(program))
+    bytecode = SuperinstructionFusion().run_pass(bytecode, bg.variable_registers())
+    return PeepholeOptimizer().run_pass(bytecode), bg.symbol_table
+
+
+def report(name, program, max_instructions=False):
+    plain, plain_variables = compile_program(copy.deepcopy(program))
+    optimiser = CountingLoopOptimizer()
+    optimised = copy.deepcopy(program)
+    optimiser.run_pass(optimised)
+    optimised, optimised_variables = compile_program(optimised)
+
+    (plain_time, plain_instrs, plain_lines), (optimised_time, optimised_instrs, optimised_lines) = compare_runs(
+        load_program(plain), load_program(optimised), plain_variables, optimised_variables, max_instructions)
+
+    print(name)
+    print("    loops:   {} closed forms, {} unrolled, {} products strength-reduced, in {} rounds".format(
+        optimiser.closed_forms, optimiser.unrolled, optimiser.strength_reduced, optimiser.rounds))
+    print("    static:  {} -> {} instrs".format(len(plain), len(optimised)))
+    print("    dynamic: {} -> {} instrs, {} -> {} lines printed".format(
+        plain_instrs, optimised_instrs, plain_lines, optimised_lines))
+    print("    time:    {:.4f}s -> {:.4f}s ({:.2f}x)".format(
+        plain_time, optimised_time, plain_time / optimised_time))
+
+
+if __name__ == '__main__':
+    with contextlib.redirect_stdout(io.StringIO()):
+        from test3 import _ as test3
+
+    # test3 counts down from -1 while 300 > y, so it never stops and stays as it is
+    report('test3, 100000 instrs', test3.program, max_instructions=100000)
+    report('sum loop', sum_loop(50000))
+    report('product loop', product_loop(50000))
+    report('loop calling a function', parse(CALLING_LOOP).program)
+    report('generated, 2000 stmts', generated_program(2000, seed=4).program)
@@ -0,0 +1,70 @@
+"""
+    Time to build the basic-block graph of a program, find its dominators and solve liveness over it,
+    for programs of growing size that are deeply nested or flat. Time per statement should stay flat
+"""
+import gc
+import sys
+import time
+
+from CfgGenerator import CfgGenerator
+from generated_programs import generated_program
+from optimizations.analysis.control_flow import ControlFlowGraph
+from optimizations.analysis.dataflow import LiveVariables
+from optimizations.analysis.dominators import Dominators
+
+
+def nested_program(depth, stmts_per_level=3):
+    """
+    Alternating while loops and if/else blocks nested depth deep, with a few assignments around each
+    """
+    _ = CfgGenerator()
+    var_names = ['v' + str(i) for i in range(stmts_per_level + 1)]
+    program = [_.set_var(var_name, 0) for var_name in var_names]
+
+    def level(depth):
+        stmts = [_.set_var(var_names[i], _.calc('+', var_names[i + 1], depth)) for i in range(stmts_per_level)]
+        if depth > 0:
+            cond = _.is_greater(var_names[depth % stmts_per_level], depth)
+            if depth % 2:
+                stmts.append(_.while_loop(cond, level(depth - 1)))
+            else:
+                stmts.append(_.if_else(cond, level(depth - 1), [_.set_var(var_names[-1], depth)]))
+        stmts += [_.set_var(var_names[i + 1], var_names[i]) for i in range(stmts_per_level)]
+        return stmts
+
+    program += level(depth)
+    return program
+
+
+def count_stmts(code_block):
+    count = 0
+    for node in code_block:
+        count += 1
+        for attr in ('true_block', 'false_block', 'code_block'):
+            count += count_stmts(getattr(node, attr, []))
+    return count
+
+
+def analyse(program):
+    # Like timeit, leave out the garbage collector, whose full collections scan the whole program tree
+    gc.disable()
+    start = time.perf_counter()
+    graph = ControlFlowGraph(program)
+    Dominators(graph)
+    liveness = LiveVariables(graph)
+    elapsed = time.perf_counter() - start
+    gc.enable()
+    return elapsed, graph, liveness
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    print("{:>10} {:>7} {:>7} {:>13} {:>10} {:>12}".format('shape', 'stmts', 'blocks', 'visits/block', 'ms', 'us/stmt'))
+    programs = [('nested', nested_program(depth)) for depth in [50, 100, 200, 400, 800]]
+    programs += [('flat', generated_program(num_stmts, seed=num_stmts).program) for num_stmts in [1000, 4000, 16000]]
+    for shape, program in programs:
+        elapsed, graph, liveness = analyse(program)
+        num_stmts = count_stmts(program)
+        print("{:>10} {:>7} {:>7} {:>13.2f} {:>10.1f} {:>12.2f}".format(
+            shape, num_stmts, len(graph.blocks), liveness.visits / len(graph.blocks), elapsed * 1000,
+            elapsed * 1e6 / num_stmts))
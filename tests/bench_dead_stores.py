@@ -0,0 +1,76 @@
+"""
+    Stores and temporaries removed by dead-store elimination on the statement tree and by dead-code
+    elimination on bytecode, statically and when run. "kept" keeps every variable's final value,
+    "output" only keeps what the program prints. First checks that no variable is declared again for a
+    removed store when every read of it follows another assignment
+"""
+import contextlib
+import copy
+import io
+
+from bytecode_generator import BytecodeGenerator, subtree_nodes
+from CFG import AssignStmt
+from generated_programs import generated_program
+from interpreter import Interpreter
+from optimizations.bytecode.dead_code import DeadCodeElimination
+from optimizations.cfg.dead_stores import DeadStoreElimination
+from optimizations.cfg.propagate_constants import PropagateConstants
+from output_sinks import DiscardSink
+from program_loader import load_program
+
+
+def run(bytecode):
+    return Interpreter(DiscardSink(), summary=False).interpret(load_program(bytecode), 1000000)
+
+
+def num_assignments(program):
+    return sum(isinstance(node, AssignStmt) for node in subtree_nodes(program))
+
+
+def check_removed_only(program):
+    optimised = copy.deepcopy(program)
+    dse = DeadStoreElimination()
+    dse.run_pass(optimised)
+    assert num_assignments(optimised) == num_assignments(program) - dse.removed
+    print('{} stores removed, none declared again'.format(dse.removed))
+
+
+def report(name, program, propagate=False):
+    program = copy.deepcopy(program)
+    if propagate:
+        PropagateConstants().run_pass(program)
+    bg = BytecodeGenerator()
+    bytecode = bg.generate_bytecode(copy.deepcopy(program))
+    print(name)
+    print("    {:<17} {:>6} static {:>8} dynamic".format('plain:', len(bytecode), run(bytecode)))
+
+    for keep, live_at_exit in [('kept', None), ('output', ())]:
+        dse = DeadStoreElimination()
+        optimised = copy.deepcopy(program)
+        dse.run_pass(optimised, live_at_exit=live_at_exit)
+        stores = BytecodeGenerator().generate_bytecode(optimised)
+        print("    {:<17} {:>6} static {:>8} dynamic   {} stores removed in {} rounds".format(
+            'tree, ' + keep + ':', len(stores), run(stores), dse.removed, dse.iterations))
+
+    for keep, live_at_exit in [('kept', bg.variable_registers()), ('output', ())]:
+        dce = DeadCodeElimination()
+        optimised = dce.run_pass(bytecode, live_at_exit)
+        print("    {:<17} {:>6} static {:>8} dynamic   {} instrs removed in {} rounds".format(
+            'bytecode, ' + keep + ':', len(optimised), run(optimised), dce.removed, dce.iterations))
+
+
+if __name__ == '__main__':
+    # The test programs print as they're imported
+    with contextlib.redirect_stdout(io.StringIO()):
+        from test import _ as test
+        from test2 import _ as test2
+        from test4 import _ as test4
+
+    # y = -10 is overwritten in both branches before they read y
+    check_removed_only(test4.program)
+    report('test', test.program)
+    report('test2', test2.program)
+    report('test4', test4.program)
+    report('test4, constants propagated', test4.program, propagate=True)
+    for num_stmts in [200, 2000]:
+        report('generated, {} stmts'.format(num_stmts), generated_program(num_stmts, seed=num_stmts).program)
@@ -0,0 +1,116 @@
+"""
+    Compares the string-compare dispatch loop the interpreter used to have against table dispatch
+    over a LoadedProgram, in instructions per second
+"""
+import time
+
+from CfgGenerator import CfgGenerator
+from bytecode_generator import BytecodeGenerator
+from interpreter import Interpreter
+from program_loader import load_program
+
+
+class StringDispatchInterpreter:
+    """
+        The previous Interpreter: if/elif chain on the mnemonic, labels looked up by name
+    """
+    def __init__(self):
+        self.program_counter = 0
+        self.labels = {}
+        self.registers = {}
+
+    def interpret(self, bytecode):
+        self.setup_labels(bytecode)
+        instrs_run = 0
+        while self.program_counter < len(bytecode):
+            self.interpret_instr(bytecode[self.program_counter])
+            instrs_run += 1
+        self.program_counter = 0
+        return instrs_run
+
+    def interpret_instr(self, instr):
+        cmd = instr[0]
+        if cmd == 'ADD':
+            dest, src1, src2 = instr[1:4]
+            self.registers[dest] = self.registers[src1] + self.registers[src2]
+        elif cmd == 'CHK_JMP':
+            reg_id, label = instr[1], instr[2]
+            if self.registers[reg_id]:
+                self.program_counter = self.labels[label]
+        elif cmd == 'NCHK_JMP':
+            reg_id, label = instr[1], instr[2]
+            if not self.registers[reg_id]:
+                self.program_counter = self.labels[label]
+        elif cmd == 'CMP_EQ':
+            dest, src1, src2 = instr[1:4]
+            if self.registers[src1] == self.registers[src2]:
+                self.registers[dest] = 1
+            else:
+                self.registers[dest] = 0
+        elif cmd == 'CMP_GT':
+            dest, src1, src2 = instr[1:4]
+            if self.registers[src1] > self.registers[src2]:
+                self.registers[dest] = 1
+            else:
+                self.registers[dest] = 0
+        elif cmd == 'DEBUG_PRINT':
+            print(instr[1])
+        elif cmd == 'LABEL':
+            pass
+        elif cmd == 'JMP':
+            self.program_counter = self.labels[instr[1]]
+        elif cmd == 'SET':
+            dest = instr[1]
+            val = instr[2]
+            if isinstance(val, str):
+                val = self.registers[val]
+            self.registers[dest] = val
+        self.program_counter += 1
+
+    def setup_labels(self, bytecode):
+        for instr_idx in range(len(bytecode)):
+            instr = bytecode[instr_idx]
+            if instr[0] == 'LABEL':
+                self.labels[instr[1]] = instr_idx
+
+
+def counting_loop(iterations):
+    _ = CfgGenerator()
+    _.program = [
+        _.set_var('i', 0),
+        _.set_var('total', 0),
+        _.while_loop(bool_cond=_.is_greater(iterations, 'i'),
+                     code_block=[
+                         _.set_var('total', _.calc('+', 'total', 'i')),
+                         _.if_else(bool_cond=_.is_equal('total', 'i'),
+                                   true_block=[_.set_var('total', _.calc('+', 'total', 1))],
+                                   false_block=[]),
+                         _.set_var('i', _.calc('+', 'i', 1)),
+                     ]),
+    ]
+    return _.program
+
+
+def best_of(repeats, func):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, result)
+    return best
+
+
+if __name__ == '__main__':
+    bytecode = BytecodeGenerator().generate_bytecode(counting_loop(20000))
+    program = load_program(bytecode)
+
+    old_time, old_count = best_of(5, lambda: StringDispatchInterpreter().interpret(bytecode))
+    new_time, new_count = best_of(5, lambda: Interpreter().run(program))
+
+    # LABELs are executed by the old loop but removed by the loader, so compare wall time for
+    # the same program as well as the raw rates
+    print("string dispatch: {:>9} instrs in {:.3f}s, {:>12,.0f} instrs/sec".format(old_count, old_time, old_count / old_time))
+    print("table dispatch:  {:>9} instrs in {:.3f}s, {:>12,.0f} instrs/sec".format(new_count, new_time, new_count / new_time))
+    print("speedup: {:.2f}x".format(old_time / new_time))
@@ -0,0 +1,141 @@
+"""
+    Throughput of the source frontend, in lines per second, on generated programs of a few megabytes,
+    against importing a Python module that builds the same program with CfgGenerator calls. Also the
+    peak memory of tokenizing a file, which doesn't grow with its size. First checks that the operands
+    of a condition are evaluated in source order
+"""
+import gc
+import importlib.util
+import os
+import tempfile
+import time
+import tracemalloc
+
+from CFG import *
+from frontend import parse, parse_file, to_source, tokenize
+from generated_programs import generated_program
+from interpreter import Interpreter
+from optimizations.pass_manager import PassManager, structure
+from output_sinks import MemorySink
+from program_loader import load_program
+
+
+# Each call prints its name, so the output shows the order the operands ran in
+SIDE_EFFECTS = '''
+func f() { print "f"; return 1; }
+func g() { print "g"; return 2; }
+if (f() < g()) { print "less"; }
+if (g() > f()) { print "greater"; }
+if (f() + 2 < g()) { print "wrong"; } else { print "not less"; }
+'''
+
+
+def python_call(node):
+    """
+        The CfgGenerator call building node, as in tests/test.py
+    """
+    if isinstance(node, Variable):
+        return repr(node.var_name)
+    if isinstance(node, Constant):
+        return repr(node.val)
+    if isinstance(node, ArithmeticExpr):
+        return '_.calc({!r}, {}, {})'.format(node.op, python_call(node.op1), python_call(node.op2))
+    if isinstance(node, AssignVarStmt):
+        return '_.set_var({!r}, {})'.format(node.var.var_name, python_call(node.evaluation))
+    if isinstance(node, CompareGreater):
+        return '_.is_greater({}, {})'.format(python_call(node.lhs), python_call(node.rhs))
+    if isinstance(node, CompareLess):
+        return '_.is_less({}, {})'.format(python_call(node.lhs), python_call(node.rhs))
+    if isinstance(node, CompareEquals):
+        return '_.is_equal({}, {})'.format(python_call(node.lhs), python_call(node.rhs))
+    if isinstance(node, IfElseBlock):
+        return '_.if_else({}, [{}], [{}])'.format(python_call(node.bool_cond),
+                                                  ', '.join(python_call(stmt) for stmt in node.true_block),
+                                                  ', '.join(python_call(stmt) for stmt in node.false_block))
+    if isinstance(node, WhileBlock):
+        return '_.while_loop({}, [{}])'.format(python_call(node.bool_cond),
+                                               ', '.join(python_call(stmt) for stmt in node.code_block))
+    raise Exception("No CfgGenerator call for {}".format(type(node).__name__))
+
+
+def python_module(program):
+    lines = ['from CfgGenerator import CfgGenerator', '_ = CfgGenerator()', 'program = []']
+    lines.extend('program.append({})'.format(python_call(node)) for node in program)
+    return '\n'.join(lines) + '\n'
+
+
+def import_module(path):
+    spec = importlib.util.spec_from_file_location('generated_module', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(func):
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def token_peak(path):
+    """
+    :return: peak bytes traced while tokenizing the file at path, and its number of tokens
+    """
+    gc.collect()
+    tracemalloc.start()
+    with open(path) as source:
+        num_tokens = sum(1 for _ in tokenize(source))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, num_tokens
+
+
+def check_evaluation_order():
+    for level in [0, 1, 2]:
+        output = MemorySink()
+        bytecode = PassManager(level).compile(parse(SIDE_EFFECTS).program)
+        Interpreter(output, summary=False).interpret(load_program(bytecode))
+        assert output.lines == ['f', 'g', 'less', 'g', 'f', 'greater', 'f', 'g', 'not less'], output.lines
+    print('operands of conditions run in source order at -O0, -O1 and -O2')
+
+
+def report(directory, program, copies):
+    """
+        Parses copies of program's source one after the other, which is again a valid program
+    """
+    source = to_source(program) * copies
+    path = os.path.join(directory, 'program.txt')
+    with open(path, 'w') as file:
+        file.write(source)
+    lines = source.count('\n')
+    parsed, elapsed = timed(lambda: parse_file(path))
+    assert structure(parsed.program[:len(program)]) == structure(program)
+    peak, num_tokens = token_peak(path)
+    print("    {:6.1f} MB {:>9} lines {:>9} tokens: {:8.0f} ms, {:>9.0f} lines/s, tokenizing peak {:>7} bytes".format(
+        len(source) / 1e6, lines, num_tokens, elapsed * 1000, lines / elapsed, peak))
+    return lines, elapsed
+
+
+def report_import(directory, program, copies):
+    module_source = python_module(program * copies)
+    path = os.path.join(directory, 'generated_module.py')
+    with open(path, 'w') as file:
+        file.write(module_source)
+    module, elapsed = timed(lambda: import_module(path))
+    assert structure(module.program[:len(program)]) == structure(program)
+    return elapsed
+
+
+if __name__ == '__main__':
+    check_evaluation_order()
+    program = generated_program(10000, seed=3, loop_bound=6).program
+    with tempfile.TemporaryDirectory() as directory:
+        print('frontend')
+        parse_times = {copies: report(directory, program, copies) for copies in [1, 4, 16]}
+        print('importing CfgGenerator calls for the same program')
+        for copies in [1, 4]:
+            lines, parse_time = parse_times[copies]
+            import_time = report_import(directory, program, copies)
+            print("    {:>9} lines: {:8.0f} ms, {:>9.0f} lines/s, {:.1f}x the time of the frontend".format(
+                lines, import_time * 1000, lines / import_time, import_time / parse_time))
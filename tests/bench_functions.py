@@ -0,0 +1,88 @@
+"""
+    Cost of function calls: CALL/RET against inlining for a small function called in a loop, and
+    pooled register windows against allocating a fresh one per call for a recursive function
+"""
+from CfgGenerator import CfgGenerator
+from bench_dispatch import best_of
+from bytecode_generator import BytecodeGenerator
+from data_types import DataTypes
+from interpreter import Interpreter
+from output_sinks import DiscardSink
+from program_loader import load_program
+
+
+class FreshFrameInterpreter(Interpreter):
+    """
+        Allocates the registers of every call, the way a naive implementation would
+    """
+    def op_call(self, instr, pc):
+        frame = [0] * instr[3]
+        caller = self.registers
+        for param, arg in enumerate(instr[4]):
+            frame[param] = caller[arg]
+        self.call_stack.append((caller, instr[1], pc + 1, []))
+        self.registers = frame
+        return instr[2]
+
+
+def call_loop(iterations):
+    _ = CfgGenerator()
+    _.program = [
+        _.define_func('mix', [_.param('a'), _.param('b')], [
+            _.set_var('s', _.calc('+', 'a', 'b')),
+            _.return_value(_.calc('-', 's', 1)),
+        ], DataTypes.SCALAR),
+        _.set_var('i', 0),
+        _.set_var('total', 0),
+        _.while_loop(_.is_greater(iterations, 'i'), [
+            _.set_var('total', _.call('mix', ['total', 'i'])),
+            _.set_var('i', _.calc('+', 'i', 1)),
+        ]),
+    ]
+    return _.program
+
+
+def fib(n):
+    _ = CfgGenerator()
+    _.program = [
+        _.define_func('fib', [_.param('n')], [
+            _.if_else(_.is_greater(2, 'n'), [_.return_value('n')], []),
+            _.return_value(_.calc('+', _.call('fib', [_.calc('-', 'n', 1)], DataTypes.SCALAR),
+                                   _.call('fib', [_.calc('-', 'n', 2)], DataTypes.SCALAR))),
+        ], DataTypes.SCALAR),
+        _.set_var('result', _.call('fib', [n])),
+    ]
+    return _.program
+
+
+def compile_program(program, inline_limit):
+    bg = BytecodeGenerator(inline_limit)
+    bytecode = bg.allocate_registers(bg.generate_bytecode(program))
+    return load_program(bytecode), bg
+
+
+def report_inlining(name, program):
+    called, called_bg = compile_program(program, 0)
+    inlined, inlined_bg = compile_program(program, BytecodeGenerator().inline_limit)
+    called_time, called_instrs = best_of(3, lambda: Interpreter(DiscardSink(), summary=False).interpret(called))
+    inlined_time, inlined_instrs = best_of(3, lambda: Interpreter(DiscardSink(), summary=False).interpret(inlined))
+
+    print(name)
+    print("    call sites: {} CALL -> {} inlined".format(called_bg.emitted_calls, inlined_bg.inlined_calls))
+    print("    dynamic:    {} -> {} instrs".format(called_instrs, inlined_instrs))
+    print("    time:       {:.3f}s -> {:.3f}s ({:.2f}x)".format(called_time, inlined_time, called_time / inlined_time))
+
+
+def report_frames(name, program):
+    loaded, _ = compile_program(program, BytecodeGenerator().inline_limit)
+    fresh_time, instrs = best_of(3, lambda: FreshFrameInterpreter(DiscardSink(), summary=False).interpret(loaded))
+    pooled_time, _ = best_of(3, lambda: Interpreter(DiscardSink(), summary=False).interpret(loaded))
+
+    print(name)
+    print("    {} instrs, fresh frames {:.3f}s -> pooled frames {:.3f}s ({:.2f}x)".format(
+        instrs, fresh_time, pooled_time, fresh_time / pooled_time))
+
+
+if __name__ == '__main__':
+    report_inlining('small function called 50000 times', call_loop(50000))
+    report_frames('recursive fib(20)', fib(20))
@@ -0,0 +1,103 @@
+"""
+    Recompiling a program of many functions after editing one of them: a full compile against the
+    IncrementalCompiler, which lowers (and optimises) only the edited function and the statements
+    that call it. First checks that a program changed in place, as passes do, is compiled again
+"""
+import copy
+import gc
+import time
+
+from CfgGenerator import CfgGenerator
+from bytecode_generator import BytecodeGenerator
+from CFG import Constant, FunctionDef
+from data_types import DataTypes
+from frontend import parse
+from generated_programs import ProgramGenerator
+from incremental_compiler import FUNCTION_PASSES, IncrementalCompiler
+
+
+def many_functions(num_funcs, num_stmts):
+    _ = CfgGenerator()
+    program = []
+    for func_id in range(num_funcs):
+        params = [_.param('a')]
+        statements = ProgramGenerator(seed=func_id, num_vars=5, loop_bound=4)
+        statements.cfg = _
+        body = statements.generate(num_stmts).program
+        body.append(_.return_value(_.calc('+', 'v0', 'a')))
+        program.append(_.define_func('f' + str(func_id), params, body, DataTypes.SCALAR))
+    program.append(_.set_var('total', 0))
+    for func_id in range(num_funcs):
+        program.append(_.set_var('total', _.calc('+', 'total', _.call('f' + str(func_id), [func_id], DataTypes.SCALAR))))
+    return program
+
+
+def edit(program, func_id):
+    """
+    Copy of program with the first constant of function func_id changed. Like an editor would, it shares
+    the nodes that don't change with program
+    """
+    program = list(program)
+    func = program[func_id] = copy.deepcopy(program[func_id])
+    func.code_block[0].evaluation = Constant(func.code_block[0].evaluation.val + 1)
+    return program
+
+
+def check_edit_in_place():
+    program = parse('x = 1; if (x > 0) { y = x + 2; }').program
+    compiler = IncrementalCompiler()
+    compiler.compile(program)
+    program[1].true_block[0].evaluation.op2 = Constant(40)
+    # Renumbered, as the new code doesn't reuse the registers and labels of the old
+    assert ('SET', 40) in [(instr[0], instr[-1]) for instr in compiler.compile(program)]
+    print('a statement changed in place is lowered again')
+
+
+def full_compile(program, optimize_functions):
+    if optimize_functions:
+        for node in program:
+            if isinstance(node, FunctionDef):
+                for opt_pass in FUNCTION_PASSES:
+                    opt_pass().run_pass([node])
+    return BytecodeGenerator(0).generate_bytecode(program)
+
+
+def timed(func):
+    # Without the garbage collector, like timeit: its passes over the cached fragments would swamp the rest
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def report(name, program, optimize_functions=False):
+    edited = edit(program, len(program) // 4)
+    to_compile = copy.deepcopy(edited)
+    full = timed(lambda: full_compile(to_compile, optimize_functions))
+    compiler = IncrementalCompiler(0, optimize_functions=optimize_functions)
+    first = timed(lambda: compiler.compile(program))
+    unchanged = timed(lambda: compiler.compile(program))
+    generator = compiler.generator
+    counts = generator.lowered_fragments, generator.lowered_sections, compiler.optimized_functions
+    recompile = timed(lambda: compiler.compile(edited))
+
+    print(name)
+    print("    full compile:            {:8.1f} ms".format(full * 1000))
+    print("    incremental, first:      {:8.1f} ms".format(first * 1000))
+    print("    incremental, unchanged:  {:8.1f} ms".format(unchanged * 1000))
+    print("    incremental, one edited: {:8.1f} ms ({:.1f}x faster than a full compile)".format(
+        recompile * 1000, full / recompile))
+    print("    done again: {} statements and {} functions lowered, {} functions optimised".format(
+        generator.lowered_fragments - counts[0], generator.lowered_sections - counts[1],
+        compiler.optimized_functions - counts[2]))
+
+
+if __name__ == '__main__':
+    check_edit_in_place()
+    program = many_functions(200, 40)
+    report('200 functions of 40 generated stmts', program)
+    report('200 functions of 40 generated stmts, functions optimised', program, optimize_functions=True)
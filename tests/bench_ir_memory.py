@@ -0,0 +1,51 @@
+"""
+    Memory taken by the statement tree of generated programs, per node, as traced by tracemalloc, and
+    the time to build and to deepcopy it
+"""
+import copy
+import gc
+import time
+import tracemalloc
+
+from bytecode_generator import subtree_nodes
+from generated_programs import generated_program
+
+
+def measure(build):
+    """
+    :return: what build returns, the bytes allocated for it that are still held and the time it took
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, traced, elapsed
+
+
+def report(num_stmts):
+    program, traced, _ = measure(lambda: generated_program(num_stmts, seed=1, loop_bound=6).program)
+    # The timings are taken without tracemalloc, which slows allocation down
+    start = time.perf_counter()
+    generated_program(num_stmts, seed=1, loop_bound=6)
+    built = time.perf_counter() - start
+    copied, copy_traced, _ = measure(lambda: copy.deepcopy(program))
+    start = time.perf_counter()
+    copy.deepcopy(program)
+    copy_time = time.perf_counter() - start
+
+    nodes = list(subtree_nodes(program))
+    distinct = len(set(id(node) for node in nodes))
+    print("{} stmts: {} nodes, {} distinct objects".format(num_stmts, len(nodes), distinct))
+    print("    built:  {:>10} bytes, {:6.1f} bytes per node, {:7.1f} ms".format(
+        traced, traced / len(nodes), built * 1000))
+    print("    copied: {:>10} bytes, {:6.1f} bytes per node, {:7.1f} ms".format(
+        copy_traced, copy_traced / len(nodes), copy_time * 1000))
+
+
+if __name__ == '__main__':
+    for num_stmts in [2000, 20000]:
+        report(num_stmts)
@@ -0,0 +1,57 @@
+"""
+    Instructions hoisted out of loops by loop-invariant code motion, and what that does to the number
+    of instructions run and to run time
+"""
+import contextlib
+import io
+
+from CfgGenerator import CfgGenerator
+from bench_dispatch import counting_loop
+from bytecode_generator import BytecodeGenerator
+from generated_programs import compare_runs, generated_program
+from optimizations.bytecode.loop_invariant_code_motion import LoopInvariantCodeMotion
+from program_loader import load_program
+
+
+def invariant_loop(iterations):
+    """
+    A loop whose body recomputes the same products of variables it never changes
+    """
+    _ = CfgGenerator()
+    _.program = [
+        _.set_var('a', 3),
+        _.set_var('b', 4),
+        _.set_var('i', 0),
+        _.set_var('total', 0),
+        _.while_loop(_.is_greater(iterations, 'i'), [
+            _.set_var('total', _.calc('+', 'total', _.calc('*', _.calc('+', 'a', 7), 'b'))),
+            _.set_var('i', _.calc('+', 'i', 1)),
+        ]),
+    ]
+    return _.program
+
+
+def report(name, program, max_instructions=False):
+    bg = BytecodeGenerator()
+    bytecode = bg.generate_bytecode(program)
+    licm = LoopInvariantCodeMotion()
+    hoisted = licm.run_pass(bytecode, bg.variable_registers())
+    (plain_time, plain_instrs, plain_lines), (hoisted_time, hoisted_instrs, hoisted_lines) = compare_runs(
+        load_program(bytecode), load_program(hoisted), bg.symbol_table, max_instructions=max_instructions)
+
+    print(name)
+    print("    hoisted: {} instrs out of {} loops".format(licm.hoisted, licm.loops))
+    print("    dynamic: {} -> {} instrs, {} -> {} lines printed".format(
+        plain_instrs, hoisted_instrs, plain_lines, hoisted_lines))
+    print("    time:    {:.3f}s -> {:.3f}s ({:.2f}x)".format(plain_time, hoisted_time, plain_time / hoisted_time))
+
+
+if __name__ == '__main__':
+    with contextlib.redirect_stdout(io.StringIO()):
+        from test3 import _ as test3
+
+    # test3 never ends: with the same budget, the hoisted loop gets through more iterations
+    report('test3, 100000 instrs', test3.program, max_instructions=100000)
+    report('counting loop', counting_loop(50000))
+    report('invariant arithmetic', invariant_loop(50000))
+    report('generated, 2000 stmts', generated_program(2000, seed=4).program)
@@ -0,0 +1,61 @@
+"""
+    Time and peak memory of lowering statement trees to bytecode, against the nesting depth of the
+    program and against its size
+"""
+import gc
+import time
+import tracemalloc
+
+from CfgGenerator import CfgGenerator
+from bytecode_generator import BytecodeGenerator
+from generated_programs import generated_program
+
+
+def nested(depth, stmts_per_level=4):
+    """
+    depth IfElseBlocks and WhileBlocks inside each other, alternately, with a few assignments at each level
+    """
+    _ = CfgGenerator()
+    _.set_var('x', 0)
+
+    def level(remaining):
+        stmts = [_.set_var('x', _.calc('+', 'x', i)) for i in range(stmts_per_level)]
+        if remaining == 0:
+            return stmts
+        if remaining % 2:
+            return stmts + [_.if_else(_.is_greater('x', remaining), level(remaining - 1), stmts[:1])]
+        return stmts + [_.while_loop(_.is_greater(0, 'x'), level(remaining - 1))]
+
+    return [_.set_var('x', 0)] + level(depth)
+
+
+def measure(program):
+    """
+    :return: number of instructions, seconds and peak bytes traced while lowering program
+    """
+    gc.collect()
+    start = time.perf_counter()
+    bytecode = BytecodeGenerator().generate_bytecode(program)
+    elapsed = time.perf_counter() - start
+    del bytecode
+    gc.collect()
+    tracemalloc.start()
+    bytecode = BytecodeGenerator().generate_bytecode(program)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return len(bytecode), elapsed, peak
+
+
+def report(name, program):
+    instrs, elapsed, peak = measure(program)
+    print("    {:<18} {:>8} instrs {:9.1f} ms {:>12} peak bytes {:8.1f} bytes per instr".format(
+        name, instrs, elapsed * 1000, peak, peak / instrs))
+
+
+if __name__ == '__main__':
+    print('nesting depth')
+    for depth in [25, 50, 100, 200]:
+        report('depth ' + str(depth), nested(depth))
+    print('program size')
+    for num_stmts in [1000, 4000, 16000]:
+        report(str(num_stmts) + ' stmts', generated_program(num_stmts, seed=5, loop_bound=6).program)
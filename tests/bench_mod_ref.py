@@ -0,0 +1,86 @@
+"""
+    Mod/ref summaries of every IfElseBlock and WhileBlock of a program: rescanning the blocks below each
+    one, as a transitive get_altered_vars would without a cache, against the summaries cached on the
+    nodes, made once and then looked up. Nested programs are where rescanning costs the most. First
+    checks that PropagateConstants keeps the constants of a branch to that branch
+"""
+import copy
+import time
+
+from bench_lowering import nested
+from bytecode_generator import BytecodeGenerator, subtree_nodes
+from CFG import *
+from frontend import parse
+from generated_programs import compare_runs, generated_program
+from optimizations.analysis.control_flow import expression_vars, stmt_defs, stmt_uses
+from optimizations.analysis.mod_ref import summary
+from optimizations.cfg.propagate_constants import PropagateConstants
+from program_loader import load_program
+
+
+# a is assigned twice in the true branch, and neither constant may reach the false branch or the end
+BRANCH_CONSTANTS = '''
+a = 0;
+c = 0;
+if (c > 1) { a = 5; a = 6; } else { c = a; }
+d = a;
+'''
+
+
+def rescan(code_block, assigned, read):
+    for node in code_block:
+        if isinstance(node, IfElseBlock):
+            read |= expression_vars(node.bool_cond)
+            rescan(node.true_block, assigned, read)
+            rescan(node.false_block, assigned, read)
+        elif isinstance(node, WhileBlock):
+            read |= expression_vars(node.bool_cond)
+            rescan(node.code_block, assigned, read)
+        elif not isinstance(node, FunctionDef):
+            assigned |= stmt_defs(node)
+            read |= stmt_uses(node)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def compiled(program):
+    generator = BytecodeGenerator()
+    return load_program(generator.generate_bytecode(program)), generator.symbol_table
+
+
+def check_branch_constants():
+    program = parse(BRANCH_CONSTANTS).program
+    folded = copy.deepcopy(program)
+    PropagateConstants().run_pass(folded)
+    plain, plain_variables = compiled(program)
+    optimised, optimised_variables = compiled(folded)
+    compare_runs(plain, optimised, plain_variables, optimised_variables)
+    print('constants assigned in a branch stay in it')
+
+
+def report(name, build):
+    program = build()
+    blocks = [node for node in subtree_nodes(program) if isinstance(node, (IfElseBlock, WhileBlock))]
+    rescanned = timed(lambda: [rescan([node], set(), set()) for node in blocks])
+    # Outermost first, like a pass walking down the tree asks for them
+    first = timed(lambda: [summary(node) for node in blocks])
+    cached = timed(lambda: [summary(node) for node in blocks])
+    to_fold = build()
+    folded = timed(lambda: PropagateConstants().run_pass(to_fold))
+    print("    {:<18} {:>6} blocks: rescanning {:8.1f} ms, summaries {:6.1f} ms then {:5.2f} ms cached, "
+          "PropagateConstants {:7.1f} ms".format(name, len(blocks), rescanned * 1000, first * 1000,
+                                                  cached * 1000, folded * 1000))
+
+
+if __name__ == '__main__':
+    check_branch_constants()
+    print('nesting depth')
+    for depth in [25, 50, 100, 200]:
+        report('depth ' + str(depth), lambda: nested(depth))
+    print('program size')
+    for num_stmts in [1000, 4000, 16000]:
+        report(str(num_stmts) + ' stmts', lambda: generated_program(num_stmts, seed=5, loop_bound=6).program)
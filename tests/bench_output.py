@@ -0,0 +1,53 @@
+"""
+    tests/test3.py prints on every loop iteration. Time it with each output sink against a print per
+    line to a line-buffered stream, which is what a terminal gets
+"""
+import contextlib
+import os
+import tempfile
+
+from bench_dispatch import best_of
+from bytecode_generator import BytecodeGenerator
+from interpreter import Interpreter
+from output_sinks import DiscardSink, FileSink, LimitedSink, MemorySink, OutputSink, StdoutSink
+from program_loader import load_program
+
+MAX_INSTRUCTIONS = 300000
+
+
+class PrintSink(OutputSink):
+    # What DEBUG_PRINT used to do
+    def write(self, line):
+        print(line)
+
+
+def timed_run(program, make_sink):
+    def run():
+        sink = make_sink()
+        Interpreter(sink).interpret(program, MAX_INSTRUCTIONS)
+        sink.close()
+        return sink
+    with open(os.devnull, 'w', buffering=1) as line_buffered, contextlib.redirect_stdout(line_buffered):
+        return best_of(3, run)
+
+
+if __name__ == '__main__':
+    from test3 import _ as test3
+
+    program = load_program(BytecodeGenerator().generate_bytecode(test3.program))
+    path = os.path.join(tempfile.mkdtemp(), 'output.txt')
+    sinks = [
+        ('print per line', PrintSink),
+        ('buffered stdout', StdoutSink),
+        ('memory', MemorySink),
+        ('batched file', lambda: FileSink(path)),
+        ('discard', DiscardSink),
+        ('first 10 of each line', lambda: LimitedSink(DiscardSink())),
+        ('1 in 1000 of each line', lambda: LimitedSink(DiscardSink(), max_repeats=0, sample_every=1000)),
+    ]
+    baseline = None
+    for name, make_sink in sinks:
+        elapsed, _ = timed_run(program, make_sink)
+        baseline = baseline or elapsed
+        print("{:<24} {:.3f}s ({:.2f}x)".format(name, elapsed, baseline / elapsed))
+    os.remove(path)
@@ -0,0 +1,35 @@
+"""
+    Compile time and instructions run at each optimisation level, and the pass manager's report of
+    where the compile time of -O2 goes
+"""
+import copy
+
+from generated_programs import generated_program
+from interpreter import Interpreter
+from optimizations.pass_manager import PassManager
+from output_sinks import DiscardSink
+from program_loader import load_program
+
+
+def report(name, program, **kwargs):
+    print(name)
+    for level in ['-O0', '-O1', '-O2']:
+        manager = PassManager(level, **kwargs)
+        bytecode = manager.compile(copy.deepcopy(program))
+        instrs_run = Interpreter(DiscardSink(), summary=False).interpret(load_program(bytecode), 1000000)
+        compiled = manager.report()
+        print("    {}: compiled in {:7.1f} ms, {:>6} static {:>8} dynamic{}".format(
+            level, compiled['total_time'] * 1000, len(bytecode), instrs_run,
+            ', {} passes skipped'.format(len(compiled['skipped'])) if compiled['skipped'] else ''))
+    return manager
+
+
+if __name__ == '__main__':
+    program = generated_program(2000, seed=4, loop_bound=6).program
+    report('generated, 200 stmts', generated_program(200, seed=2, loop_bound=6).program)
+    manager = report('generated, 2000 stmts', program)
+    report('generated, 2000 stmts, at most 2 rounds', program, max_iterations=2)
+    # The budget is checked before each pass, so only lowering runs once it's spent
+    report('generated, 2000 stmts, 100 ms budget', program, time_budget=0.1)
+    print()
+    print(manager.format_report())
@@ -0,0 +1,35 @@
+"""
+    Static and dynamic instruction counts before and after the peephole optimiser, and what that does
+    to run time
+"""
+from bench_dispatch import counting_loop
+from bytecode_generator import BytecodeGenerator
+from generated_programs import compare_runs, generated_program
+from optimizations.bytecode.peephole import PeepholeOptimizer
+from program_loader import load_program
+
+
+def report(name, program, max_instructions=False):
+    bg = BytecodeGenerator()
+    bytecode = bg.generate_bytecode(program)
+    peephole = PeepholeOptimizer()
+    optimised = peephole.run_pass(bytecode)
+
+    (plain_time, plain_instrs, _), (optimised_time, optimised_instrs, _) = compare_runs(
+        load_program(bytecode), load_program(optimised), bg.symbol_table, max_instructions=max_instructions)
+
+    print(name)
+    print("    static:  {} -> {} instrs in {} iterations, {}".format(
+        peephole.static_before, peephole.static_after, peephole.iterations,
+        {rewrite: count for rewrite, count in peephole.rewrite_counts.items() if count}))
+    print("    dynamic: {} -> {} instrs".format(plain_instrs, optimised_instrs))
+    print("    time:    {:.3f}s -> {:.3f}s ({:.2f}x)".format(
+        plain_time, optimised_time, plain_time / optimised_time))
+
+
+if __name__ == '__main__':
+    from test4 import _ as test4
+
+    report('test4', test4.program)
+    report('counting loop', counting_loop(50000))
+    report('generated, 2000 stmts', generated_program(2000, seed=4).program)
@@ -0,0 +1,46 @@
+"""
+    Profiles the loop-heavy example programs, writes the JSON and collapsed-stack exports and shows what
+    profiling costs against a normal run (a normal run doesn't go near the profiler)
+"""
+import contextlib
+import os
+import tempfile
+
+from bench_aot import DiscardOutput
+from bench_dispatch import best_of
+from generated_programs import generated_program
+from interpreter import Interpreter
+from profiler import compile_for_profiling
+
+
+def profile(name, program, max_instructions=False):
+    profiler = compile_for_profiling(program)
+    loaded = profiler.program
+
+    def run(profiler=None):
+        with contextlib.redirect_stdout(DiscardOutput()):
+            return Interpreter().interpret(loaded, max_instructions, profiler=profiler)
+
+    plain_time, instrs_run = best_of(3, run)
+    profiled_time, _ = best_of(1, lambda: run(profiler))
+
+    out_dir = tempfile.mkdtemp()
+    profiler.to_json(os.path.join(out_dir, name + '.json'))
+    profiler.write_collapsed(os.path.join(out_dir, name + '.folded'))
+
+    print("{}: {} instrs, {:.3f}s plain, {:.3f}s profiled ({:.1f}x), exports in {}".format(
+        name, instrs_run, plain_time, profiled_time, profiled_time / plain_time, out_dir))
+    hottest = sorted(profiler.block_report(), key=lambda block: -block['count'])[:3]
+    for block in hottest:
+        print("    block {start}-{end} {labels}: ran {count} times".format(**block))
+    loops = sorted(profiler.loop_report().items(), key=lambda item: -item[1]['time'])[:3]
+    for loop_name, loop in loops:
+        print("    {}: {:.4f}s, {} instrs, condition checked {} times".format(
+            loop_name, loop['time'], loop['instrs'], loop['checks']))
+
+
+if __name__ == '__main__':
+    from test3 import _ as test3
+
+    profile('test3', test3.program, max_instructions=200000)
+    profile('generated', generated_program(500, seed=8, loop_bound=10).program)
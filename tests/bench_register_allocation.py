@@ -0,0 +1,46 @@
+"""
+    Peak register count and register file size before and after linear-scan register allocation
+    on large generated programs
+"""
+import sys
+import time
+
+from bytecode_generator import BytecodeGenerator
+from generated_programs import generated_program
+from interpreter import Interpreter
+from program_loader import load_program
+
+
+def dict_register_file_size(register_names):
+    """
+    Bytes taken by the old name-keyed register dict once every register has been written
+    """
+    registers = {name: 0 for name in register_names}
+    return sys.getsizeof(registers) + sum(sys.getsizeof(name) for name in register_names)
+
+
+def list_register_file_size(num_registers):
+    return sys.getsizeof([0] * num_registers)
+
+
+if __name__ == '__main__':
+    print("{:>7} {:>8} {:>10} {:>9} {:>12} {:>10} {:>9}".format(
+        'stmts', 'instrs', 'virt regs', 'phys regs', 'dict bytes', 'list bytes', 'alloc ms'))
+    for num_stmts in [100, 1000, 5000, 20000]:
+        _ = generated_program(num_stmts, seed=num_stmts)
+        bg = BytecodeGenerator()
+        bytecode = bg.generate_bytecode(_.program)
+        virtual = load_program(bytecode)
+
+        start = time.perf_counter()
+        allocated = bg.allocate_registers(bytecode)
+        alloc_time = time.perf_counter() - start
+        physical = load_program(allocated)
+
+        # The allocated program must still run to completion with its smaller register file
+        Interpreter().run(physical)
+
+        print("{:>7} {:>8} {:>10} {:>9} {:>12} {:>10} {:>9.1f}".format(
+            num_stmts, len(bytecode), virtual.num_registers, physical.num_registers,
+            dict_register_file_size(virtual.register_names), list_register_file_size(physical.num_registers),
+            alloc_time * 1000))
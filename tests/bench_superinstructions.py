@@ -0,0 +1,42 @@
+"""
+    How often each superinstruction pattern is fused, how often the fused instructions execute, and
+    what that does to run time
+"""
+from bench_dispatch import counting_loop
+from bytecode_generator import BytecodeGenerator
+from generated_programs import compare_runs, generated_program, run_program
+from interpreter import Interpreter
+from optimizations.bytecode.superinstructions import SuperinstructionFusion
+from program_loader import load_program
+
+FUSED_OPCODES = ['JMP_GT', 'JMP_NGT', 'JMP_EQ', 'JMP_NEQ', 'ADDI', 'MOV2']
+
+
+def report(name, program, max_instructions=False):
+    bg = BytecodeGenerator()
+    bytecode = bg.allocate_registers(bg.generate_bytecode(program))
+    fusion = SuperinstructionFusion()
+    fused = fusion.run_pass(bytecode, live_at_exit=bg.variable_registers())
+    fused_program = load_program(fused)
+
+    (plain_time, plain_instrs, _), (fused_time, fused_instrs, _) = compare_runs(
+        load_program(bytecode), fused_program, bg.symbol_table, max_instructions=max_instructions)
+    counter = Interpreter(summary=False)
+    counter.enable_opcode_counts()
+    run_program(fused_program, max_instructions, counter)
+    dynamic = counter.opcode_counts_by_name()
+
+    print(name)
+    print("    static:  {} -> {} instrs, fused {}".format(len(bytecode), len(fused), fusion.pattern_counts))
+    print("    dynamic: {} -> {} instrs, {}".format(
+        plain_instrs, fused_instrs, {op: dynamic[op] for op in FUSED_OPCODES if op in dynamic}))
+    print("    time:    {:.3f}s -> {:.3f}s ({:.2f}x)".format(plain_time, fused_time, plain_time / fused_time))
+
+
+if __name__ == '__main__':
+    from test3 import _ as test3
+
+    # With a fixed budget the fused program gets through more loop iterations in the same instruction count
+    report('test3 (300k budget)', test3.program, max_instructions=300000)
+    report('counting loop', counting_loop(50000))
+    report('generated, 2000 stmts', generated_program(2000, seed=4).program)
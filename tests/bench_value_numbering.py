@@ -0,0 +1,52 @@
+"""
+    Instructions removed by reusing the results of equal arithmetic expressions (value numbering),
+    statically and when run
+"""
+from CfgGenerator import CfgGenerator
+from bench_dispatch import best_of
+from bytecode_generator import BytecodeGenerator
+from generated_programs import generated_program
+from interpreter import Interpreter
+from output_sinks import DiscardSink
+from program_loader import load_program
+
+
+def repeated_expressions(iterations):
+    """
+    A loop that computes the same sums and products several times, operands swapped in places
+    """
+    _ = CfgGenerator()
+    _.program = [
+        _.set_var('x', 3),
+        _.set_var('y', 0),
+        _.set_var('i', 0),
+        _.while_loop(_.is_greater(iterations, 'i'), [
+            _.set_var('a', _.calc('*', _.calc('+', 'i', 'x'), _.calc('+', 'i', 'x'))),
+            _.set_var('b', _.calc('-', _.calc('*', _.calc('+', 'x', 'i'), _.calc('+', 'i', 'x')), 'i')),
+            _.set_var('y', _.calc('+', 'y', _.calc('+', 'a', 'b'))),
+            _.set_var('i', _.calc('+', 'i', 1)),
+        ]),
+    ]
+    return _.program
+
+
+def report(name, program):
+    results = []
+    for common_subexpressions in (False, True):
+        bg = BytecodeGenerator(common_subexpressions=common_subexpressions)
+        loaded = load_program(bg.allocate_registers(bg.generate_bytecode(program)))
+        elapsed, instrs_run = best_of(3, lambda: Interpreter(DiscardSink(), summary=False).interpret(loaded, 1000000))
+        results.append((len(loaded), instrs_run, elapsed, bg.reused_values))
+    (plain_static, plain_dynamic, plain_time, _), (static, dynamic, elapsed, reused) = results
+
+    print(name)
+    print("    reused:  {} expressions".format(reused))
+    print("    static:  {} -> {} instrs".format(plain_static, static))
+    print("    dynamic: {} -> {} instrs".format(plain_dynamic, dynamic))
+    print("    time:    {:.3f}s -> {:.3f}s ({:.2f}x)".format(plain_time, elapsed, plain_time / elapsed))
+
+
+if __name__ == '__main__':
+    report('repeated expressions', repeated_expressions(20000))
+    report('generated, 2000 stmts', generated_program(2000, seed=4).program)
+    report('generated, 2000 stmts, 4 variables', generated_program(2000, seed=4, num_vars=4).program)
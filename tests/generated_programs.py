@@ -0,0 +1,143 @@
+"""
+    Deterministic, machine-generated programs for the benchmarks. Every while loop counts a fresh
+    variable up to a small bound, so generated programs always terminate. With inputs=True the
+    variables are inputs (CfgGenerator.input_var) instead of being set at the start.
+    compare_runs checks that an optimised program still does what the program did before.
+"""
+import random
+
+from bench_dispatch import best_of
+from CfgGenerator import CfgGenerator
+from interpreter import Interpreter
+from output_sinks import MemorySink
+
+
+class ProgramGenerator:
+    def __init__(self, seed=0, num_vars=8, max_depth=3, loop_bound=3, debug_prints=False, inputs=False):
+        self.rand = random.Random(seed)
+        self.var_names = ['v' + str(i) for i in range(num_vars)]
+        self.max_depth = max_depth
+        self.loop_bound = loop_bound
+        self.debug_prints = debug_prints
+        self.inputs = inputs
+        self.counter_id = 0
+        self.cfg = CfgGenerator()
+
+    def generate(self, num_stmts):
+        _ = self.cfg
+        if self.inputs:
+            program = []
+            for var_name in self.var_names:
+                _.input_var(var_name)
+        else:
+            program = [_.set_var(var_name, self.rand.randint(-20, 20)) for var_name in self.var_names]
+        program += self.block(num_stmts, 0)
+        _.program = program
+        return _
+
+    def operand(self):
+        if self.rand.random() < 0.3:
+            return self.rand.randint(-9, 9)
+        return self.rand.choice(self.var_names)
+
+    def expression(self, depth=0):
+        _ = self.cfg
+        if depth >= 2 or self.rand.random() < 0.4:
+            return _.calc(self.rand.choice('+-'), self.operand(), self.operand())
+        op = self.rand.choice('+-*')
+        if op == '*':
+            # Keep values from growing without bound inside loops
+            return _.calc(op, self.expression(depth + 1), self.rand.randint(-1, 1))
+        return _.calc(op, self.expression(depth + 1), self.expression(depth + 1))
+
+    def condition(self):
+        _ = self.cfg
+        if self.rand.random() < 0.5:
+            return _.is_greater(self.operand(), self.operand())
+        return _.is_equal(self.operand(), self.operand())
+
+    def block(self, num_stmts, depth):
+        stmts = []
+        while len(stmts) < num_stmts:
+            stmts += self.statements(depth)
+        return stmts
+
+    def statements(self, depth):
+        _ = self.cfg
+        roll = self.rand.random()
+        if depth < self.max_depth and roll < 0.15:
+            return [_.if_else(bool_cond=self.condition(),
+                              true_block=self.block(self.rand.randint(1, 4), depth + 1),
+                              false_block=self.block(self.rand.randint(0, 3), depth + 1))]
+        if depth < self.max_depth and roll < 0.25:
+            return self.counted_loop(depth)
+        if self.debug_prints and roll < 0.3:
+            return [_.interpreter_debug('depth {}'.format(depth))]
+        return [_.set_var(self.rand.choice(self.var_names), self.expression())]
+
+    def counted_loop(self, depth):
+        _ = self.cfg
+        counter = 'c' + str(self.counter_id)
+        self.counter_id += 1
+        init = _.set_var(counter, 0)
+        body = self.block(self.rand.randint(1, 4), depth + 1)
+        body.append(_.set_var(counter, _.calc('+', counter, 1)))
+        return [init, _.while_loop(bool_cond=_.is_greater(self.loop_bound, counter), code_block=body)]
+
+
+def generated_program(num_stmts, seed=0, **kwargs):
+    return ProgramGenerator(seed=seed, **kwargs).generate(num_stmts)
+
+
+def run_program(program, max_instructions=False, interpreter=None):
+    """
+    Runs a LoadedProgram, keeping what it prints
+    :param interpreter: Interpreter to run it in, like one counting opcodes. A new one by default
+    :return: number of instructions run, the lines printed and the interpreter, which holds the registers
+    """
+    output = MemorySink()
+    if interpreter is None:
+        interpreter = Interpreter(summary=False)
+    interpreter.set_output(output)
+    instrs_run = interpreter.interpret(program, max_instructions)
+    return instrs_run, output.lines, interpreter
+
+
+def variable_values(program, interpreter, variables):
+    """
+    :param variables: variable name -> its registers, like BytecodeGenerator.symbol_table
+    :return: variable name -> its value at the end of the run, for the variables the program still has
+    """
+    registers = interpreter.named_registers(program)
+    values = {}
+    for var_name, regs in variables.items():
+        if regs[-1] in registers:
+            value = registers[regs[-1]]
+            values[var_name] = value if isinstance(value, int) else list(value)
+    return values
+
+
+def compare_runs(plain, optimised, plain_variables, optimised_variables=None, max_instructions=False):
+    """
+    Runs the LoadedPrograms of a program before and after optimising it, asserting that they print the
+    same lines and end with the same variables, then times them. Runs cut short by max_instructions
+    aren't compared, as the optimised program gets further on the same budget
+    :param plain_variables: variable name -> registers of plain, like BytecodeGenerator.symbol_table
+    :param optimised_variables: the same for optimised, if its registers were renamed
+    :return: (best time of 3 runs, instructions run, lines printed) for plain, then for optimised
+    """
+    if optimised_variables is None:
+        optimised_variables = plain_variables
+    plain_instrs, plain_lines, plain_interpreter = run_program(plain, max_instructions)
+    optimised_instrs, optimised_lines, optimised_interpreter = run_program(optimised, max_instructions)
+    if not max_instructions or max(plain_instrs, optimised_instrs) <= max_instructions:
+        assert optimised_lines == plain_lines, "printed {} instead of {}".format(optimised_lines, plain_lines)
+        plain_values = variable_values(plain, plain_interpreter, plain_variables)
+        optimised_values = variable_values(optimised, optimised_interpreter, optimised_variables)
+        for var_name in plain_values.keys() & optimised_values.keys():
+            assert optimised_values[var_name] == plain_values[var_name], "{} ended as {} instead of {}".format(
+                var_name, optimised_values[var_name], plain_values[var_name])
+
+    plain_time, _ = best_of(3, lambda: run_program(plain, max_instructions))
+    optimised_time, _ = best_of(3, lambda: run_program(optimised, max_instructions))
+    return (plain_time, plain_instrs, len(plain_lines)), (optimised_time, optimised_instrs, len(optimised_lines))